@@ -0,0 +1,103 @@
+"""
+Benchmark - bytes/sec of delta tiles vs full frames on synthetic pages
+
+Renders a mostly-static page (a spinner on a text page) and a scroll-heavy
+page offline with NumPy, feeds the frames through TileDeltaEncoder and
+compares the bytes sent with full-frame binary mode:
+
+    python bench_delta_encoding.py --frames 90 --fps 30
+"""
+import argparse
+import base64
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+from frame_delta import TileDeltaEncoder
+from screencast_frame import FRAME_HEADER, ScreencastFrame
+
+
+def text_page(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """White page with rows of dark 'words'"""
+    rng = np.random.default_rng(seed)
+    page = np.full((height, width, 3), 250, dtype=np.uint8)
+    for y in range(40, height - 20, 28):
+        x = 60
+        while x < width - 200:
+            word = int(rng.integers(20, 90))
+            page[y:y + 14, x:x + word] = rng.integers(20, 90)
+            x += word + 12
+    return page
+
+
+def static_frames(width: int, height: int, count: int):
+    """A text page whose only change is a small spinner"""
+    page = text_page(width, height)
+    for n in range(count):
+        frame = page.copy()
+        angle = n * 0.4
+        cx, cy = width - 80, 80
+        for i in range(8):
+            shade = 40 + ((i + n) % 8) * 25
+            x = int(cx + 18 * np.cos(angle + i * np.pi / 4))
+            y = int(cy + 18 * np.sin(angle + i * np.pi / 4))
+            frame[y - 4:y + 4, x - 4:x + 4] = shade
+        yield frame
+
+
+def scroll_frames(width: int, height: int, count: int, step: int = 24):
+    """A viewport scrolling steadily down a long text page"""
+    page = text_page(width, height + count * step, seed=1)
+    for n in range(count):
+        yield page[n * step:n * step + height]
+
+
+def to_frame(pixels: np.ndarray, number: int) -> ScreencastFrame:
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=70)
+    height, width = pixels.shape[:2]
+    return ScreencastFrame('bench', number, {
+        'data': base64.b64encode(buffer.getvalue()).decode('ascii'),
+        'metadata': {'timestamp': time.time(), 'deviceWidth': width, 'deviceHeight': height}
+    })
+
+
+def run(name: str, frames, fps: int):
+    encoder = TileDeltaEncoder()
+    full_bytes = 0
+    delta_bytes = 0
+    encode_seconds = 0.0
+    count = 0
+    for number, pixels in enumerate(frames):
+        frame = to_frame(pixels, number)
+        full_bytes += FRAME_HEADER.size + len(frame.jpeg)
+        started = time.perf_counter()
+        delta_bytes += len(encoder.encode(frame))
+        encode_seconds += time.perf_counter() - started
+        count += 1
+
+    full_rate = full_bytes / count * fps
+    delta_rate = delta_bytes / count * fps
+    print(f"{name:<10}{full_rate / 1e6:>12.2f}{delta_rate / 1e6:>12.2f}"
+          f"{delta_rate / full_rate * 100:>9.1f}%{encoder.keyframes:>6}{encoder.deltas:>7}"
+          f"{encode_seconds / count * 1000:>11.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frames', type=int, default=90)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    args = parser.parse_args()
+
+    print(f"{args.width}x{args.height}, {args.frames} frames at {args.fps} fps")
+    print(f"{'page':<10}{'full MB/s':>12}{'delta MB/s':>12}{'ratio':>10}{'keys':>6}{'deltas':>7}{'encode ms':>11}")
+    run('static', static_frames(args.width, args.height, args.frames), args.fps)
+    run('scroll', scroll_frames(args.width, args.height, args.frames), args.fps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark - time-to-first-frame for viewers joining a stream session
+
+Needs a running browser_stream_service.py. Creates a session on a static
+local page, then connects viewers one after another and measures the time
+from opening the WebSocket to receiving the first frame:
+
+    python bench_first_frame.py --viewers 20
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import aiohttp
+
+STATIC_PAGE = "data:text/html,<h1>Static page</h1><p>Nothing moves here.</p>"
+
+
+async def time_to_first_frame(session: aiohttp.ClientSession, url: str) -> float:
+    """Milliseconds from connect to the first binary frame"""
+    started = time.perf_counter()
+    async with session.ws_connect(url) as ws:
+        async for message in ws:
+            if message.type == aiohttp.WSMsgType.BINARY:
+                return (time.perf_counter() - started) * 1000
+    raise RuntimeError("Stream closed before the first frame")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--service', default='http://localhost:8002')
+    parser.add_argument('--viewers', type=int, default=10)
+    args = parser.parse_args()
+
+    session_id = f"bench-ttff-{int(time.time())}"
+    stream_url = f"{args.service.replace('http', 'ws', 1)}/ws/stream/{session_id}?format=binary"
+
+    async with aiohttp.ClientSession() as session:
+        async with session.post(
+            f"{args.service}/api/browser/create-session",
+            json={"sessionId": session_id, "url": STATIC_PAGE}
+        ) as resp:
+            resp.raise_for_status()
+
+        try:
+            timings = [await time_to_first_frame(session, stream_url) for _ in range(args.viewers)]
+        finally:
+            async with session.delete(f"{args.service}/api/browser/session/{session_id}"):
+                pass
+
+    print(f"Time to first frame over {len(timings)} viewers on a static page:")
+    print(f"  first viewer: {timings[0]:.1f} ms")
+    print(f"  p50: {statistics.median(timings):.1f} ms")
+    print(f"  max: {max(timings):.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
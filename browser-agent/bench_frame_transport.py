@@ -0,0 +1,97 @@
+"""
+Benchmark - bytes and CPU per frame for the JSON and binary stream transports
+
+Runs offline against synthetic screencast frames, so no browser is needed:
+
+    python bench_frame_transport.py --frames 500 --viewers 4
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import time
+
+from screencast_frame import ScreencastFrame
+
+
+def make_jpeg(width: int, height: int) -> bytes:
+    """Build a JPEG of roughly screencast size (Pillow if available)"""
+    try:
+        from PIL import Image
+        image = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+        image = image.resize((width, height)).reduce(8).resize((width, height))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=70)
+        return buffer.getvalue()
+    except ImportError:
+        # Typical 1920x1080 q70 page screenshot
+        return os.urandom(150_000)
+
+
+def make_params(jpeg: bytes, width: int, height: int) -> dict:
+    """Shape of a CDP Page.screencastFrame event"""
+    return {
+        'data': base64.b64encode(jpeg).decode('ascii'),
+        'sessionId': 1,
+        'metadata': {
+            'timestamp': time.time(),
+            'deviceWidth': width,
+            'deviceHeight': height
+        }
+    }
+
+
+def bench_legacy(params: dict, frames: int, viewers: int):
+    """Previous behaviour: one dict + JSON encode per frame per viewer"""
+    start = time.process_time()
+    size = 0
+    for n in range(frames):
+        for _ in range(viewers):
+            size = len(json.dumps({
+                'type': 'frame',
+                'data': params['data'],
+                'timestamp': '2025-01-01T00:00:00',
+                'sessionId': 'bench',
+                'frameNumber': n
+            }))
+    return size, (time.process_time() - start) / frames
+
+
+def bench_mode(params: dict, frames: int, viewers: int, binary: bool):
+    """Current behaviour: encode each transport once per frame"""
+    start = time.process_time()
+    size = 0
+    for n in range(frames):
+        frame = ScreencastFrame('bench', n, params)
+        for _ in range(viewers):
+            payload = frame.as_binary() if binary else frame.as_json()
+        size = len(payload)
+    return size, (time.process_time() - start) / frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--viewers', type=int, default=1)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    args = parser.parse_args()
+
+    jpeg = make_jpeg(args.width, args.height)
+    params = make_params(jpeg, args.width, args.height)
+
+    print(f"JPEG payload: {len(jpeg):,} bytes, {args.frames} frames, {args.viewers} viewer(s)")
+    print(f"{'mode':<14}{'bytes/frame':>14}{'overhead':>10}{'CPU us/frame':>15}")
+    results = [
+        ('json (legacy)', *bench_legacy(params, args.frames, args.viewers)),
+        ('json', *bench_mode(params, args.frames, args.viewers, binary=False)),
+        ('binary', *bench_mode(params, args.frames, args.viewers, binary=True)),
+    ]
+    for name, size, cpu in results:
+        overhead = (size - len(jpeg)) / len(jpeg) * 100
+        print(f"{name:<14}{size:>14,}{overhead:>9.1f}%{cpu * 1e6:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
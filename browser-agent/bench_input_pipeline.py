@@ -0,0 +1,82 @@
+"""
+Benchmark - per-event input dispatch versus the coalescing input pipeline
+
+Runs against Playwright's Chromium in-process. Replays a trackpad scroll
+burst (120 wheel events at 120 Hz) and a typed sentence, first with one
+Playwright call per event as the stream service used to, then through
+InputPipeline, and reports the calls made and the time until the last
+event was applied to the page:
+
+    python bench_input_pipeline.py --scroll-events 120
+"""
+import argparse
+import asyncio
+import time
+
+from playwright.async_api import async_playwright
+
+from input_pipeline import InputPipeline
+
+LONG_PAGE = ("data:text/html,<input id=q autofocus style='width:90%'>"
+             "<div style='height:20000px;background:linear-gradient(#fff,#000)'></div>")
+SENTENCE = "latest research on browser streaming latency"
+
+
+async def per_event(page, events, interval):
+    for command in events:
+        if command['type'] == 'scroll':
+            await page.mouse.wheel(0, command['deltaY'])
+        else:
+            await page.keyboard.type(command['text'])
+        await asyncio.sleep(interval)
+    return len(events)
+
+
+async def pipelined(page, cdp, events, interval):
+    pipeline = InputPipeline(page, cdp)
+    for command in events:
+        await pipeline.submit(command)
+        await asyncio.sleep(interval)
+    await pipeline.flush()
+    return pipeline.dispatches
+
+
+async def run(page, cdp, name, events, interval, use_pipeline):
+    await page.goto(LONG_PAGE)
+    started = time.perf_counter()
+    if use_pipeline:
+        calls = await pipelined(page, cdp, events, interval)
+    else:
+        calls = await per_event(page, events, interval)
+    # Both paths are done once the page reflects the final state
+    await page.evaluate("() => new Promise(requestAnimationFrame)")
+    elapsed = (time.perf_counter() - started) * 1000
+    mode = 'pipeline' if use_pipeline else 'per-event'
+    print(f"{name:<8}{mode:<11}{len(events):>8}{calls:>8}{elapsed:>12.1f}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--scroll-events', type=int, default=120)
+    parser.add_argument('--rate', type=float, default=120.0, help="input events per second")
+    args = parser.parse_args()
+
+    interval = 1 / args.rate
+    scroll = [{'type': 'scroll', 'deltaY': 25} for _ in range(args.scroll_events)]
+    typing = [{'type': 'type', 'text': ch} for ch in SENTENCE]
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        page = await browser.new_page(viewport={'width': 1920, 'height': 1080})
+        cdp = await page.context.new_cdp_session(page)
+
+        print(f"{'input':<8}{'mode':<11}{'events':>8}{'calls':>8}{'applied ms':>12}")
+        for name, events in (('scroll', scroll), ('typing', typing)):
+            await run(page, cdp, name, events, interval, use_pipeline=False)
+            await run(page, cdp, name, events, interval, use_pipeline=True)
+
+        await browser.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,130 @@
+"""
+Benchmark - encode and decode cost of the services' JSON messages per backend
+
+Runs offline over synthetic copies of the real message shapes (JSON frames,
+acks, interactions, research progress, the sessions listing, page content)
+through the stdlib encoder Starlette's send_json uses and through each fast
+backend that is installed:
+
+    python bench_json_codec.py --iterations 2000
+"""
+import argparse
+import base64
+import json
+import os
+import time
+
+import json_codec
+
+
+def message_shapes() -> dict:
+    """Messages as the services build them"""
+    jpeg = os.urandom(150_000)  # Typical 1920x1080 q70 screencast frame
+    viewer = {
+        'transport': 'json', 'layer': 'full', 'visibility': 'visible', 'framesSent': 1200,
+        'framesDropped': 3, 'queueDepth': 0, 'bytesSent': 180_000_000, 'latencyMs': 41.2,
+        'rttMs': 12.5, 'throughputKbps': 48000.0
+    }
+    return {
+        'frame': {
+            'type': 'frame',
+            'data': base64.b64encode(jpeg).decode('ascii'),
+            'timestamp': '2025-01-01T00:00:00',
+            'sessionId': 'bench',
+            'frameNumber': 1200
+        },
+        'ack': {'type': 'ack', 'seq': 1234, 'count': 3, 'queuedMs': 0.4, 'appliedMs': 12.7},
+        'interaction': {'type': 'interaction', 'seq': 1235, 'action': 'move', 'x': 640, 'y': 360},
+        'progress': {
+            'type': 'action',
+            'data': {
+                'type': 'navigate', 'url': 'https://example.com/search?q=benchmark',
+                'description': 'Opening search results for the research query',
+                'timestamp': '2025-01-01T00:00:00.000000', 'step': 7
+            }
+        },
+        'sessions': {
+            'browserPool': None,
+            'sessions': [
+                {
+                    'sessionId': f'session-{n}', 'createdAt': '2025-01-01T00:00:00', 'frameCount': 5000,
+                    'framesSuppressed': 800, 'activeStreams': 4, 'streaming': True,
+                    'screencast': {'format': 'jpeg', 'quality': 70, 'maxWidth': 1920,
+                                   'maxHeight': 1080, 'everyNthFrame': 2},
+                    'viewers': [dict(viewer) for _ in range(4)]
+                }
+                for n in range(20)
+            ]
+        },
+        'content': {
+            'type': 'content',
+            'content': {
+                'url': 'https://example.com/article',
+                'title': 'A long article',
+                'text': 'Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 1000,
+                'elements': [
+                    {
+                        'type': 'a', 'selector': f'a:nth-of-type({n + 1})', 'text': f'Link number {n}',
+                        'value': None, 'position': {'x': 120.5 + n, 'y': 48.0 + n * 3},
+                        'attributes': {'href': f'https://example.com/page/{n}',
+                                       'placeholder': None, 'type': None}
+                    }
+                    for n in range(400)
+                ]
+            }
+        }
+    }
+
+
+def backends() -> dict:
+    """name -> (dumps to bytes, loads)"""
+    result = {
+        # What starlette's WebSocket.send_json and JSONResponse do
+        'stdlib': (lambda obj: json.dumps(obj, separators=(',', ':'), ensure_ascii=False).encode('utf-8'),
+                   json.loads)
+    }
+    try:
+        import orjson
+        result['orjson'] = (orjson.dumps, orjson.loads)
+    except ImportError:
+        pass
+    try:
+        import msgspec
+        result['msgspec'] = (msgspec.json.encode, msgspec.json.decode)
+    except ImportError:
+        pass
+    result[f'json_codec ({json_codec.BACKEND})'] = (json_codec.dumps, json_codec.loads)
+    return result
+
+
+def measure(function, argument, iterations: int) -> float:
+    """CPU seconds per call"""
+    start = time.process_time()
+    for _ in range(iterations):
+        function(argument)
+    return (time.process_time() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help="calls per message and backend (divided by 100 for the large messages)")
+    args = parser.parse_args()
+
+    shapes = message_shapes()
+    candidates = backends()
+    print(f"{'message':<13}{'bytes':>10}  {'backend':<22}{'encode us':>11}{'decode us':>11}{'speedup':>9}")
+    for name, message in shapes.items():
+        encoded = candidates['stdlib'][0](message)
+        iterations = args.iterations if len(encoded) < 10_000 else max(args.iterations // 100, 10)
+        baseline = None
+        for backend, (dumps, loads) in candidates.items():
+            encode = measure(dumps, message, iterations)
+            decode = measure(loads, dumps(message), iterations)
+            baseline = baseline or encode + decode
+            print(f"{name:<13}{len(encoded):>10,}  {backend:<22}{encode * 1e6:>11.1f}{decode * 1e6:>11.1f}"
+                  f"{baseline / (encode + decode):>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark - progress delivery latency and idle cost, polling versus event channels
+
+Opens --subscribers progress readers for one research session, either
+polling the action list every --poll-interval seconds (the old handlers) or
+subscribed to its EventChannel, publishes --events actions at random
+moments and reports how long each took to reach the readers and how much
+CPU the idle readers burned in between. Runs offline:
+
+    python bench_research_events.py --subscribers 500 --events 20
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from research_events import EventBus
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def polling_reader(actions: list, latencies: list, count: int, interval: float):
+    seen = 0
+    while seen < count:
+        await asyncio.sleep(interval)
+        now = time.perf_counter()
+        for published_at in actions[seen:]:
+            latencies.append((now - published_at) * 1000)
+        seen = len(actions)
+
+
+async def event_reader(subscription, latencies: list):
+    async for _, event in subscription:
+        latencies.append((time.perf_counter() - event['at']) * 1000)
+
+
+async def run(mode: str, args) -> dict:
+    latencies = []
+    actions = []
+    bus = EventBus()
+    channel = bus.channel('bench')
+    if mode == 'polling':
+        readers = [polling_reader(actions, latencies, args.events, args.poll_interval)
+                   for _ in range(args.subscribers)]
+    else:
+        readers = [event_reader(channel.subscribe(), latencies) for _ in range(args.subscribers)]
+    tasks = [asyncio.create_task(reader) for reader in readers]
+    await asyncio.sleep(0.1)
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    for _ in range(args.events):
+        await asyncio.sleep(random.uniform(0, 2 * args.gap))
+        published_at = time.perf_counter()
+        actions.append(published_at)
+        channel.publish({'type': 'action', 'at': published_at})
+    bus.close('bench')
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    return {
+        'mode': mode,
+        'p50': percentile(latencies, 0.5),
+        'p99': percentile(latencies, 0.99),
+        'mean': statistics.mean(latencies),
+        'cpu': (time.process_time() - cpu_started) / elapsed * 100
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--subscribers', type=int, default=500)
+    parser.add_argument('--events', type=int, default=20)
+    parser.add_argument('--gap', type=float, default=0.25, help="mean seconds between actions")
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    args = parser.parse_args()
+
+    print(f"{args.subscribers} subscribers, {args.events} actions, one every {args.gap:g}s on average")
+    print(f"{'mode':<9}{'p50':>10}{'p99':>10}{'mean':>10}{'CPU':>7}")
+    for mode in ('polling', 'events'):
+        result = await run(mode, args)
+        print(f"{result['mode']:<9}{result['p50']:>8.2f}ms{result['p99']:>8.2f}ms{result['mean']:>8.2f}ms"
+              f"{result['cpu']:>6.0f}%")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
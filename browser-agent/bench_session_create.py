@@ -0,0 +1,71 @@
+"""
+Benchmark - stream session creation latency with and without the context pool
+
+Runs BrowserStreamService in-process (needs Playwright's Chromium). Sessions
+are created in concurrent bursts, navigated to a local page and stopped
+again, once with the pool disabled and once with it enabled:
+
+    python bench_session_create.py --rounds 20 --burst 4 --pool-size 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from browser_stream_service import BrowserStreamService
+
+LOCAL_PAGE = "data:text/html,<h1>Research result</h1>"
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def run(pool_size: int, rounds: int, burst: int, pause: float):
+    os.environ['STREAM_CONTEXT_POOL_SIZE'] = str(pool_size)
+    service = BrowserStreamService()
+    await service.initialize()
+    await asyncio.sleep(1)  # Let the pool warm up before the first burst
+
+    timings = []
+
+    async def create(session_id: str):
+        started = time.perf_counter()
+        page = await service.create_session(session_id)
+        await page.goto(LOCAL_PAGE)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    try:
+        for round_number in range(rounds):
+            ids = [f"bench-{round_number}-{n}" for n in range(burst)]
+            await asyncio.gather(*(create(session_id) for session_id in ids))
+            await asyncio.gather(*(service.stop_session(session_id) for session_id in ids))
+            await asyncio.sleep(pause)
+        pools = [browser['contextPool'] for browser in service.browser_pool.stats()['browsers']]
+    finally:
+        await service.shutdown()
+
+    hits = sum(pool['hits'] for pool in pools)
+    misses = sum(pool['misses'] for pool in pools)
+    print(f"{'pool ' + str(pool_size):<10}{statistics.median(timings):>10.1f}"
+          f"{percentile(timings, 0.99):>10.1f}{hits:>7}{misses:>7}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--burst', type=int, default=4)
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--pause', type=float, default=0.5, help="seconds between bursts")
+    args = parser.parse_args()
+
+    print(f"{args.rounds} bursts of {args.burst} sessions")
+    print(f"{'mode':<10}{'p50 ms':>10}{'p99 ms':>10}{'hits':>7}{'misses':>7}")
+    await run(0, args.rounds, args.burst, args.pause)
+    await run(args.pool_size, args.rounds, args.burst, args.pause)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,268 @@
+"""
+Benchmark - how many sessions and viewers one stream service process carries
+
+Starts a local HTTP server with a static and an animated test page, launches
+browser_stream_service in a subprocess (headless Chromium, no GPU or network
+needed) and, for every combination of --sessions and --viewers, opens the
+sessions with that many binary WebSocket viewers each. Prints one JSON
+document with delivered fps, end-to-end frame latency (capture timestamp to
+receipt), bytes/sec and the service's CPU and RSS, so runs can be diffed:
+
+    python bench_stream_load.py --sessions 1,4,8 --viewers 1,4 --duration 20 > run.json
+
+With --fanout-workers N the viewers connect to N stream_fanout_worker
+processes reading the capture service's frame rings instead. --hidden sets
+the fraction of each session's viewers that declare themselves hidden, like
+background tabs; compare e.g. --viewers 10 --hidden 0,1.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from tempfile import TemporaryDirectory
+
+import aiohttp
+
+from process_stats import process_tree_cpu, process_tree_rss
+from screencast_frame import FRAME_HEADER
+
+PAGES = {
+    'static.html': "<h1>Static page</h1><p>Nothing moves here.</p>",
+    'animated.html': """<canvas id=c width=1280 height=720></canvas><script>
+const ctx = document.getElementById('c').getContext('2d');
+function draw(t) {
+    ctx.fillStyle = `hsl(${(t / 20) % 360}, 60%, 50%)`;
+    ctx.fillRect(0, 0, 1280, 720);
+    ctx.fillStyle = '#fff';
+    ctx.font = '96px sans-serif';
+    ctx.fillText(t.toFixed(0), 80 + (t / 4) % 900, 360);
+    requestAnimationFrame(draw);
+}
+requestAnimationFrame(draw);
+</script>""",
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_pages(directory: str) -> ThreadingHTTPServer:
+    """Serve the test pages from a background thread"""
+    for name, body in PAGES.items():
+        with open(os.path.join(directory, name), 'w') as f:
+            f.write(f"<!doctype html><html><body style='margin:0'>{body}</body></html>")
+    handler = partial(QuietHandler, directory=directory)
+    server = ThreadingHTTPServer(('127.0.0.1', free_port()), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def sample_rss(pids):
+    """(service RSS, Chromium RSS); pids[0] is the capture service"""
+    own, chromium = process_tree_rss(pids[0])
+    return own + sum(sum(process_tree_rss(pid)) for pid in pids[1:]), chromium
+
+
+def sample_cpu(pids) -> float:
+    return sum(sum(process_tree_cpu(pid)) for pid in pids)
+
+
+async def wait_until_ready(session: aiohttp.ClientSession, url: str, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(url) as resp:
+                if resp.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError(f"{url} did not come up")
+
+
+class Viewer:
+    """One binary WebSocket viewer counting frames, bytes and latency"""
+
+    def __init__(self, hidden: bool = False):
+        self.hidden = hidden
+        self.frames = 0
+        self.bytes = 0
+        self.latencies_ms = []
+        self.measuring = False
+
+    async def run(self, session: aiohttp.ClientSession, url: str):
+        async with session.ws_connect(url, max_msg_size=0) as ws:
+            if self.hidden:
+                await ws.send_json({'type': 'visibility', 'state': 'hidden'})
+            async for message in ws:
+                if message.type != aiohttp.WSMsgType.BINARY or not self.measuring:
+                    continue
+                received = time.time()
+                _, _, _, timestamp, _, _ = FRAME_HEADER.unpack_from(message.data)
+                self.frames += 1
+                self.bytes += len(message.data)
+                self.latencies_ms.append((received - timestamp) * 1000)
+
+
+async def run_load(session, service, viewer_service, pages, pids, sessions, viewers,
+                   hidden, animated, warmup, duration):
+    run_id = f"load-{int(time.time() * 1000)}"
+    session_ids = [f"{run_id}-{n}" for n in range(sessions)]
+    for n, session_id in enumerate(session_ids):
+        page = 'animated.html' if n < round(sessions * animated) else 'static.html'
+        async with session.post(f"{service}/api/browser/create-session",
+                                json={"sessionId": session_id, "url": f"{pages}/{page}"}) as resp:
+            resp.raise_for_status()
+
+    ws_base = viewer_service.replace('http', 'ws', 1)
+    hidden_viewers = round(viewers * hidden)
+    clients = [Viewer(hidden=n % viewers < hidden_viewers) for n in range(sessions * viewers)]
+    tasks = [
+        asyncio.create_task(client.run(session, f"{ws_base}/ws/stream/{session_id}?format=binary"))
+        for client, session_id in zip(clients, [sid for sid in session_ids for _ in range(viewers)])
+    ]
+    rss_samples = [sample_rss(pids)]
+    try:
+        await asyncio.sleep(warmup)
+        cpu_before = sample_cpu(pids)
+        started = time.monotonic()
+        for client in clients:
+            client.measuring = True
+        while time.monotonic() - started < duration:
+            await asyncio.sleep(min(1.0, duration - (time.monotonic() - started)))
+            rss_samples.append(sample_rss(pids))
+        for client in clients:
+            client.measuring = False
+        elapsed = time.monotonic() - started
+        cpu_seconds = sample_cpu(pids) - cpu_before
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for session_id in session_ids:
+            async with session.delete(f"{service}/api/browser/session/{session_id}"):
+                pass
+
+    latencies = [latency for client in clients for latency in client.latencies_ms]
+    fps = [client.frames / elapsed for client in clients]
+    return {
+        'sessions': sessions,
+        'viewersPerSession': viewers,
+        'hiddenViewersPerSession': hidden_viewers,
+        'animatedSessions': round(sessions * animated),
+        'seconds': round(elapsed, 2),
+        'fpsPerViewer': {
+            'mean': round(statistics.mean(fps), 2),
+            'min': round(min(fps), 2)
+        },
+        'fpsDelivered': round(sum(fps), 1),
+        'latencyMs': {
+            'p50': round(percentile(latencies, 0.5), 1) if latencies else None,
+            'p99': round(percentile(latencies, 0.99), 1) if latencies else None
+        },
+        'bytesPerSecond': round(sum(client.bytes for client in clients) / elapsed),
+        # CPU of the service and Chromium, 100 = one core
+        'cpuPercent': round(cpu_seconds / elapsed * 100, 1),
+        'rssBytes': {
+            'service': max(own for own, _ in rss_samples),
+            'chromium': max(children for _, children in rss_samples)
+        }
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--sessions', default='1,2,4', help="comma separated session counts")
+    parser.add_argument('--viewers', default='1,4', help="comma separated viewers per session")
+    parser.add_argument('--hidden', default='0',
+                        help="comma separated fractions of each session's viewers that are hidden")
+    parser.add_argument('--animated', type=float, default=0.5,
+                        help="fraction of sessions on the animated page, the rest are static")
+    parser.add_argument('--warmup', type=float, default=3.0)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--fanout-workers', type=int, default=0,
+                        help="serve viewers from this many fan-out worker processes")
+    parser.add_argument('--output', help="write the JSON here instead of stdout")
+    args = parser.parse_args()
+
+    port = free_port()
+    service = f"http://127.0.0.1:{port}"
+    with TemporaryDirectory() as directory:
+        server = serve_pages(directory)
+        pages = f"http://127.0.0.1:{server.server_address[1]}"
+        here = os.path.dirname(os.path.abspath(__file__))
+        processes = [subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'browser_stream_service:app',
+             '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+            cwd=here
+        )]
+        viewer_service = service
+        if args.fanout_workers:
+            worker_port = free_port()
+            viewer_service = f"http://127.0.0.1:{worker_port}"
+            processes.append(subprocess.Popen(
+                [sys.executable, '-m', 'uvicorn', 'stream_fanout_worker:app', '--host', '127.0.0.1',
+                 '--port', str(worker_port), '--workers', str(args.fanout_workers), '--log-level', 'warning'],
+                cwd=here, env=dict(os.environ, STREAM_CAPTURE_URL=service)
+            ))
+        pids = [process.pid for process in processes]
+        runs = []
+        try:
+            async with aiohttp.ClientSession() as session:
+                await wait_until_ready(session, f"{service}/api/browser/sessions")
+                if args.fanout_workers:
+                    await wait_until_ready(session, f"{viewer_service}/api/worker/sessions")
+                for sessions in (int(n) for n in args.sessions.split(',')):
+                    for viewers in (int(n) for n in args.viewers.split(',')):
+                        for hidden in (float(n) for n in args.hidden.split(',')):
+                            print(f"{sessions} session(s) x {viewers} viewer(s), {hidden:.0%} hidden...",
+                                  file=sys.stderr)
+                            runs.append(await run_load(
+                                session, service, viewer_service, pages, pids, sessions, viewers,
+                                hidden, args.animated, args.warmup, args.duration
+                            ))
+        finally:
+            for process in processes:
+                process.terminate()
+                process.wait(timeout=30)
+            server.shutdown()
+
+    result = json.dumps({
+        'benchmark': 'stream_load',
+        'startedAt': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'host': {'platform': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count()},
+        'fanoutWorkers': args.fanout_workers,
+        'environment': {key: value for key, value in os.environ.items() if key.startswith('STREAM_')},
+        'runs': runs
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(result + '\n')
+    else:
+        print(result)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
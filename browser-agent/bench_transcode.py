@@ -0,0 +1,121 @@
+"""
+Benchmark - event loop lag while transcoding frames inline or on a TranscodePool
+
+Feeds synthetic 1080p screencast JPEGs at --fps into transcode_image, either
+directly on the event loop (inline) or through TranscodePool with threads
+and with processes, while a probe task measures how late the loop wakes up.
+Runs offline; needs Pillow:
+
+    python bench_transcode.py --codec webp --width 960 --height 540 --duration 5
+"""
+import argparse
+import asyncio
+import base64
+import io
+import statistics
+import time
+
+from frame_transcoder import CODECS, TranscodePool, transcode_image
+from screencast_frame import ScreencastFrame
+
+PROBE_INTERVAL = 0.005
+
+
+def make_jpeg(width: int, height: int) -> bytes:
+    """A page-like 1080p JPEG: flat colours, text-sized detail"""
+    from PIL import Image, ImageDraw
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    for row in range(0, height, 24):
+        draw.text((40, row), f"Line {row // 24}: the quick brown fox jumps over the lazy dog " * 3, fill='black')
+    draw.rectangle((width // 2, height // 4, width - 80, height // 2), fill='steelblue')
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=70)
+    return buffer.getvalue()
+
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+async def probe(lags: list, stop: asyncio.Event):
+    """Record how much later than asked the loop resumes a sleeping task"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append((time.perf_counter() - started - PROBE_INTERVAL) * 1000)
+
+
+async def run(mode: str, jpeg: bytes, args) -> dict:
+    params = {'data': base64.b64encode(jpeg).decode('ascii'),
+              'metadata': {'deviceWidth': 1920, 'deviceHeight': 1080}}
+    pool = None if mode == 'inline' else TranscodePool(args.workers, processes=mode == 'processes')
+    if pool:
+        # Start the workers before measuring
+        await asyncio.gather(*(pool.submit(transcode_image, jpeg, 16, 16, 50, args.codec, skippable=False)
+                               for _ in range(args.workers)))
+    lags, tasks, stop = [], [], asyncio.Event()
+    done = skipped = 0
+    prober = asyncio.create_task(probe(lags, stop))
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    frame_number = 0
+    while time.perf_counter() - started < args.duration:
+        frame = ScreencastFrame('bench', frame_number, params)
+        frame_number += 1
+        if pool is None:
+            transcode_image(frame.jpeg, args.width, args.height, args.quality, args.codec)
+            done += 1
+        else:
+            future = pool.submit(transcode_image, frame.jpeg, args.width, args.height, args.quality, args.codec)
+            if future is None:
+                skipped += 1
+            else:
+                tasks.append(future)
+        await asyncio.sleep(max(0.0, started + frame_number / args.fps - time.perf_counter()))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    if pool:
+        done = pool.completed - args.workers
+        pool.close()
+    return {
+        'mode': mode,
+        'fps': done / elapsed,
+        'skipped': skipped,
+        'lag_p50': percentile(lags, 0.5),
+        'lag_p99': percentile(lags, 0.99),
+        'lag_max': max(lags),
+        'lag_mean': statistics.mean(lags),
+        # Only this process: process pool workers are not included
+        'cpu': (time.process_time() - cpu_started) / elapsed * 100
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--codec', choices=sorted(CODECS), default='webp')
+    parser.add_argument('--width', type=int, default=960, help="maximum output width")
+    parser.add_argument('--height', type=int, default=540, help="maximum output height")
+    parser.add_argument('--quality', type=int, default=60)
+    parser.add_argument('--fps', type=float, default=30)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--modes', default='inline,threads,processes')
+    args = parser.parse_args()
+
+    jpeg = make_jpeg(1920, 1080)
+    _, _, sample = transcode_image(jpeg, args.width, args.height, args.quality, args.codec)
+    print(f"1920x1080 JPEG {len(jpeg):,} bytes -> {args.codec} {len(sample):,} bytes, "
+          f"{args.fps:g} fps offered, {args.workers} worker(s)")
+    print(f"{'mode':<11}{'fps done':>9}{'skipped':>9}{'lag p50':>9}{'lag p99':>9}{'lag max':>9}{'loop CPU':>10}")
+    for mode in args.modes.split(','):
+        result = await run(mode, jpeg, args)
+        print(f"{result['mode']:<11}{result['fps']:>9.1f}{result['skipped']:>9}{result['lag_p50']:>7.1f}ms"
+              f"{result['lag_p99']:>7.1f}ms{result['lag_max']:>7.1f}ms{result['cpu']:>9.0f}%")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
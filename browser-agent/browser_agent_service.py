@@ -9,16 +9,21 @@ import socket
 import subprocess
 import signal
 import sys
-from typing import Dict, Optional, Any
+from typing import Awaitable, Dict, Optional, Any, Tuple
 from datetime import datetime
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 
 from enhanced_browser_agent import EnhancedBrowserAgent
+from json_codec import JSONCodecResponse, dumps_text, receive_json, send_json
+from research_cache import ResearchCache
+from research_events import close_on_disconnect, research_events, resume_offset
+from session_registry import FINAL_STATUSES, SessionRegistry
+from session_store import SessionStore
 from integrated_browser_agent import integrated_agent_service
 from dotenv import load_dotenv
 
@@ -125,7 +130,7 @@ def cleanup_and_prepare_port(preferred_port: int = 8001) -> int:
     return preferred_port
 
 # Initialize FastAPI app
-app = FastAPI(title="Browser Agent Service", version="2.0")
+app = FastAPI(title="Browser Agent Service", version="2.0", default_response_class=JSONCodecResponse)
 
 # Request/Response models
 class StartResearchRequest(BaseModel):
@@ -133,6 +138,8 @@ class StartResearchRequest(BaseModel):
     sessionId: Optional[str] = None
     enableStreaming: bool = True
     llm: str = "claude-sonnet-4-20250514"
+    startUrl: str = "https://www.google.com"
+    useCache: bool = True
 
 class ResearchSession(BaseModel):
     sessionId: str
@@ -141,115 +148,228 @@ class ResearchSession(BaseModel):
     streamUrl: Optional[str] = None
     startedAt: datetime
     result: Optional[str] = None
+    cached: bool = False
 
 # Global state
-research_sessions: Dict[str, ResearchSession] = {}
+# Opt-in persistence: RESEARCH_SESSION_DB is a SQLite file, its TTL in seconds (0 keeps sessions)
+session_store = SessionStore(
+    os.getenv('RESEARCH_SESSION_DB'),
+    FINAL_STATUSES,
+    max_age=float(os.getenv('RESEARCH_SESSION_DB_TTL', '0'))
+) if os.getenv('RESEARCH_SESSION_DB') else None
+# Finished sessions are kept in memory for RESEARCH_SESSION_TTL seconds; results over
+# RESEARCH_RESULT_SPILL_KB go to the store, or else RESEARCH_RESULT_DIR (empty keeps them in memory)
+research_sessions = SessionRegistry(
+    os.getenv('RESEARCH_RESULT_DIR', 'research-results'),
+    max_sessions=int(os.getenv('RESEARCH_MAX_SESSIONS', '10000')),
+    ttl=float(os.getenv('RESEARCH_SESSION_TTL', '3600')),
+    spill_bytes=int(os.getenv('RESEARCH_RESULT_SPILL_KB', '4')) * 1024,
+    store=session_store,
+    model=ResearchSession
+)
 browser_agent = EnhancedBrowserAgent()
+# Identical research reuses results for RESEARCH_CACHE_TTL seconds (0 only coalesces concurrent runs)
+research_cache = ResearchCache(
+    max_entries=int(os.getenv('RESEARCH_CACHE_SIZE', '256')),
+    ttl=float(os.getenv('RESEARCH_CACHE_TTL', '300'))
+)
+
+def set_status(session: ResearchSession, status: str, result: Optional[str] = None):
+    """Update a session and tell its subscribers; final statuses close its channel"""
+    research_sessions.update(session, status, result)
+    research_events.publish(session.sessionId, {"type": "status", "status": status})
+    if status in FINAL_STATUSES:
+        research_events.publish(session.sessionId, {
+            "type": "complete",
+            "status": status,
+            "result": session.result
+        })
+        research_events.close(session.sessionId)
+
+async def wait_for_completion(session_id: str):
+    """Wait until a session reaches a final status, without polling"""
+    channel = research_events.get(session_id)
+    if channel is None:
+        return
+    subscription = channel.subscribe()
+    try:
+        async for _, event in subscription:
+            if event["type"] == "complete":
+                return
+    finally:
+        subscription.close()
+
+def start_research(session_id: str, query: str, llm: Optional[str], start_url: str,
+                   use_cache: bool = True) -> Tuple[Awaitable[Dict[str, Any]], bool]:
+    """Research a query in a session, or reuse an identical request's result, without waiting
+
+    Returns the result to await and whether it comes from the cache or
+    another request's run; ``use_cache=False`` forces a fresh run.
+    """
+    return research_cache.start(
+        research_cache.key(query, llm, start_url),
+        lambda: browser_agent.research_with_streaming(
+            query=query,
+            session_id=session_id,
+            llm=llm,
+            start_url=start_url
+        ),
+        refresh=not use_cache
+    )
+
+async def research(session_id: str, query: str, llm: Optional[str], start_url: str,
+                   use_cache: bool = True) -> Tuple[Dict[str, Any], bool]:
+    """Like start_research, waiting for the result"""
+    result, cached = start_research(session_id, query, llm, start_url, use_cache)
+    return await result, cached
+
+@app.on_event("startup")
+async def startup_event():
+    """Reload recent research sessions in the background"""
+    if session_store:
+        asyncio.create_task(research_sessions.warm())
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write out buffered session changes"""
+    if session_store:
+        await session_store.close()
 
 @app.post("/api/browser/start-integrated-research")
 async def start_integrated_research(request: StartResearchRequest):
     """Start integrated research with unified browser control and streaming"""
     session_id = request.sessionId or str(uuid.uuid4())
+    research_events.channel(session_id)
 
     try:
         # Use the enhanced browser agent for integrated research
-        result = await browser_agent.research_with_streaming(
-            query=request.query,
-            session_id=session_id,
-            llm=request.llm
-        )
+        result, cached = await research(session_id, request.query, request.llm, request.startUrl,
+                                        request.useCache)
 
-        # Update session tracking
+        # Update session tracking; a cached result has no browser of its own to watch
         session = ResearchSession(
             sessionId=session_id,
             query=request.query,
-            status="completed",
+            status="researching",
             startedAt=datetime.now(),
-            streamUrl=result.get('streamUrl'),
-            result=result.get('result')
+            streamUrl=None if cached else result.get('streamUrl'),
+            cached=cached
         )
-        research_sessions[session_id] = session
+        research_sessions.add(session)
+        set_status(session, "completed", result.get('result'))
 
-        return result
+        return {**result, "sessionId": session_id, "streamUrl": session.streamUrl, "cached": cached}
 
     except Exception as e:
         logger.error(f"Integrated research error: {e}")
+        research_events.publish(session_id, {"type": "complete", "status": "error", "result": str(e)})
+        research_events.close(session_id)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.websocket("/ws/research-progress/{session_id}")
 async def research_progress_stream(websocket: WebSocket, session_id: str):
-    """Stream research progress in real-time"""
+    """Stream research progress in real-time
+
+    Actions recorded before the client connected arrive as ``history``,
+    then ``action``, ``progress`` and ``status`` events as they are
+    published, and finally ``complete``. Every event carries its
+    ``offset``; a client that reconnects with ``?after=<offset>`` only gets
+    the events after it.
+    """
     await websocket.accept()
 
+    # Get the session's event channel
+    channel = research_events.get(session_id)
+    if not channel:
+        await send_json(websocket, {
+            "type": "error",
+            "message": "No active research session"
+        })
+        await websocket.close()
+        return
+
+    subscription = channel.subscribe(resume_offset(websocket.query_params.get("after")))
+    watcher = asyncio.create_task(close_on_disconnect(websocket, subscription))
     try:
-        # Get the agent
-        agent = integrated_agent_service.get_agent(session_id)
-        if not agent:
-            await websocket.send_json({
+        # Missed events first, then every event as soon as it is published
+        async for offset, event in subscription:
+            if offset < subscription.start and event["type"] == "action":
+                event = {"type": "history", "data": event["data"]}
+            await send_json(websocket, {**event, "offset": offset})
+
+        if subscription.overflowed:
+            await send_json(websocket, {
                 "type": "error",
-                "message": "No active research session"
+                "message": "Fell too far behind, reconnect to resume"
             })
-            await websocket.close()
-            return
-
-        # Stream existing history
-        for action in agent.action_history:
-            await websocket.send_json({
-                "type": "history",
-                "data": action
-            })
-
-        # Keep connection for future updates
-        last_count = len(agent.action_history)
-        while True:
-            await asyncio.sleep(0.5)
-
-            # Check for new actions
-            current_count = len(agent.action_history)
-            if current_count > last_count:
-                # Send new actions
-                for action in agent.action_history[last_count:]:
-                    await websocket.send_json({
-                        "type": "action",
-                        "data": action
-                    })
-                last_count = current_count
-
-            # Check if research is complete
-            session = research_sessions.get(session_id)
-            if session and session.status == "completed":
-                await websocket.send_json({
-                    "type": "complete",
-                    "result": session.result
-                })
-                break
 
     except WebSocketDisconnect:
         pass
     except Exception as e:
         logger.error(f"Progress stream error: {e}")
-        await websocket.send_json({
+        await send_json(websocket, {
             "type": "error",
             "message": str(e)
         })
+    finally:
+        subscription.close()
+        watcher.cancel()
+
+@app.get("/api/browser/research/{session_id}/events")
+async def research_events_stream(session_id: str, request: Request, after: Optional[int] = None):
+    """Research progress as Server-Sent Events
+
+    Each event's ``id`` is its offset, so an EventSource that reconnects
+    resumes after the last event it received via ``Last-Event-ID``;
+    ``?after=<offset>`` does the same for other clients. The stream ends
+    once the research has.
+    """
+    channel = research_events.get(session_id)
+    if not channel:
+        raise HTTPException(status_code=404, detail="No research session")
+    if after is None:
+        after = resume_offset(request.headers.get("last-event-id"))
+    subscription = channel.subscribe(after)
+
+    async def generate_events():
+        try:
+            async for offset, event in subscription:
+                yield f"id: {offset}\ndata: {dumps_text(event)}\n\n"
+            if subscription.overflowed:
+                yield f"event: error\ndata: {dumps_text({'message': 'Fell too far behind, reconnect to resume'})}\n\n"
+        finally:
+            subscription.close()
+
+    return StreamingResponse(
+        generate_events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive"
+        }
+    )
 
 @app.post("/api/browser/start-session")
 async def start_research_session(request: StartResearchRequest):
     """Start a new browser research session with streaming"""
     session_id = request.sessionId or str(uuid.uuid4())
 
-    # Create session record
+    # Start research in background; nothing runs before the session is recorded
+    research_events.channel(session_id)
+    result, cached = start_research(session_id, request.query, request.llm, request.startUrl,
+                                    request.useCache)
+
+    # Create session record; a result served from the cache has no browser of its own to watch
     session = ResearchSession(
         sessionId=session_id,
         query=request.query,
         status="starting",
         startedAt=datetime.now(),
-        streamUrl=f"ws://localhost:8002/ws/stream/{session_id}" if request.enableStreaming else None
+        streamUrl=f"ws://localhost:8002/ws/stream/{session_id}" if request.enableStreaming and not cached else None,
+        cached=cached
     )
-    research_sessions[session_id] = session
-
-    # Start research in background
-    asyncio.create_task(run_research(session_id, request.query))
+    research_sessions.add(session)
+    asyncio.create_task(run_research(session, result))
 
     return {
         "sessionId": session_id,
@@ -257,23 +377,14 @@ async def start_research_session(request: StartResearchRequest):
         "status": "started"
     }
 
-async def run_research(session_id: str, query: str):
-    """Run research task in background"""
-    session = research_sessions.get(session_id)
-    if not session:
-        return
-
+async def run_research(session: ResearchSession, result: Awaitable[Dict[str, Any]]):
+    """Record the outcome of a research run started by start_research"""
     try:
-        session.status = "researching"
-        result = await browser_agent.research_with_streaming(
-            query=query,
-            session_id=session_id
-        )
-        session.result = result.get('result')
-        session.status = "completed"
+        set_status(session, "researching")
+        result = await result
+        set_status(session, "completed", result.get('result'))
     except Exception as e:
-        session.status = "error"
-        session.result = str(e)
+        set_status(session, "error", str(e))
 
 @app.websocket("/ws/browser-agent")
 async def websocket_endpoint(websocket: WebSocket):
@@ -282,7 +393,7 @@ async def websocket_endpoint(websocket: WebSocket):
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await receive_json(websocket)
 
             if data.get("type") == "research":
                 # Start research with streaming
@@ -293,31 +404,30 @@ async def websocket_endpoint(websocket: WebSocket):
 
                 response = await start_research_session(request)
 
-                await websocket.send_json({
+                await send_json(websocket, {
                     "type": "research_started",
                     "data": response
                 })
 
-                # Monitor progress
+                # Wait for the research to finish
                 session_id = response["sessionId"]
-                while True:
-                    session = research_sessions.get(session_id)
-                    if session and session.status in ["completed", "error"]:
-                        await websocket.send_json({
-                            "type": "research_complete",
-                            "data": {
-                                "sessionId": session_id,
-                                "status": session.status,
-                                "result": session.result
-                            }
-                        })
-                        break
-                    await asyncio.sleep(1)
+                await wait_for_completion(session_id)
+                session = research_sessions.get(session_id)
+                if session:
+                    await send_json(websocket, {
+                        "type": "research_complete",
+                        "data": {
+                            "sessionId": session_id,
+                            "status": session.status,
+                            "result": await research_sessions.result(session),
+                            "cached": session.cached
+                        }
+                    })
 
     except WebSocketDisconnect:
         pass
     except Exception as e:
-        await websocket.send_json({
+        await send_json(websocket, {
             "type": "error",
             "message": str(e)
         })
@@ -325,7 +435,7 @@ async def websocket_endpoint(websocket: WebSocket):
 @app.get("/api/browser/session/{session_id}")
 async def get_session_status(session_id: str):
     """Get status of a research session"""
-    session = research_sessions.get(session_id)
+    session = await research_sessions.load(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
@@ -335,12 +445,22 @@ async def get_session_status(session_id: str):
         "status": session.status,
         "startedAt": session.startedAt.isoformat(),
         "streamUrl": session.streamUrl,
-        "result": session.result
+        "result": await research_sessions.result(session),
+        "cached": session.cached
     }
 
 @app.get("/api/browser/sessions")
-async def list_all_sessions():
-    """List all research sessions"""
+async def list_all_sessions(status: Optional[str] = None, limit: int = 100, cursor: Optional[str] = None,
+                            since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """List research sessions, newest first
+
+    Pass ``nextCursor`` back as ``cursor`` for the next page; ``status``,
+    ``since`` and ``until`` filter by status and start time.
+    """
+    try:
+        sessions, next_cursor = research_sessions.list(status, max(1, min(limit, 1000)), cursor, since, until)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     return {
         "sessions": [
             {
@@ -349,8 +469,9 @@ async def list_all_sessions():
                 "status": s.status,
                 "startedAt": s.startedAt.isoformat()
             }
-            for s in research_sessions.values()
-        ]
+            for s in sessions
+        ],
+        "nextCursor": next_cursor
     }
 
 class ExecuteActionRequest(BaseModel):
@@ -451,7 +572,6 @@ async def process_browser_command(request: CommandRequest):
         # For now, we'll simulate command processing with streaming response
         # In a full implementation, this would integrate with the browser automation and AI
 
-        import json
         import asyncio
 
         async def generate_response():
@@ -465,7 +585,7 @@ async def process_browser_command(request: CommandRequest):
 
             for step in steps:
                 # Format as Server-Sent Events
-                yield f"data: {json.dumps(step)}\n\n"
+                yield f"data: {dumps_text(step)}\n\n"
                 await asyncio.sleep(1)  # Simulate processing time
 
             yield "data: [DONE]\n\n"
@@ -490,7 +610,10 @@ async def health_check():
         "status": "healthy",
         "service": "browser-agent",
         "timestamp": datetime.now().isoformat(),
-        "sessions_active": len(research_sessions)
+        "sessions_active": len(research_sessions),
+        "research_sessions": research_sessions.stats(),
+        "research_cache": research_cache.stats(),
+        "research_events": research_events.stats()
     }
 
 if __name__ == "__main__":
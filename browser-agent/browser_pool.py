@@ -0,0 +1,313 @@
+"""
+Browser Pool - Chromium processes and pre-warmed contexts for stream sessions
+"""
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Optional, Set
+from urllib.parse import urlsplit
+
+from playwright.async_api import Browser, BrowserContext, CDPSession, Page
+
+logger = logging.getLogger(__name__)
+
+
+class PooledContext:
+    """A browser context with its page and CDP session already attached"""
+
+    def __init__(self, context: BrowserContext, page: Page, cdp: CDPSession):
+        self.context = context
+        self.page = page
+        self.cdp = cdp
+        self.uses = 0
+        self.origins: Set[str] = set()  # Origins to wipe storage for on recycle
+        self._attach(page, cdp)
+
+    def _attach(self, page: Page, cdp: CDPSession):
+        self.page = page
+        self.cdp = cdp
+        page.on('framenavigated', self._on_navigated)
+
+    async def renew_page(self):
+        """Replace the page with a fresh tab, dropping its history and sessionStorage"""
+        old_page, old_cdp = self.page, self.cdp
+        page = await self.context.new_page()
+        cdp = await self.context.new_cdp_session(page)
+        self._attach(page, cdp)
+        try:
+            await old_cdp.detach()
+        except Exception:
+            pass  # Already gone with its page
+        await old_page.close()
+
+    def _on_navigated(self, frame):
+        parts = urlsplit(frame.url)
+        if parts.scheme in ('http', 'https'):
+            self.origins.add(f"{parts.scheme}://{parts.netloc}")
+
+    async def close(self):
+        try:
+            await self.context.close()
+        except Exception as e:
+            logger.error(f"Error closing pooled context: {e}")
+
+
+class BrowserContextPool:
+    """Keeps ``size`` ready-made contexts so session creation skips browser setup
+
+    A background task refills the pool whenever a context is taken. Released
+    contexts have their HTTP cache, cookies, permissions and per-origin
+    storage cleared and their page replaced by a fresh one, so no history or
+    sessionStorage carries over; they go back into the pool until they have
+    served ``max_uses`` sessions.
+    """
+
+    def __init__(self, browser: Browser, context_options: dict, size: int = 2, max_uses: int = 20):
+        self.browser = browser
+        self.context_options = context_options
+        self.size = size
+        self.max_uses = max_uses
+        self.hits = 0
+        self.misses = 0
+        self.recycled = 0
+        self._idle: Deque[PooledContext] = deque()
+        self._wanted = asyncio.Event()
+        self._refiller: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """Start the background refiller"""
+        if self.size > 0 and self._refiller is None:
+            self._refiller = asyncio.create_task(self._refill())
+            self._wanted.set()
+
+    async def acquire(self) -> PooledContext:
+        """Take a warm context, or build one on the spot if the pool is empty"""
+        while self._idle:
+            entry = self._idle.popleft()
+            if self.browser.is_connected():
+                self.hits += 1
+                self._wanted.set()
+                return entry
+        self.misses += 1
+        self._wanted.set()
+        return await self._create()
+
+    async def release(self, entry: PooledContext):
+        """Reset a context used by a finished session and return it to the pool"""
+        entry.uses += 1
+        if (entry.uses >= self.max_uses or len(self._idle) >= self.size
+                or entry.page.is_closed() or not self.browser.is_connected()):
+            await entry.close()
+            return
+        try:
+            await entry.cdp.send('Network.clearBrowserCache')
+            await entry.context.clear_cookies()
+            await entry.context.clear_permissions()
+            for origin in entry.origins:
+                await entry.cdp.send('Storage.clearDataForOrigin', {
+                    'origin': origin,
+                    'storageTypes': 'all'
+                })
+            entry.origins.clear()
+            await entry.renew_page()
+        except Exception as e:
+            logger.error(f"Error recycling context, discarding it: {e}")
+            await entry.close()
+            return
+        self.recycled += 1
+        self._idle.append(entry)
+
+    async def close(self):
+        """Stop refilling and close every idle context"""
+        if self._refiller:
+            self._refiller.cancel()
+            self._refiller = None
+        while self._idle:
+            await self._idle.popleft().close()
+
+    def stats(self) -> dict:
+        """Pool size and hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            'size': self.size,
+            'idle': len(self._idle),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hitRate': round(self.hits / total, 3) if total else None,
+            'recycled': self.recycled
+        }
+
+    async def _create(self) -> PooledContext:
+        context = await self.browser.new_context(**self.context_options)
+        page = await context.new_page()
+        cdp = await context.new_cdp_session(page)
+        return PooledContext(context, page, cdp)
+
+    async def _refill(self):
+        while True:
+            await self._wanted.wait()
+            self._wanted.clear()
+            while len(self._idle) < self.size and self.browser.is_connected():
+                try:
+                    self._idle.append(await self._create())
+                except Exception as e:
+                    logger.error(f"Error pre-warming browser context: {e}")
+                    await asyncio.sleep(1)
+                    break
+
+
+class BrowserSlot:
+    """One Chromium process with its own context pool and placed sessions"""
+
+    def __init__(self, index: int, launcher: Callable[[], Awaitable[Browser]],
+                 context_options: dict, pool_size: int, max_uses: int):
+        self.index = index
+        self.launcher = launcher
+        self.context_options = context_options
+        self.pool_size = pool_size
+        self.max_uses = max_uses
+        self.browser: Optional[Browser] = None
+        self.context_pool: Optional[BrowserContextPool] = None
+        self.sessions: Set[str] = set()
+        self.restarts = 0
+
+    @property
+    def connected(self) -> bool:
+        return self.browser is not None and self.browser.is_connected()
+
+    async def launch(self, on_disconnected: Callable[['BrowserSlot'], None]):
+        """Start Chromium and pre-warm its contexts"""
+        self.browser = await self.launcher()
+        self.browser.on('disconnected', lambda _: on_disconnected(self))
+        self.context_pool = BrowserContextPool(
+            self.browser, self.context_options, size=self.pool_size, max_uses=self.max_uses
+        )
+        await self.context_pool.start()
+
+    async def close(self):
+        if self.context_pool:
+            await self.context_pool.close()
+        if self.browser:
+            try:
+                await self.browser.close()
+            except Exception as e:
+                logger.error(f"Error closing browser {self.index}: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'index': self.index,
+            'connected': self.connected,
+            'sessions': len(self.sessions),
+            'restarts': self.restarts,
+            'contextPool': self.context_pool.stats() if self.context_pool else None
+        }
+
+
+class BrowserProcessPool:
+    """Spreads stream sessions over several Chromium processes
+
+    Placement is either ``least-loaded`` (fewest sessions) or ``pack`` (first
+    browser with room), both honouring ``max_contexts`` per browser when it
+    is non-zero. A browser that disconnects unexpectedly is relaunched with
+    backoff, and ``on_crash`` is called with the sessions it took down.
+    """
+
+    PLACEMENTS = ('least-loaded', 'pack')
+
+    def __init__(self, launcher: Callable[[], Awaitable[Browser]], context_options: dict,
+                 processes: int = 1, max_contexts: int = 0, placement: str = 'least-loaded',
+                 pool_size: int = 2, max_uses: int = 20,
+                 on_crash: Optional[Callable[[Set[str]], Awaitable[None]]] = None):
+        if placement not in self.PLACEMENTS:
+            raise ValueError(f"Unknown placement policy: {placement}")
+        self.max_contexts = max_contexts
+        self.placement = placement
+        self.on_crash = on_crash
+        self.slots = [
+            BrowserSlot(index, launcher, context_options, pool_size, max_uses)
+            for index in range(max(processes, 1))
+        ]
+        self._placements: Dict[str, BrowserSlot] = {}
+        self._closing = False
+
+    async def start(self):
+        """Launch every browser process"""
+        await asyncio.gather(*(slot.launch(self._on_disconnected) for slot in self.slots))
+
+    def place(self) -> BrowserSlot:
+        """Pick the browser for a new session according to the placement policy"""
+        candidates = [
+            slot for slot in self.slots
+            if slot.connected and (not self.max_contexts or len(slot.sessions) < self.max_contexts)
+        ]
+        if not candidates:
+            raise RuntimeError("No browser has capacity for another session")
+        if self.placement == 'pack':
+            return candidates[0]
+        return min(candidates, key=lambda slot: len(slot.sessions))
+
+    async def acquire(self, session_id: str) -> PooledContext:
+        """Place a session and hand out a context on its browser"""
+        slot = self.place()
+        slot.sessions.add(session_id)
+        self._placements[session_id] = slot
+        try:
+            return await slot.context_pool.acquire()
+        except Exception:
+            slot.sessions.discard(session_id)
+            del self._placements[session_id]
+            raise
+
+    async def release(self, session_id: str, entry: PooledContext):
+        """Return a finished session's context to its browser"""
+        slot = self._placements.pop(session_id, None)
+        if slot is None:
+            await entry.close()
+            return
+        slot.sessions.discard(session_id)
+        await slot.context_pool.release(entry)
+
+    def placement_of(self, session_id: str) -> Optional[int]:
+        """Index of the browser a session runs in"""
+        slot = self._placements.get(session_id)
+        return slot.index if slot else None
+
+    async def close(self):
+        """Close every browser process without relaunching"""
+        self._closing = True
+        await asyncio.gather(*(slot.close() for slot in self.slots))
+
+    def stats(self) -> dict:
+        return {
+            'placement': self.placement,
+            'maxContextsPerBrowser': self.max_contexts,
+            'browsers': [slot.stats() for slot in self.slots]
+        }
+
+    def _on_disconnected(self, slot: BrowserSlot):
+        if self._closing:
+            return
+        logger.error(f"Browser {slot.index} disconnected with {len(slot.sessions)} session(s)")
+        asyncio.create_task(self._recover(slot))
+
+    async def _recover(self, slot: BrowserSlot):
+        lost = set(slot.sessions)
+        slot.sessions.clear()
+        for session_id in lost:
+            self._placements.pop(session_id, None)
+        if slot.context_pool:
+            await slot.context_pool.close()
+        if lost and self.on_crash:
+            await self.on_crash(lost)
+
+        delay = 1
+        while not self._closing:
+            try:
+                await slot.launch(self._on_disconnected)
+                slot.restarts += 1
+                logger.info(f"Relaunched browser {slot.index}")
+                return
+            except Exception as e:
+                logger.error(f"Error relaunching browser {slot.index}, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
@@ -2,9 +2,13 @@
 Browser Stream Service - Captures and streams browser frames using CDP
 """
 import asyncio
-import base64
-import json
+import hashlib
+import hmac
 import logging
+import math
+import os
+import time
+from functools import partial
 from typing import Dict, Optional, Set
 from datetime import datetime
 
@@ -12,27 +16,552 @@ from playwright.async_api import async_playwright, Page, Browser
 from fastapi import WebSocket, WebSocketDisconnect
 import uvicorn
 
+from browser_pool import BrowserProcessPool, PooledContext
+from frame_ring import FrameRing
+from frame_transcoder import TranscodePool
+from input_pipeline import InputPipeline
+from json_codec import JSONCodecResponse, receive_json, send_json
+from process_stats import process_tree_rss
+from screencast_frame import BINARY_SUBPROTOCOL, FRAME_KIND_JPEG, ScreencastFrame, pack_frame
+from session_recorder import RecordingStore, SessionRecorder
+from simulcast import FULL, JPEG, SimulcastEncoder, screencast_cap, validate
+from stream_metrics import SessionMetrics, StreamMetrics
+from stream_viewer import VISIBILITY_STATES, StreamViewer
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+class SessionExistsError(Exception):
+    """A session with the requested id is already running or being created"""
+
+
+class AdaptiveQualityController:
+    """Picks screencast settings that keep a session's viewers within a latency target
+
+    Settings come from a ladder ordered from best to cheapest. Every
+    ``interval`` seconds the slowest viewer is checked: when its estimated
+    latency exceeds the target, or frames are being dropped, the controller
+    steps down a rung; after several calm periods with plenty of headroom it
+    steps back up. A change restarts the screencast with the new parameters.
+    """
+
+    LADDER = [
+        {'quality': 80, 'maxWidth': 1920, 'maxHeight': 1080, 'everyNthFrame': 1},
+        {'quality': 70, 'maxWidth': 1920, 'maxHeight': 1080, 'everyNthFrame': 2},
+        {'quality': 60, 'maxWidth': 1600, 'maxHeight': 900, 'everyNthFrame': 2},
+        {'quality': 50, 'maxWidth': 1280, 'maxHeight': 720, 'everyNthFrame': 2},
+        {'quality': 45, 'maxWidth': 960, 'maxHeight': 540, 'everyNthFrame': 3},
+        {'quality': 35, 'maxWidth': 640, 'maxHeight': 360, 'everyNthFrame': 4},
+    ]
+    DEFAULT_LEVEL = 1
+    DROP_RATIO_LIMIT = 0.1  # Share of frames a viewer may drop in a period
+    CALM_PERIODS_TO_UPGRADE = 3
+
+    def __init__(self, target_latency_ms: float = 200.0, interval: float = 2.0, enabled: bool = True):
+        self.target_latency_ms = target_latency_ms
+        self.interval = interval
+        self.enabled = enabled
+        self.level = self.DEFAULT_LEVEL
+        self._calm_periods = 0
+        self._last_frames = 0
+        self._last_dropped: Dict[int, int] = {}
+
+    @property
+    def params(self) -> dict:
+        """Page.startScreencast parameters for the current level"""
+        return {'format': 'jpeg', **self.LADDER[self.level]}
+
+    def evaluate(self, viewers, frame_count: int) -> bool:
+        """Update the level from the viewers' measurements; True if it changed"""
+        frames = max(frame_count - self._last_frames, 1)
+        self._last_frames = frame_count
+        if not self.enabled or not viewers:
+            return False
+
+        worst_latency = 0.0
+        worst_drop_ratio = 0.0
+        dropped = {}
+        for viewer in viewers:
+            dropped[id(viewer)] = viewer.frames_dropped
+            new_drops = viewer.frames_dropped - self._last_dropped.get(id(viewer), viewer.frames_dropped)
+            worst_drop_ratio = max(worst_drop_ratio, new_drops / frames)
+            worst_latency = max(worst_latency, viewer.estimated_latency_ms())
+        self._last_dropped = dropped
+
+        if worst_latency > self.target_latency_ms or worst_drop_ratio > self.DROP_RATIO_LIMIT:
+            self._calm_periods = 0
+            if self.level < len(self.LADDER) - 1:
+                self.level += 1
+                return True
+            return False
+
+        if worst_latency < self.target_latency_ms / 2 and worst_drop_ratio == 0:
+            self._calm_periods += 1
+            if self._calm_periods >= self.CALM_PERIODS_TO_UPGRADE and self.level > 0:
+                self._calm_periods = 0
+                self.level -= 1
+                return True
+        else:
+            self._calm_periods = 0
+        return False
+
+
+class FrameDeduplicator:
+    """Recognises screencast frames identical to the last one broadcast
+
+    Chromium emits frames for caret blinks and re-composites that produce the
+    same JPEG bytes. Those are detected with a content hash of the encoded
+    frame, which is far cheaper than decoding and comparing pixels.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.suppressed = 0
+        self._last_digest: Optional[bytes] = None
+
+    def is_duplicate(self, data: str) -> bool:
+        """True if the base64 frame data matches the previous frame"""
+        if not self.enabled:
+            return False
+        digest = hashlib.blake2b(data.encode('ascii'), digest_size=16).digest()
+        if digest == self._last_digest:
+            self.suppressed += 1
+            return True
+        self._last_digest = digest
+        return False
+
+    def reset(self):
+        """Let the next frame through, e.g. for a newly joined viewer"""
+        self._last_digest = None
+
+
+class RingViewer(StreamViewer):
+    """A fan-out worker reading a session's frames from its shared-memory ring
+
+    Frames are written to the ring once by the broadcaster; the worker only
+    gets a small ``{"type": "frame", "seq": n}`` doorbell naming the newest
+    one (see stream_fanout_worker.py).
+    """
+
+    def __init__(self, websocket: WebSocket, ring: FrameRing):
+        super().__init__(websocket)
+        self.ring = ring
+
+    async def send(self, frame: ScreencastFrame) -> int:
+        await send_json(self.websocket, {'type': 'frame', 'seq': self.ring.sequence})
+        return 0
+
+    def stats(self) -> dict:
+        return dict(super().stats(), transport='ring')
+
+
+def ring_name(session_id: str) -> str:
+    """Shared-memory name for a session's frame ring, short enough for macOS"""
+    digest = hashlib.blake2b(session_id.encode(), digest_size=6).hexdigest()
+    return f"stream-{os.getpid()}-{digest}"
+
+
+class ScreencastBroadcaster:
+    """Owns the single CDP screencast of a session and fans frames out to its viewers
+
+    The screencast starts when the first viewer subscribes and stops when the
+    last one leaves, so every frame is captured, acked and encoded once no
+    matter how many viewers are attached. Recorded sessions keep the
+    screencast running without viewers.
+    """
+
+    def __init__(self, session_id: str, session: dict):
+        self.session_id = session_id
+        self.session = session
+        self.cdp = session['cdp']
+        self.metrics: SessionMetrics = session['metrics']
+        self.viewers: Dict[WebSocket, StreamViewer] = {}
+        self.streaming = False
+        self.last_viewer_at = time.monotonic()  # When the last viewer left
+        # Most recent frame, with its encodings cached, for instant first paint
+        self.last_frame: Optional[ScreencastFrame] = None
+        self.controller = AdaptiveQualityController(
+            target_latency_ms=float(os.getenv('STREAM_TARGET_LATENCY_MS', '200')),
+            enabled=os.getenv('STREAM_ADAPTIVE_QUALITY', '1') != '0'
+        )
+        self._controller_task: Optional[asyncio.Task] = None
+        self.deduplicator = FrameDeduplicator(enabled=os.getenv('STREAM_DEDUPE_FRAMES', '1') != '0')
+        self.recorder: Optional[SessionRecorder] = None
+        self.ring: Optional[FrameRing] = None  # Created for the first fan-out worker
+        self.simulcast = SimulcastEncoder(self.visible_viewers, session['transcoder'])
+        self._screencast_params: Optional[dict] = None  # As sent to Chromium
+        self._lock = asyncio.Lock()
+        self.cdp.on('Page.screencastFrame', self._on_screencast_frame)
+
+    async def subscribe(self, websocket: WebSocket, binary: bool = False, delta: bool = False,
+                        layer: str = FULL, codec: str = JPEG) -> StreamViewer:
+        """Add a viewer, starting the screencast if it is the first"""
+        validate(layer, codec)
+        if delta and codec != JPEG:
+            raise ValueError("Delta streams are JPEG only")
+        async with self._lock:
+            return await self._add_viewer(StreamViewer(websocket, binary, delta, self.metrics, layer, codec))
+
+    async def set_layer(self, websocket: WebSocket, layer: Optional[str], codec: Optional[str] = None):
+        """Move a viewer to another simulcast layer and/or codec"""
+        async with self._lock:
+            viewer = self.viewers.get(websocket)
+            if viewer is None:
+                return
+            layer = layer or viewer.layer
+            codec = codec or viewer.codec
+            validate(layer, codec)
+            if viewer.encoder and codec != JPEG:
+                raise ValueError("Delta streams are JPEG only")
+            if (viewer.layer, viewer.codec) == (layer, codec):
+                return
+            viewer.layer = layer
+            viewer.codec = codec
+            if viewer.encoder:
+                viewer.encoder.force_keyframe()
+            await self._retune()
+            if self.last_frame is not None:
+                await self.simulcast.offer_latest(viewer, self.last_frame)
+
+    async def subscribe_ring(self, websocket: WebSocket, slots: int, slot_size: int) -> RingViewer:
+        """Add a fan-out worker, publishing frames to a shared-memory ring for it"""
+        async with self._lock:
+            if self.last_frame is None:
+                await self.capture_still()
+            if self.ring is None:
+                self.ring = FrameRing.create(ring_name(self.session_id), slots, slot_size)
+                if self.last_frame is not None:
+                    self.ring.write(self.last_frame.as_binary())
+            # The worker attaches to the ring before the first doorbell
+            await send_json(websocket, {
+                'type': 'ring',
+                'name': self.ring.name,
+                'slots': self.ring.slots,
+                'slotSize': self.ring.slot_size
+            })
+            return await self._add_viewer(RingViewer(websocket, self.ring))
+
+    async def set_visibility(self, websocket: WebSocket, visibility: str):
+        """Skip a viewer while it is hidden or paused, and catch it up when it is back
+        
+        With no visible viewers left (and no recording) the screencast is
+        stopped; the cached last frame is what a returning viewer sees first.
+        """
+        if visibility not in VISIBILITY_STATES:
+            raise ValueError(f"Unknown visibility: {visibility}")
+        async with self._lock:
+            viewer = self.viewers.get(websocket)
+            if viewer is None or viewer.visibility == visibility:
+                return
+            was_visible = viewer.visible
+            viewer.visibility = visibility
+            if viewer.visible and not was_visible:
+                if self.last_frame is not None:
+                    await self.simulcast.offer_latest(viewer, self.last_frame)
+                await self._start_screencast()
+            elif not self._wants_screencast():
+                await self._stop_screencast()
+                return
+            await self._retune()
+
+    def visible_viewers(self):
+        return [viewer for viewer in self.viewers.values() if viewer.visible]
+
+    def _wants_screencast(self) -> bool:
+        return self.recorder is not None or any(viewer.visible for viewer in self.viewers.values())
+
+    async def _add_viewer(self, viewer: StreamViewer) -> StreamViewer:
+        self.viewers[viewer.websocket] = viewer
+        viewer.start(self.unsubscribe)
+        self.deduplicator.reset()
+        if self.last_frame is None:
+            await self.capture_still()
+        if self.last_frame is not None:
+            await self.simulcast.offer_latest(viewer, self.last_frame)
+        await self._start_screencast()
+        await self._retune()
+        return viewer
+
+    async def unsubscribe(self, websocket: WebSocket):
+        """Remove a viewer, stopping the screencast if it was the last
+
+        The frame ring is released with the last fan-out worker.
+        """
+        async with self._lock:
+            viewer = self.viewers.pop(websocket, None)
+            if viewer is None:
+                return
+            await viewer.stop()
+            if self.ring and not any(isinstance(other, RingViewer) for other in self.viewers.values()):
+                self.ring.close()
+                self.ring = None
+            if not self.viewers:
+                self.last_viewer_at = time.monotonic()
+            if not self._wants_screencast():
+                await self._stop_screencast()
+                return
+            await self._retune()
+
+    async def start_recording(self, recorder: SessionRecorder):
+        """Append every new frame to ``recorder``, with or without viewers"""
+        async with self._lock:
+            self.recorder = recorder
+            if self.last_frame is not None:
+                recorder.append(self.last_frame)
+            await self._start_screencast()
+            await self._retune()
+
+    def screencast_params(self) -> dict:
+        """Controller settings, capped to the largest subscribed layer"""
+        params = dict(self.controller.params)
+        layers = self.simulcast.layers()
+        if self.recorder:
+            layers.add(FULL)
+        cap = screencast_cap(layers)
+        if cap:
+            params['maxWidth'] = min(params['maxWidth'], cap[0])
+            params['maxHeight'] = min(params['maxHeight'], cap[1])
+        return params
+
+    async def _retune(self):
+        """Restart the screencast if the settings it needs have changed"""
+        params = self.screencast_params()
+        if not self.streaming or params == self._screencast_params:
+            return
+        logger.info(f"Adjusting screencast for session {self.session_id}: {params}")
+        try:
+            await self.cdp.send('Page.stopScreencast')
+            await self.cdp.send('Page.startScreencast', params)
+            self._screencast_params = params
+        except Exception as e:
+            logger.error(f"Error restarting screencast: {e}")
+
+    async def _start_screencast(self):
+        if self.streaming:
+            return
+        self._screencast_params = self.screencast_params()
+        await self.cdp.send('Page.startScreencast', self._screencast_params)
+        self.streaming = True
+        self._controller_task = asyncio.create_task(self._run_controller())
+        logger.info(f"Started screencast for session {self.session_id}")
+
+    async def _stop_screencast(self):
+        if not self.streaming:
+            return
+        self.streaming = False
+        if self._controller_task:
+            self._controller_task.cancel()
+            self._controller_task = None
+        try:
+            await self.cdp.send('Page.stopScreencast')
+            logger.info(f"Stopped screencast for session {self.session_id}")
+        except Exception as e:
+            logger.error(f"Error stopping screencast: {e}")
+
+    async def capture_still(self):
+        """Populate the last-frame cache with a one-shot screenshot"""
+        page = self.session['page']
+        viewport = page.viewport_size or {}
+        try:
+            result = await self.cdp.send('Page.captureScreenshot', {
+                'format': 'jpeg',
+                'quality': self.controller.params['quality']
+            })
+        except Exception as e:
+            logger.error(f"Error capturing still for session {self.session_id}: {e}")
+            return
+        self.last_frame = ScreencastFrame(self.session_id, self.session['frame_count'], {
+            'data': result['data'],
+            'metadata': {
+                'deviceWidth': viewport.get('width', 0),
+                'deviceHeight': viewport.get('height', 0)
+            }
+        })
+        self.session['frame_count'] += 1
+
+    def record_rtt(self, websocket: WebSocket, rtt_ms: float):
+        """Record a round trip time reported by a viewer's ping"""
+        viewer = self.viewers.get(websocket)
+        if viewer:
+            viewer.record_rtt(rtt_ms)
+
+    def request_keyframe(self, websocket: WebSocket):
+        """Resynchronise a delta viewer with a full frame"""
+        viewer = self.viewers.get(websocket)
+        if viewer and viewer.encoder:
+            viewer.encoder.force_keyframe()
+
+    async def _run_controller(self):
+        """Periodically re-tune the screencast to the viewers' conditions"""
+        while True:
+            await asyncio.sleep(self.controller.interval)
+            if not self.controller.evaluate(self.visible_viewers(), self.session['frame_count']):
+                continue
+            async with self._lock:
+                if not self.streaming:
+                    return
+                await self._retune()
+
+    async def close(self, reason: str = 'Session ended'):
+        """Disconnect all viewers with ``reason`` and stop the screencast"""
+        self.recorder = None
+        for websocket in list(self.viewers):
+            # Ring viewers are fan-out workers; closing lets them end their
+            # own viewers' streams
+            try:
+                await websocket.close(code=1001, reason=reason)
+            except Exception:
+                pass  # Already closed
+            await self.unsubscribe(websocket)
+        async with self._lock:
+            await self._stop_screencast()
+        self.cdp.remove_listener('Page.screencastFrame', self._on_screencast_frame)
+        self.simulcast.close()
+        if self.ring:
+            self.ring.close()
+            self.ring = None
+
+    async def _on_screencast_frame(self, params: dict):
+        self.metrics.frame_captured(time.monotonic())
+
+        # Unchanged frames are acked but not broadcast
+        if self.deduplicator.is_duplicate(params['data']):
+            self.metrics.frames_suppressed += 1
+            await self._ack(params)
+            return
+
+        # Only a changed frame can show an interaction's effect
+        if 'input' in self.session:
+            self.session['input'].frame_rendered()
+
+        frame = ScreencastFrame(self.session_id, self.session['frame_count'], params)
+        self.session['frame_count'] += 1
+        self.last_frame = frame
+        if self.recorder:
+            self.recorder.append(frame)
+        if self.ring:
+            self.ring.write(frame.as_binary())
+
+        # Hand the frame to every viewer's queue; sending happens in the
+        # viewers' own tasks so the ack below is never held up by a slow link.
+        # Lower simulcast layers are encoded off-loop for the same reason
+        self.simulcast.distribute(frame)
+
+        await self._ack(params)
+
+    async def _ack(self, params: dict):
+        """Acknowledge a frame so Chromium sends the next one"""
+        started = time.perf_counter()
+        try:
+            await self.cdp.send('Page.screencastFrameAck', {
+                'sessionId': params['sessionId']
+            })
+            self.metrics.ack_seconds.observe(time.perf_counter() - started)
+        except Exception as e:
+            logger.error(f"Error acknowledging frame: {e}")
+
+
 class BrowserStreamService:
     """Handles browser frame capture and streaming via CDP"""
     
+    CONTEXT_OPTIONS = {
+        'viewport': {'width': 1920, 'height': 1080},
+        'user_agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/121.0.0.0'
+    }
+    
     def __init__(self):
         self.playwright = None
         self.browser: Optional[Browser] = None
+        self.browser_pool: Optional[BrowserProcessPool] = None
         self.sessions: Dict[str, dict] = {}  # sessionId -> session data
         self.active_streams: Set[WebSocket] = set()
+        self.metrics = StreamMetrics()
+        
+        # Session eviction: TTLs in seconds, 0 disables a limit
+        self.interaction_ttl = float(os.getenv('STREAM_INTERACTION_TTL', '3600'))
+        self.viewerless_ttl = float(os.getenv('STREAM_VIEWERLESS_TTL', '600'))
+        self.max_sessions = int(os.getenv('STREAM_MAX_SESSIONS', '0'))
+        self.memory_high_water = int(os.getenv('STREAM_MEMORY_HIGH_WATER_MB', '0')) * 1024 * 1024
+        self.eviction_interval = float(os.getenv('STREAM_EVICTION_INTERVAL', '10'))
+        self.evictions = {'interaction_ttl': 0, 'viewerless_ttl': 0, 'max_sessions': 0, 'memory': 0}
+        self.rss_bytes = (0, 0)
+        self._reaper: Optional[asyncio.Task] = None
+        self._creating: Set[str] = set()  # Ids whose context is being set up
+        
+        # Resizing and re-encoding for simulcast layers and WebP viewers
+        self.transcoder = TranscodePool(
+            workers=int(os.getenv('STREAM_TRANSCODE_WORKERS', str(min(4, os.cpu_count() or 1)))),
+            processes=os.getenv('STREAM_TRANSCODE_PROCESSES', '0') != '0',
+            max_pending=int(os.getenv('STREAM_TRANSCODE_MAX_PENDING', '0'))
+        )
+        
+        # Shared-memory frame rings for fan-out workers
+        self.ring_slots = int(os.getenv('STREAM_RING_SLOTS', '8'))
+        self.ring_slot_size = int(os.getenv('STREAM_RING_SLOT_KB', '2048')) * 1024
+        
+        # Opt-in session recording: sizes in MB and age in seconds, 0 disables a limit
+        self.record_by_default = os.getenv('STREAM_RECORD_SESSIONS', '0') != '0'
+        self.recordings = RecordingStore(
+            os.getenv('STREAM_RECORDING_DIR', 'recordings'),
+            segment_bytes=int(os.getenv('STREAM_RECORDING_SEGMENT_MB', '64')) * 1024 * 1024,
+            max_bytes=int(os.getenv('STREAM_RECORDING_MAX_MB', '0')) * 1024 * 1024,
+            max_age=float(os.getenv('STREAM_RECORDING_TTL', '0'))
+        )
         
     async def initialize(self):
-        """Initialize Playwright and browser"""
+        """Initialize Playwright and the browser processes"""
         self.playwright = await async_playwright().start()
-        self.browser = await self.playwright.chromium.launch(
+        self.browser_pool = BrowserProcessPool(
+            self._launch_browser,
+            self.CONTEXT_OPTIONS,
+            processes=int(os.getenv('STREAM_BROWSER_PROCESSES', '1')),
+            max_contexts=int(os.getenv('STREAM_MAX_CONTEXTS_PER_BROWSER', '0')),
+            placement=os.getenv('STREAM_BROWSER_PLACEMENT', 'least-loaded'),
+            pool_size=int(os.getenv('STREAM_CONTEXT_POOL_SIZE', '2')),
+            max_uses=int(os.getenv('STREAM_CONTEXT_POOL_MAX_USES', '20')),
+            on_crash=self._on_browser_crash
+        )
+        await self.browser_pool.start()
+        # Kept for callers that check whether the service is initialized
+        self.browser = self.browser_pool.slots[0].browser
+        self._reaper = asyncio.create_task(self._evict_sessions())
+        self.recordings.start()
+        logger.info(f"Browser initialized successfully ({len(self.browser_pool.slots)} process(es))")
+        
+    async def _launch_browser(self) -> Browser:
+        return await self.playwright.chromium.launch(
             headless=True,  # Run headless for embedded display
             args=['--no-sandbox', '--disable-setuid-sandbox']
         )
-        logger.info("Browser initialized successfully")
+        
+    async def _on_browser_crash(self, session_ids: Set[str]):
+        """Drop sessions whose browser process went away"""
+        for session_id in session_ids:
+            session = self.sessions.pop(session_id, None)
+            if session:
+                recorder = session['broadcaster'].recorder
+                await session['broadcaster'].close('Browser process crashed')
+                if recorder:
+                    await self.recordings.stop(session_id, recorder)
+                session['input'].close()
+                self.metrics.retire(session_id, session['metrics'])
+                logger.error(f"Session {session_id} lost with its browser process")
+        
+    async def shutdown(self):
+        """Close every browser process and Playwright"""
+        if self._reaper:
+            self._reaper.cancel()
+        for session_id, recorder in list(self.recordings.recorders.items()):
+            await self.recordings.stop(session_id, recorder)
+        await self.recordings.close()
+        self.transcoder.close()
+        if self.browser_pool:
+            await self.browser_pool.close()
+        elif self.browser:
+            await self.browser.close()
+        if self.playwright:
+            await self.playwright.stop()
         
     async def get_page_for_session(self, session_id: str) -> Optional[Page]:
         """Get the page instance for a session (for AI agent control)"""
@@ -41,88 +570,86 @@ class BrowserStreamService:
             return session['page']
         return None
     
-    async def create_session(self, session_id: str) -> Page:
-        """Create a new browser session with CDP enabled"""
-        context = await self.browser.new_context(
-            viewport={'width': 1920, 'height': 1080},
-            user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/121.0.0.0'
-        )
-        page = await context.new_page()
+    async def create_session(self, session_id: str, record: Optional[bool] = None) -> Page:
+        """Create a new browser session with CDP enabled
+
+        Recorded sessions (``record``, defaulting to STREAM_RECORD_SESSIONS)
+        write their frames to disk for replay, see session_recorder.py.
+        SessionExistsError if the id is taken; the existing session would
+        otherwise be orphaned with its context, screencast and recorder.
+        """
+        if session_id in self.sessions or session_id in self._creating:
+            raise SessionExistsError(f"Session {session_id} already exists")
+        if record is None:
+            record = self.record_by_default
+        if record:
+            # Reject names that are unusable as a recording directory up front
+            self.recordings.path(session_id)
+
+        # Make room by evicting the least recently used sessions
+        while self.max_sessions and len(self.sessions) >= self.max_sessions:
+            self._evict(self._least_recently_used(), 'max_sessions')
         
-        # Enable CDP session
-        cdp = await page.context.new_cdp_session(page)
+        self._creating.add(session_id)
+        try:
+            if self.browser_pool:
+                # Warm context with page and CDP session already attached, on
+                # the browser process chosen by the placement policy
+                pooled = await self.browser_pool.acquire(session_id)
+            else:
+                context = await self.browser.new_context(**self.CONTEXT_OPTIONS)
+                page = await context.new_page()
+                
+                # Enable CDP session
+                cdp = await page.context.new_cdp_session(page)
+                pooled = PooledContext(context, page, cdp)
+        finally:
+            self._creating.discard(session_id)
         
         # Store session data
         self.sessions[session_id] = {
-            'page': page,
-            'context': context,
-            'cdp': cdp,
+            'page': pooled.page,
+            'context': pooled.context,
+            'cdp': pooled.cdp,
+            'pooled': pooled,
             'created_at': datetime.now(),
+            'last_active': time.monotonic(),
             'frame_count': 0,
-            'active_streams': set()
+            'metrics': self.metrics.session(session_id),
+            'transcoder': self.transcoder
         }
+        self.sessions[session_id]['broadcaster'] = ScreencastBroadcaster(session_id, self.sessions[session_id])
+        self.sessions[session_id]['input'] = InputPipeline(
+            pooled.page, pooled.cdp, self.sessions[session_id]['metrics']
+        )
+        
+        # Navigations by the AI agent count as activity too
+        self.sessions[session_id]['on_navigated'] = lambda frame: self.touch(session_id)
+        pooled.page.on('framenavigated', self.sessions[session_id]['on_navigated'])
+        
+        if record:
+            await self.sessions[session_id]['broadcaster'].start_recording(self.recordings.recorder(session_id))
         
         logger.info(f"Created session: {session_id}")
-        return page
+        return pooled.page
 
-    async def start_frame_capture(self, session_id: str, websocket: WebSocket):
-        """Start capturing and streaming frames for a session"""
+    async def start_frame_capture(self, session_id: str, websocket: WebSocket,
+                                  binary: bool = False, delta: bool = False, layer: str = FULL,
+                                  codec: str = JPEG):
+        """Subscribe a WebSocket to the frames of a session"""
         session = self.sessions.get(session_id)
         if not session:
-            await websocket.send_json({
+            await send_json(websocket, {
                 'type': 'error',
                 'message': f'Session {session_id} not found'
             })
             return
             
-        cdp = session['cdp']
-        session['active_streams'].add(websocket)
-        
         try:
-            # Configure screencast parameters
-            await cdp.send('Page.startScreencast', {
-                'format': 'jpeg',
-                'quality': 70,  # Balance between quality and performance
-                'maxWidth': 1920,
-                'maxHeight': 1080,
-                'everyNthFrame': 2  # Capture every 2nd frame for ~30fps
-            })
-            
-            logger.info(f"Started screencast for session {session_id}")
-            
-            # Set up frame handler
-            async def on_screencast_frame(params):
-                frame_data = {
-                    'type': 'frame',
-                    'data': params['data'],  # Base64 encoded JPEG
-                    'timestamp': datetime.now().isoformat(),
-                    'sessionId': session_id,  # Use our session ID, not CDP's
-                    'frameNumber': session['frame_count']
-                }
-                
-                session['frame_count'] += 1
-                
-                # Send frame to all active streams for this session
-                disconnected = set()
-                for ws in session['active_streams']:
-                    try:
-                        await ws.send_json(frame_data)
-                    except:
-                        disconnected.add(ws)
-                
-                # Remove disconnected streams
-                session['active_streams'] -= disconnected
-                
-                # Acknowledge frame received
-                await cdp.send('Page.screencastFrameAck', {
-                    'sessionId': params['sessionId']
-                })
-            
-            # Register frame handler
-            cdp.on('Page.screencastFrame', on_screencast_frame)
+            await session['broadcaster'].subscribe(websocket, binary=binary, delta=delta, layer=layer, codec=codec)
             
             # Send initial status
-            await websocket.send_json({
+            await send_json(websocket, {
                 'type': 'status',
                 'message': 'Streaming started',
                 'sessionId': session_id
@@ -130,10 +657,62 @@ class BrowserStreamService:
             
         except Exception as e:
             logger.error(f"Error starting screencast: {e}")
-            await websocket.send_json({
+            await send_json(websocket, {
+                'type': 'error',
+                'message': str(e)
+            })
+
+    async def start_ring_capture(self, session_id: str, websocket: WebSocket) -> bool:
+        """Subscribe a fan-out worker to the frame ring of a session"""
+        session = self.sessions.get(session_id)
+        if not session:
+            await send_json(websocket, {
+                'type': 'error',
+                'message': f'Session {session_id} not found'
+            })
+            return False
+            
+        try:
+            await session['broadcaster'].subscribe_ring(websocket, self.ring_slots, self.ring_slot_size)
+            return True
+        except Exception as e:
+            logger.error(f"Error starting frame ring: {e}")
+            await send_json(websocket, {
                 'type': 'error',
                 'message': str(e)
             })
+            return False
+
+    def record_rtt(self, session_id: str, websocket: WebSocket, rtt_ms: float):
+        """Record a viewer's round trip time for adaptive quality"""
+        session = self.sessions.get(session_id)
+        if session:
+            session['broadcaster'].record_rtt(websocket, rtt_ms)
+
+    def request_keyframe(self, session_id: str, websocket: WebSocket):
+        """Ask for a full frame on a delta-encoded stream"""
+        session = self.sessions.get(session_id)
+        if session:
+            session['broadcaster'].request_keyframe(websocket)
+
+    async def set_layer(self, session_id: str, websocket: WebSocket, layer: Optional[str],
+                        codec: Optional[str] = None):
+        """Switch a viewer to another simulcast layer and/or codec"""
+        session = self.sessions.get(session_id)
+        if session:
+            await session['broadcaster'].set_layer(websocket, layer, codec)
+
+    async def set_visibility(self, session_id: str, websocket: WebSocket, visibility: str):
+        """Record whether a viewer is currently showing the stream"""
+        session = self.sessions.get(session_id)
+        if session:
+            await session['broadcaster'].set_visibility(websocket, visibility)
+
+    async def stop_frame_capture(self, session_id: str, websocket: WebSocket):
+        """Unsubscribe a WebSocket from the frames of a session"""
+        session = self.sessions.get(session_id)
+        if session:
+            await session['broadcaster'].unsubscribe(websocket)
 
     async def handle_interaction(self, session_id: str, command: dict):
         """Handle user interactions (click, type, scroll, navigate)"""
@@ -141,59 +720,125 @@ class BrowserStreamService:
         if not session:
             return
             
-        page = session['page']
-        
-        try:
-            if command['type'] == 'click':
-                await page.mouse.click(command['x'], command['y'])
-                logger.info(f"Click at ({command['x']}, {command['y']})")
-                
-            elif command['type'] == 'type':
-                await page.keyboard.type(command['text'])
-                logger.info(f"Typed: {command['text'][:20]}...")
-                
-            elif command['type'] == 'scroll':
-                await page.mouse.wheel(0, command['deltaY'])
-                logger.info(f"Scrolled: {command['deltaY']}")
-                
-            elif command['type'] == 'navigate' or command.get('navigate'):
-                url = command.get('url') or command.get('navigate')
-                await page.goto(url)
-                logger.info(f"Navigated to: {url}")
-                
-        except Exception as e:
-            logger.error(f"Interaction error: {e}")
+        session['last_active'] = time.monotonic()
+        await session['input'].submit(command)
+
+    def queue_interaction(self, session_id: str, command: dict, reply) -> bool:
+        """Queue an interaction for in-order execution and return immediately
+
+        Returns False if the session's input queue is full; KeyError if the
+        session is gone, e.g. stopped, evicted or lost with its browser.
+        """
+        session = self.sessions.get(session_id)
+        if not session:
+            raise KeyError(session_id)
+
+        session['last_active'] = time.monotonic()
+        return session['input'].enqueue(command, reply)
     
     async def stop_session(self, session_id: str):
         """Stop and cleanup a browser session"""
-        session = self.sessions.get(session_id)
+        session = self.sessions.pop(session_id, None)
         if not session:
             return
-            
+        await self._close_session(session_id, session)
+        
+    async def _close_session(self, session_id: str, session: dict, reason: str = 'Session ended'):
         try:
-            # Stop screencast
-            await session['cdp'].send('Page.stopScreencast')
+            # Disconnect viewers, stop screencast, recording and pending input
+            recorder = session['broadcaster'].recorder
+            await session['broadcaster'].close(reason)
+            if recorder:
+                await self.recordings.stop(session_id, recorder)
+            session['input'].close()
+            self.metrics.retire(session_id, session['metrics'])
+            session['page'].remove_listener('framenavigated', session['on_navigated'])
             
-            # Close page and context
-            await session['page'].close()
-            await session['context'].close()
+            # Recycle the context into the pool, or close it
+            if self.browser_pool:
+                await self.browser_pool.release(session_id, session['pooled'])
+            else:
+                await session['page'].close()
+                await session['context'].close()
             
-            # Remove session
-            del self.sessions[session_id]
             logger.info(f"Stopped session: {session_id}")
             
         except Exception as e:
             logger.error(f"Error stopping session: {e}")
+    
+    def touch(self, session_id: str):
+        """Mark a session as active so it is not evicted as idle"""
+        session = self.sessions.get(session_id)
+        if session:
+            session['last_active'] = time.monotonic()
+    
+    def _last_activity(self, session: dict) -> float:
+        if session['broadcaster'].viewers:
+            return time.monotonic()
+        return max(session['last_active'], session['broadcaster'].last_viewer_at)
+    
+    def _least_recently_used(self) -> str:
+        return min(self.sessions, key=lambda sid: self._last_activity(self.sessions[sid]))
+    
+    def _evict(self, session_id: str, reason: str):
+        """Remove a session right away and clean it up in the background"""
+        session = self.sessions.pop(session_id)
+        self.evictions[reason] += 1
+        logger.info(f"Evicting session {session_id} ({reason})")
+        asyncio.create_task(self._close_session(session_id, session, 'Session evicted'))
+    
+    async def _evict_sessions(self):
+        """Evict idle sessions and enforce the memory high-water mark
+
+        Being watched counts as activity: the interaction TTL only runs out
+        for sessions with no visible viewers, e.g. left open in a hidden tab.
+        """
+        while True:
+            await asyncio.sleep(self.eviction_interval)
+            try:
+                await self._evict_pass()
+            except Exception as e:
+                logger.error(f"Error evicting sessions: {e}")
+    
+    async def _evict_pass(self):
+        now = time.monotonic()
+        for session_id, session in list(self.sessions.items()):
+            try:
+                if session['broadcaster'].visible_viewers():
+                    session['last_active'] = now
+                elif self.interaction_ttl and now - session['last_active'] > self.interaction_ttl:
+                    self._evict(session_id, 'interaction_ttl')
+                elif self.viewerless_ttl and now - self._last_activity(session) > self.viewerless_ttl:
+                    self._evict(session_id, 'viewerless_ttl')
+            except Exception as e:
+                # One broken session must not keep the others from being evicted
+                logger.error(f"Error evicting session {session_id}: {e}")
+        
+        # Memory is measured again on the next pass, once the evicted
+        # contexts have actually been closed
+        self.rss_bytes = await asyncio.to_thread(process_tree_rss)
+        if self.memory_high_water and sum(self.rss_bytes) > self.memory_high_water and self.sessions:
+            self._evict(self._least_recently_used(), 'memory')
+    
+    def eviction_stats(self) -> dict:
+        """Resident session count, eviction counters and memory use"""
+        return {
+            'residentSessions': len(self.sessions),
+            'evictions': dict(self.evictions),
+            'rssBytes': self.rss_bytes[0],
+            'browserRssBytes': self.rss_bytes[1]
+        }
 
 # Create global instance
 browser_service = BrowserStreamService()
 
 # FastAPI app setup
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 
-app = FastAPI()
+app = FastAPI(default_response_class=JSONCodecResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -204,9 +849,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# The fan-out link hands out shared-memory ring names and takes input for any
+# session: with STREAM_INTERNAL_TOKEN set, workers must send it in the
+# X-Stream-Internal-Token header; without it only loopback clients may link
+INTERNAL_TOKEN = os.getenv('STREAM_INTERNAL_TOKEN', '')
+LOOPBACK_HOSTS = ('127.0.0.1', '::1', 'localhost')
+
+def internal_client_allowed(websocket: WebSocket) -> bool:
+    if INTERNAL_TOKEN:
+        token = websocket.headers.get('x-stream-internal-token', '')
+        return hmac.compare_digest(token.encode(), INTERNAL_TOKEN.encode())
+    return websocket.client is not None and websocket.client.host in LOOPBACK_HOSTS
+
 class CreateSessionRequest(BaseModel):
     sessionId: str
     url: Optional[str] = "https://www.google.com"
+    record: Optional[bool] = None
 
 class InteractionCommand(BaseModel):
     type: str
@@ -224,23 +882,25 @@ async def startup_event():
 @app.on_event("shutdown")
 async def shutdown_event():
     """Cleanup on shutdown"""
-    if browser_service.browser:
-        await browser_service.browser.close()
-    if browser_service.playwright:
-        await browser_service.playwright.stop()
+    await browser_service.shutdown()
 
 @app.post("/api/browser/create-session")
 async def create_session(request: CreateSessionRequest):
     """Create a new browser session"""
     try:
-        page = await browser_service.create_session(request.sessionId)
+        page = await browser_service.create_session(request.sessionId, record=request.record)
         await page.goto(request.url)
         
+        # Cache a first frame so viewers paint as soon as they connect
+        await browser_service.sessions[request.sessionId]['broadcaster'].capture_still()
+        
         return {
             "sessionId": request.sessionId,
             "status": "created",
             "streamUrl": f"ws://localhost:8002/ws/stream/{request.sessionId}"
         }
+    except SessionExistsError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -250,32 +910,86 @@ async def stop_session(session_id: str):
     await browser_service.stop_session(session_id)
     return {"status": "stopped"}
 
+async def close_session_gone(websocket: WebSocket, session_id: str):
+    """Tell a client its session no longer exists and close the socket"""
+    try:
+        await send_json(websocket, {
+            'type': 'error',
+            'message': f'Session {session_id} not found'
+        })
+        await websocket.close(code=1001, reason='Session not found')
+    except Exception:
+        pass  # Already closed
+
 @app.websocket("/ws/stream/{session_id}")
 async def websocket_stream(websocket: WebSocket, session_id: str):
-    """WebSocket endpoint for browser streaming"""
-    await websocket.accept()
-    logger.info(f"WebSocket connected for session: {session_id}")
+    """WebSocket endpoint for browser streaming
+
+    Frames are sent as JSON text messages by default. Clients that pass
+    ``?format=binary`` or request the ``screencast.binary`` subprotocol get
+    binary messages instead (see screencast_frame.py). ``?encoding=delta``
+    selects binary messages carrying only the changed tiles (see
+    frame_delta.py); such clients send ``{"type": "keyframe"}`` to resync.
+    ``?layer=half`` or ``?layer=thumb`` selects a downscaled simulcast layer
+    and ``?codec=webp`` WebP frames (see simulcast.py); both can be switched
+    later with ``{"type": "layer", "layer": ..., "codec": ...}``.
+    Clients send ``{"type": "visibility", "state": "hidden"}`` (or ``paused``)
+    while nobody can see the stream and ``"visible"`` when they are back.
+
+    Interactions are queued and applied in order while this loop keeps
+    reading, so pings are answered during slow navigations. Interactions
+    with a ``seq`` number are acknowledged with batched ``{"type": "ack"}``
+    messages carrying the highest applied ``seq``.
+    """
+    subprotocol = BINARY_SUBPROTOCOL if BINARY_SUBPROTOCOL in websocket.scope.get('subprotocols', []) else None
+    delta = websocket.query_params.get('encoding') == 'delta'
+    binary = delta or subprotocol is not None or websocket.query_params.get('format') == 'binary'
+    layer = websocket.query_params.get('layer', FULL)
+    codec = websocket.query_params.get('codec', JPEG)
+    reply = partial(send_json, websocket)  # One callable per socket, see InputPipeline.forget
+    await websocket.accept(subprotocol=subprotocol)
+    logger.info(f"WebSocket connected for session: {session_id} ({'delta' if delta else 'binary' if binary else 'json'}, {layer}, {codec})")
     
     try:
         # Start frame capture
-        await browser_service.start_frame_capture(session_id, websocket)
+        await browser_service.start_frame_capture(session_id, websocket, binary=binary, delta=delta,
+                                                  layer=layer, codec=codec)
         
         # Handle incoming commands
         while True:
             try:
-                data = await websocket.receive_json()
+                data = await receive_json(websocket)
                 
                 if data.get('type') == 'interaction':
-                    await browser_service.handle_interaction(session_id, data)
+                    if not browser_service.queue_interaction(session_id, data, reply):
+                        await send_json(websocket, {
+                            'type': 'error',
+                            'message': 'Input queue full',
+                            'seq': data.get('seq')
+                        })
                 elif data.get('type') == 'ping':
-                    await websocket.send_json({'type': 'pong'})
+                    # Clients may report the RTT measured on their previous
+                    # ping and get their timestamp echoed back to measure the next
+                    if isinstance(data.get('rtt'), (int, float)):
+                        browser_service.record_rtt(session_id, websocket, data['rtt'])
+                    await send_json(websocket, {'type': 'pong', 'timestamp': data.get('timestamp')})
+                elif data.get('type') == 'keyframe':
+                    browser_service.request_keyframe(session_id, websocket)
+                elif data.get('type') == 'layer':
+                    await browser_service.set_layer(session_id, websocket, data.get('layer'), data.get('codec'))
+                elif data.get('type') == 'visibility':
+                    await browser_service.set_visibility(session_id, websocket, data.get('state'))
                     
             except WebSocketDisconnect:
                 logger.info(f"WebSocket disconnected for session: {session_id}")
                 break
+            except KeyError:
+                # Input for a session that no longer exists; retrying will not help
+                await close_session_gone(websocket, session_id)
+                break
             except Exception as e:
                 logger.error(f"WebSocket error: {e}")
-                await websocket.send_json({
+                await send_json(websocket, {
                     'type': 'error',
                     'message': str(e)
                 })
@@ -283,24 +997,177 @@ async def websocket_stream(websocket: WebSocket, session_id: str):
     finally:
         # Remove from active streams
         session = browser_service.sessions.get(session_id)
-        if session and websocket in session['active_streams']:
-            session['active_streams'].remove(websocket)
+        if session:
+            session['input'].forget(reply)
+        await browser_service.stop_frame_capture(session_id, websocket)
+
+@app.websocket("/internal/ring/{session_id}")
+async def websocket_ring(websocket: WebSocket, session_id: str):
+    """Link from a fan-out worker (see stream_fanout_worker.py)
+
+    The worker is first told the name of the session's shared-memory frame
+    ring and then gets a ``{"type": "frame", "seq": n}`` doorbell when new
+    frames are in it. It relays its viewers' interactions over the same
+    socket and receives their acks, and reports ``{"type": "visibility"}``
+    as hidden while none of its viewers are visible. Refused unless the
+    worker has the internal token, or connects over loopback when none is
+    configured.
+    """
+    if not internal_client_allowed(websocket):
+        logger.warning(f"Refused fan-out link to session {session_id} from {websocket.client}")
+        await websocket.close(code=1008)
+        return
+    reply = partial(send_json, websocket)
+    await websocket.accept()
+    if not await browser_service.start_ring_capture(session_id, websocket):
+        await websocket.close()
+        return
+    logger.info(f"Fan-out worker linked to session: {session_id}")
+    
+    try:
+        while True:
+            data = await receive_json(websocket)
+            if data.get('type') == 'interaction':
+                if not browser_service.queue_interaction(session_id, data, reply):
+                    await send_json(websocket, {
+                        'type': 'error',
+                        'message': 'Input queue full',
+                        'seq': data.get('seq')
+                    })
+            elif data.get('type') == 'visibility':
+                await browser_service.set_visibility(session_id, websocket, data.get('state'))
+    except WebSocketDisconnect:
+        logger.info(f"Fan-out worker unlinked from session: {session_id}")
+    except KeyError:
+        await close_session_gone(websocket, session_id)
+    finally:
+        session = browser_service.sessions.get(session_id)
+        if session:
+            session['input'].forget(reply)
+        await browser_service.stop_frame_capture(session_id, websocket)
 
 @app.get("/api/browser/sessions")
 async def list_sessions():
     """List active browser sessions"""
     return {
+        "browserPool": browser_service.browser_pool.stats() if browser_service.browser_pool else None,
+        "eviction": browser_service.eviction_stats(),
+        "transcoder": browser_service.transcoder.stats(),
         "sessions": [
             {
                 "sessionId": sid,
                 "createdAt": session['created_at'].isoformat(),
+                "browser": browser_service.browser_pool.placement_of(sid) if browser_service.browser_pool else None,
                 "frameCount": session['frame_count'],
-                "activeStreams": len(session['active_streams'])
+                "framesSuppressed": session['broadcaster'].deduplicator.suppressed,
+                "input": session['input'].stats(),
+                "activeStreams": len(session['broadcaster'].viewers),
+                "streaming": session['broadcaster'].streaming,
+                "screencast": session['broadcaster'].screencast_params(),
+                "simulcast": session['broadcaster'].simulcast.stats(),
+                "viewers": [viewer.stats() for viewer in session['broadcaster'].viewers.values()]
             }
             for sid, session in browser_service.sessions.items()
         ]
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics for the stream hot paths"""
+    own_rss, children_rss = await asyncio.to_thread(process_tree_rss)
+    session_gauges = {
+        sid: {
+            'stream_session_viewers': len(session['broadcaster'].viewers),
+            'stream_session_visible_viewers': len(session['broadcaster'].visible_viewers()),
+            'stream_session_viewer_queue_depth': sum(
+                viewer.queue.qsize() for viewer in session['broadcaster'].viewers.values()
+            ),
+            'stream_session_input_queue_depth': session['input'].stats()['queued'],
+            'stream_session_interaction_to_frame_seconds': session['input'].interaction_to_frame_ms / 1000
+        }
+        for sid, session in browser_service.sessions.items()
+    }
+    body = browser_service.metrics.render(time.monotonic(), session_gauges, {
+        'stream_sessions': ("Resident stream sessions", len(browser_service.sessions)),
+        'stream_transcode_pending': ("Frames being transcoded or waiting for a transcode worker",
+                                     browser_service.transcoder.pending),
+        'stream_process_rss_bytes': ("Resident memory of the stream service", own_rss),
+        'stream_chromium_rss_bytes': ("Resident memory of the Chromium processes", children_rss)
+    })
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@app.get("/api/browser/recordings")
+async def list_recordings():
+    """List session recordings on disk"""
+    return {
+        "recordings": await asyncio.to_thread(browser_service.recordings.list),
+        "store": browser_service.recordings.stats()
+    }
+
+@app.get("/api/browser/recordings/{session_id}/frame")
+async def recording_frame(session_id: str, t: Optional[float] = None):
+    """The recorded frame that was on screen at epoch time ``t`` (default: latest)"""
+    try:
+        timestamp, width, height, jpeg = await asyncio.to_thread(
+            browser_service.recordings.frame_at, session_id, t
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return Response(content=jpeg, media_type="image/jpeg", headers={
+        "X-Frame-Timestamp": str(timestamp),
+        "X-Frame-Size": f"{width}x{height}"
+    })
+
+@app.websocket("/ws/replay/{session_id}")
+async def websocket_replay(websocket: WebSocket, session_id: str):
+    """Replay a recording as binary frames (see screencast_frame.py)
+
+    ``?t=`` is the epoch time to start from (default: the beginning) and
+    ``?speed=`` the playback rate. Frames are paced by their recorded
+    timestamps and a ``{"type": "end"}`` message follows the last one.
+    """
+    await websocket.accept()
+    try:
+        speed = float(websocket.query_params.get('speed', 1))
+        start = websocket.query_params.get('t')
+        start = None if start is None else float(start)
+        if not (0 < speed < math.inf) or (start is not None and not math.isfinite(start)):
+            raise ValueError("speed must be positive and t a finite time")
+        reader = await asyncio.to_thread(browser_service.recordings.open, session_id)
+    except (KeyError, ValueError) as e:
+        await send_json(websocket, {'type': 'error', 'message': str(e)})
+        await websocket.close(code=1008)
+        return
+
+    try:
+        position = reader.seek(reader.start if start is None else start)
+    except KeyError as e:
+        reader.close()
+        await send_json(websocket, {'type': 'error', 'message': str(e)})
+        await websocket.close(code=1008)
+        return
+    frames = 0
+    first_timestamp = None
+    started = time.perf_counter()
+    try:
+        while position is not None:
+            timestamp, width, height, jpeg = await asyncio.to_thread(reader.frame, position)
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            delay = (timestamp - first_timestamp) / speed - (time.perf_counter() - started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await websocket.send_bytes(pack_frame(FRAME_KIND_JPEG, frames, timestamp, width, height, jpeg))
+            frames += 1
+            position = reader.next_position(position)
+        await send_json(websocket, {'type': 'end', 'frames': frames})
+    except WebSocketDisconnect:
+        logger.info(f"Replay of {session_id} disconnected after {frames} frames")
+    finally:
+        reader.close()
+
 if __name__ == "__main__":
     # Run with a different port to avoid conflict
     uvicorn.run(app, host="0.0.0.0", port=8002)
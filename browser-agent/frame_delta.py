@@ -0,0 +1,128 @@
+"""
+Frame Delta - Tile-based delta encoding for the binary screencast transport
+
+A delta message uses the regular binary frame header with kind
+FRAME_KIND_DELTA, followed by a tile count and the changed regions:
+
+    !H                  tile count
+    !HHHHI + JPEG       x, y, width, height, JPEG length, then the JPEG bytes
+
+Regions are runs of adjacent changed tiles on one tile row, re-encoded as
+JPEG. Keyframes are sent as regular FRAME_KIND_JPEG messages.
+"""
+import io
+import struct
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image
+
+from screencast_frame import FRAME_KIND_DELTA, FRAME_KIND_JPEG, ScreencastFrame, pack_frame
+
+TILE_COUNT = struct.Struct('!H')
+TILE_HEADER = struct.Struct('!HHHHI')
+
+
+def decode_frame(frame: ScreencastFrame) -> np.ndarray:
+    """Decode a frame's JPEG into an RGB array"""
+    with Image.open(io.BytesIO(frame.jpeg)) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def changed_tiles(current: np.ndarray, reference: np.ndarray,
+                  tile_size: int, threshold: int) -> np.ndarray:
+    """Boolean grid (rows x cols) of tiles that differ beyond the threshold"""
+    height, width = current.shape[:2]
+    diff = np.abs(current.astype(np.int16) - reference.astype(np.int16)).max(axis=2) > threshold
+    rows = -(-height // tile_size)
+    cols = -(-width // tile_size)
+    padded = np.zeros((rows * tile_size, cols * tile_size), dtype=bool)
+    padded[:height, :width] = diff
+    return padded.reshape(rows, tile_size, cols, tile_size).any(axis=(1, 3))
+
+
+def tile_regions(grid: np.ndarray, tile_size: int, width: int, height: int) -> List[Tuple[int, int, int, int]]:
+    """Merge changed tiles into horizontal runs of (x, y, width, height)"""
+    regions = []
+    for row, col_start, col_end in _runs(grid):
+        x = col_start * tile_size
+        y = row * tile_size
+        regions.append((x, y, min(col_end * tile_size, width) - x, min(tile_size, height - y)))
+    return regions
+
+
+def _runs(grid: np.ndarray):
+    for row in range(grid.shape[0]):
+        cols = np.flatnonzero(grid[row])
+        if cols.size == 0:
+            continue
+        # Split the changed columns wherever they stop being consecutive
+        breaks = np.flatnonzero(np.diff(cols) > 1) + 1
+        for run in np.split(cols, breaks):
+            yield row, int(run[0]), int(run[-1]) + 1
+
+
+class TileDeltaEncoder:
+    """Per-viewer encoder that sends only the tiles changed since the last frame
+
+    The reference is the last frame delivered to this viewer, so tiles are
+    diffed against exactly what the viewer shows. A keyframe (the untouched
+    CDP JPEG) is sent first, every ``keyframe_interval`` frames, whenever
+    the frame size changes, when most tiles changed anyway, or on request.
+    """
+
+    def __init__(self, tile_size: int = 64, quality: int = 70, keyframe_interval: int = 120,
+                 threshold: int = 8, max_changed_ratio: float = 0.5):
+        self.tile_size = tile_size
+        self.quality = quality
+        self.keyframe_interval = keyframe_interval
+        self.threshold = threshold
+        self.max_changed_ratio = max_changed_ratio
+        self.keyframes = 0
+        self.deltas = 0
+        self._reference = None
+        self._since_keyframe = 0
+        self._keyframe_requested = False
+
+    def force_keyframe(self):
+        """Make the next encoded frame a keyframe"""
+        self._keyframe_requested = True
+
+    def encode(self, frame: ScreencastFrame) -> bytes:
+        """Encode a frame as a keyframe or delta message (blocking; run off-loop)"""
+        current = decode_frame(frame)
+        reference = self._reference
+        if (reference is None or reference.shape != current.shape or self._keyframe_requested
+                or self._since_keyframe >= self.keyframe_interval):
+            return self._keyframe(frame, current)
+
+        grid = changed_tiles(current, reference, self.tile_size, self.threshold)
+        if grid.mean() > self.max_changed_ratio:
+            return self._keyframe(frame, current)
+
+        height, width = current.shape[:2]
+        regions = tile_regions(grid, self.tile_size, width, height)
+        parts = [TILE_COUNT.pack(len(regions))]
+        for x, y, w, h in regions:
+            buffer = io.BytesIO()
+            Image.fromarray(current[y:y + h, x:x + w]).save(buffer, format='JPEG', quality=self.quality)
+            tile = buffer.getvalue()
+            parts.append(TILE_HEADER.pack(x, y, w, h, len(tile)))
+            parts.append(tile)
+            # Only the sent tiles change what the viewer shows; anything under
+            # the threshold keeps accumulating until it is sent
+            reference[y:y + h, x:x + w] = current[y:y + h, x:x + w]
+
+        self._since_keyframe += 1
+        self.deltas += 1
+        return pack_frame(FRAME_KIND_DELTA, frame.frame_number, frame.timestamp,
+                          width, height, b''.join(parts))
+
+    def _keyframe(self, frame: ScreencastFrame, current: np.ndarray) -> bytes:
+        self._reference = current.copy()
+        self._keyframe_requested = False
+        self._since_keyframe = 0
+        self.keyframes += 1
+        height, width = current.shape[:2]
+        return pack_frame(FRAME_KIND_JPEG, frame.frame_number, frame.timestamp,
+                          width, height, frame.jpeg)
@@ -0,0 +1,116 @@
+"""
+Frame Ring - Shared-memory ring of encoded frames for out-of-process viewers
+"""
+import logging
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Layout: RING_HEADER, then ``slots`` slots of SLOT_HEADER + ``slot_size``
+# payload bytes. Sequence numbers start at 1; frame N lives in slot
+# (N - 1) % slots. A slot's sequence is zeroed while it is being rewritten,
+# so readers detect frames that were overwritten under them (a seqlock).
+RING_MAGIC = b'SRNG'
+RING_VERSION = 1
+RING_HEADER = struct.Struct('!4sHHIIQ')  # magic, version, unused, slots, slot size, last sequence
+SLOT_HEADER = struct.Struct('!QI')  # sequence, payload length
+SEQUENCE = struct.Struct('!Q')
+LAST_SEQUENCE_OFFSET = RING_HEADER.size - SEQUENCE.size
+
+
+class FrameRing:
+    """Single-writer ring buffer of binary frame messages in shared memory
+
+    The capture process creates the ring and writes every frame once; any
+    number of reader processes attach by name and pick up the latest frame.
+    """
+
+    def __init__(self, memory: shared_memory.SharedMemory, owner: bool):
+        self.memory = memory
+        self.owner = owner
+        magic, version, _, self.slots, self.slot_size, _ = RING_HEADER.unpack_from(memory.buf)
+        if magic != RING_MAGIC or version != RING_VERSION:
+            raise ValueError(f"{memory.name} is not a version {RING_VERSION} frame ring")
+        self.stride = SLOT_HEADER.size + self.slot_size
+        self.skipped = 0  # Frames too large for a slot
+
+    @classmethod
+    def create(cls, name: str, slots: int = 8, slot_size: int = 2 * 1024 * 1024) -> 'FrameRing':
+        size = RING_HEADER.size + slots * (SLOT_HEADER.size + slot_size)
+        memory = shared_memory.SharedMemory(name=name, create=True, size=size)
+        RING_HEADER.pack_into(memory.buf, 0, RING_MAGIC, RING_VERSION, 0, slots, slot_size, 0)
+        return cls(memory, owner=True)
+
+    @classmethod
+    def attach(cls, name: str) -> 'FrameRing':
+        try:
+            memory = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13 attaching registers the segment with this
+            # process's resource tracker, which would unlink it on exit
+            memory = shared_memory.SharedMemory(name=name)
+            resource_tracker.unregister(memory._name, 'shared_memory')
+        return cls(memory, owner=False)
+
+    @property
+    def name(self) -> str:
+        return self.memory.name
+
+    @property
+    def sequence(self) -> int:
+        """Sequence number of the last frame written"""
+        return SEQUENCE.unpack_from(self.memory.buf, LAST_SEQUENCE_OFFSET)[0]
+
+    def write(self, message: bytes) -> int:
+        """Append a frame and return its sequence number, 0 if it did not fit"""
+        if len(message) > self.slot_size:
+            self.skipped += 1
+            logger.warning(f"Frame of {len(message)} bytes exceeds ring slot size {self.slot_size}")
+            return 0
+        sequence = self.sequence + 1
+        offset = RING_HEADER.size + (sequence - 1) % self.slots * self.stride
+        buf = self.memory.buf
+        SEQUENCE.pack_into(buf, offset, 0)
+        buf[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + len(message)] = message
+        SLOT_HEADER.pack_into(buf, offset, sequence, len(message))
+        SEQUENCE.pack_into(buf, LAST_SEQUENCE_OFFSET, sequence)
+        return sequence
+
+    def read(self, sequence: Optional[int] = None) -> Optional[Tuple[int, bytes]]:
+        """Copy out a frame (default: the latest) as ``(sequence, message)``
+
+        Returns None if the frame has been overwritten, including while it
+        was being copied.
+        """
+        if sequence is None:
+            sequence = self.sequence
+        if sequence == 0:
+            return None
+        offset = RING_HEADER.size + (sequence - 1) % self.slots * self.stride
+        buf = self.memory.buf
+        written, length = SLOT_HEADER.unpack_from(buf, offset)
+        if written != sequence:
+            return None
+        message = bytes(buf[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + length])
+        if SEQUENCE.unpack_from(buf, offset)[0] != sequence:
+            return None
+        return sequence, message
+
+    def read_latest(self, attempts: int = 3) -> Optional[Tuple[int, bytes]]:
+        """The newest frame, retrying if the writer laps the reader"""
+        for _ in range(attempts):
+            result = self.read()
+            if result is not None or self.sequence == 0:
+                return result
+        return None
+
+    def close(self):
+        """Detach, and remove the ring if this process created it"""
+        self.memory.close()
+        if self.owner:
+            try:
+                self.memory.unlink()
+            except FileNotFoundError:
+                pass
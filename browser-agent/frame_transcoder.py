@@ -0,0 +1,127 @@
+"""
+Frame Transcoder - Resizes and re-encodes screencast frames off the event loop
+
+Decoding and encoding a 1080p JPEG takes tens of milliseconds of CPU; done
+on the event loop it would hold up every socket and CDP message of the
+process. TranscodePool runs that work in a thread pool (Pillow releases the
+GIL while it codes) or, with ``processes=True``, a process pool, and turns
+work away once ``max_pending`` jobs are in flight so callers skip a frame
+instead of queueing behind a backlog.
+"""
+import asyncio
+import io
+import logging
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from screencast_frame import FRAME_KIND_JPEG, FRAME_KIND_WEBP, ScreencastFrame, pack_frame
+
+logger = logging.getLogger(__name__)
+
+# Output codecs: name -> (binary frame kind, Pillow format)
+CODECS = {
+    'jpeg': (FRAME_KIND_JPEG, 'JPEG'),
+    'webp': (FRAME_KIND_WEBP, 'WEBP'),
+}
+
+
+def transcode_image(image: bytes, max_width: int, max_height: int, quality: int,
+                    codec: str) -> Tuple[int, int, bytes]:
+    """Fit an encoded image into max_width x max_height and re-encode it
+
+    Blocking, and picklable for process pools. JPEG draft mode lets libjpeg
+    decode straight at 1/2, 1/4 or 1/8 scale, so small outputs never pay for
+    a full-resolution decode.
+    """
+    # Optional dependency, only needed once frames are transcoded
+    from PIL import Image
+
+    with Image.open(io.BytesIO(image)) as source:
+        scale = min(max_width / source.width, max_height / source.height, 1.0)
+        size = (max(int(source.width * scale), 1), max(int(source.height * scale), 1))
+        source.draft('RGB', size)
+        decoded = source.convert('RGB')
+    if decoded.size != size:
+        decoded = decoded.resize(size, Image.BILINEAR)
+    output = io.BytesIO()
+    # method=0 is libwebp's fastest setting, the right trade for live frames
+    decoded.save(output, format=CODECS[codec][1], quality=quality, method=0)
+    return size[0], size[1], output.getvalue()
+
+
+class TranscodePool:
+    """Bounded pool for blocking frame work, shared by all sessions
+
+    ``submit`` never blocks: when ``max_pending`` jobs are already running
+    or queued it returns None and counts the frame as skipped, the same
+    latest-frame-wins policy as the viewer queues.
+    """
+
+    def __init__(self, workers: int = 2, processes: bool = False, max_pending: int = 0):
+        self.workers = max(workers, 1)
+        self.processes = processes
+        self.max_pending = max_pending or self.workers * 2
+        self.pending = 0
+        self.completed = 0
+        self.skipped = 0
+        self.failed = 0
+        self._executor: Optional[Executor] = None
+
+    def submit(self, function, *args, skippable: bool = True) -> Optional[asyncio.Future]:
+        """Run ``function(*args)`` in the pool, or return None if it is saturated
+
+        Work that must not be dropped (e.g. the first frame for a new
+        viewer) passes ``skippable=False`` to go past the limit.
+        """
+        if skippable and self.pending >= self.max_pending:
+            self.skipped += 1
+            return None
+        if self._executor is None:
+            if self.processes:
+                # Spawned, not forked: this process runs an event loop and threads
+                self._executor = ProcessPoolExecutor(self.workers, multiprocessing.get_context('spawn'))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='transcode')
+        self.pending += 1
+        future = asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    async def transcode(self, frame: ScreencastFrame, max_width: int, max_height: int, quality: int,
+                        codec: str = 'jpeg', skippable: bool = True) -> Optional[ScreencastFrame]:
+        """``frame`` resized and re-encoded, None if skipped or failed"""
+        future = self.submit(transcode_image, frame.jpeg, max_width, max_height, quality, codec,
+                             skippable=skippable)
+        if future is None:
+            return None
+        try:
+            width, height, image = await future
+        except Exception as e:
+            logger.error(f"Error transcoding frame {frame.frame_number} to {codec}: {e}")
+            return None
+        return ScreencastFrame.from_binary(frame.session_id, pack_frame(
+            CODECS[codec][0], frame.frame_number, frame.timestamp, width, height, image
+        ))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            'workers': self.workers,
+            'processes': self.processes,
+            'pending': self.pending,
+            'completed': self.completed,
+            'skipped': self.skipped,
+            'failed': self.failed
+        }
+
+    def _done(self, future: asyncio.Future):
+        self.pending -= 1
+        if future.cancelled() or future.exception() is not None:
+            self.failed += 1
+        else:
+            self.completed += 1
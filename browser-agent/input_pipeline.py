@@ -0,0 +1,322 @@
+"""
+Input Pipeline - Coalesced, ordered dispatch of viewer input to a stream session
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from playwright.async_api import CDPSession, Page
+
+from stream_metrics import SessionMetrics
+
+logger = logging.getLogger(__name__)
+
+# Actions whose consecutive occurrences can be merged into one dispatch
+COALESCED_ACTIONS = ('scroll', 'move', 'type')
+
+Reply = Callable[[dict], Awaitable[Any]]
+
+# Key names keydown handlers send as ``text``; any other text is typed as is
+NAMED_KEYS = frozenset({
+    'Enter', 'Tab', 'Backspace', 'Delete', 'Escape', 'Insert', 'Home', 'End',
+    'PageUp', 'PageDown', 'ArrowUp', 'ArrowDown', 'ArrowLeft', 'ArrowRight',
+    *(f'F{number}' for number in range(1, 13))
+})
+MODIFIER_KEYS = ('Shift', 'Control', 'Alt', 'Meta')
+
+
+class _Ticket:
+    """Bookkeeping for one sequenced command until it has been acked"""
+
+    __slots__ = ('reply', 'seq', 'received_at', 'started_at', 'applied_at')
+
+    def __init__(self, reply: Reply, seq: int, received_at: float):
+        self.reply = reply
+        self.seq = seq
+        self.received_at = received_at
+        self.started_at = received_at
+        self.applied_at = received_at
+
+
+def interaction_action(command: dict) -> Optional[str]:
+    """Work out what an interaction message asks for
+
+    Clients either name the action in ``type`` (click, type, scroll, move,
+    press, navigate) or send ``{"type": "interaction", ...}`` and let the
+    fields speak: ``navigate``/``url``, ``x``/``y``, ``text`` or ``deltaY``.
+    """
+    action = command.get('type')
+    if action in ('click', 'type', 'scroll', 'move', 'press', 'navigate'):
+        return action
+    if command.get('navigate') or command.get('url'):
+        return 'navigate'
+    if command.get('deltaY') is not None or command.get('deltaX') is not None:
+        return 'scroll'
+    if command.get('x') is not None and command.get('y') is not None:
+        return 'click'
+    if command.get('text') is not None:
+        return 'type'
+    return None
+
+
+def is_named_key(text: str) -> bool:
+    """Whether ``text`` is a key name like "Enter" or "Control+ArrowLeft" rather than text"""
+    if len(text) < 2:
+        return False
+    *modifiers, key = text.split('+')
+    if not all(modifier in MODIFIER_KEYS for modifier in modifiers):
+        return False
+    return key in NAMED_KEYS or (len(key) == 1 and bool(modifiers))
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_valid(action: str, command: dict) -> bool:
+    """Whether ``command`` carries the fields ``action`` needs"""
+    if action in ('click', 'move'):
+        return _is_number(command.get('x')) and _is_number(command.get('y'))
+    if action == 'type':
+        return isinstance(command.get('text'), str)
+    if action == 'press':
+        return isinstance(command.get('key') or command.get('text'), str)
+    if action == 'navigate':
+        return isinstance(command.get('url') or command.get('navigate'), str)
+    return all(command.get(field) is None or _is_number(command[field]) for field in ('deltaX', 'deltaY'))
+
+
+class InputPipeline:
+    """Per-session input dispatcher that coalesces high-rate events
+
+    Scroll deltas, mouse moves and typed text are held for at most one
+    animation frame and merged with the events of the same kind that follow
+    them, so a trackpad fling becomes one ``mouse.wheel`` per frame and typed
+    text goes out through a single CDP ``Input.insertText``. Clicks, named
+    keys and navigations flush whatever is pending first, so the page always
+    sees input in the order it was sent.
+
+    Viewers can also ``enqueue`` commands: they are executed one after the
+    other by a worker task, so a slow navigation does not hold up the socket
+    reader. Commands carrying a client ``seq`` are acknowledged once their
+    input has reached the page, in batches of at most ``ACK_INTERVAL``.
+    """
+
+    FRAME_INTERVAL = 1 / 60
+    ACK_INTERVAL = 0.02
+    QUEUE_LIMIT = 256
+
+    def __init__(self, page: Page, cdp: CDPSession, metrics: Optional[SessionMetrics] = None):
+        self.page = page
+        self.cdp = cdp
+        self.metrics = metrics
+        self.events = 0
+        self.dispatches = 0
+        self.interaction_to_frame_ms = 0.0
+        self._pending: List[list] = []  # [action, value, tickets, first arrival] in arrival order
+        self._pending_since: Optional[float] = None  # Oldest input not yet on screen
+        self._flush_timer: Optional[asyncio.TimerHandle] = None
+        self._lock = asyncio.Lock()
+        self._commands: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_LIMIT)
+        self._worker: Optional[asyncio.Task] = None
+        self._applied: Dict[Reply, List[_Ticket]] = {}
+        self._ack_timer: Optional[asyncio.TimerHandle] = None
+        self.acks_sent = 0
+
+    def enqueue(self, command: dict, reply: Reply) -> bool:
+        """Queue a command for in-order execution without waiting for it
+
+        ``reply`` sends a message back to the viewer that issued the command
+        (e.g. ``partial(send_json, websocket)``). Returns False if the queue is full.
+        """
+        try:
+            self._commands.put_nowait((command, reply, time.perf_counter()))
+        except asyncio.QueueFull:
+            return False
+        if self._worker is None:
+            self._worker = asyncio.create_task(self._run())
+        return True
+
+    async def submit(self, command: dict, ticket: Optional[_Ticket] = None):
+        """Queue or dispatch one interaction message"""
+        action = interaction_action(command)
+        if action is not None and not is_valid(action, command):
+            logger.warning(f"Dropping malformed {action} interaction: {command}")
+            action = None
+        if action is None:
+            self._applied_now(ticket)
+            return
+        self.events += 1
+        if self.metrics:
+            self.metrics.interactions += 1
+        received_at = ticket.received_at if ticket else time.perf_counter()
+        if self._pending_since is None:
+            self._pending_since = time.perf_counter()
+
+        if action == 'type' and command.get('type') == 'interaction' and is_named_key(command['text']):
+            # Named keys from keydown handlers, e.g. "Enter" or "Backspace"
+            action, command = 'press', {'key': command['text']}
+
+        if action in COALESCED_ACTIONS:
+            self._coalesce(action, command, ticket, received_at)
+            if self._flush_timer is None:
+                self._flush_timer = asyncio.get_running_loop().call_later(
+                    self.FRAME_INTERVAL, lambda: asyncio.create_task(self.flush())
+                )
+            return
+
+        async with self._lock:
+            await self._dispatch_pending()
+            await self._dispatch(action, command)
+        self._observe(received_at)
+        self._applied_now(ticket)
+
+    async def flush(self):
+        """Dispatch everything that is being coalesced"""
+        async with self._lock:
+            await self._dispatch_pending()
+
+    def frame_rendered(self):
+        """Called for each changed screencast frame to sample input-to-frame latency"""
+        if self._pending_since is None or self._pending:
+            return
+        latency = (time.perf_counter() - self._pending_since) * 1000
+        self._pending_since = None
+        if self.interaction_to_frame_ms == 0:
+            self.interaction_to_frame_ms = latency
+        else:
+            self.interaction_to_frame_ms += 0.2 * (latency - self.interaction_to_frame_ms)
+
+    def close(self):
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        if self._ack_timer:
+            self._ack_timer.cancel()
+            self._ack_timer = None
+        if self._worker:
+            self._worker.cancel()
+            self._worker = None
+
+    def forget(self, reply: Reply):
+        """Stop acknowledging commands for a viewer that has disconnected"""
+        self._applied.pop(reply, None)
+
+    def stats(self) -> dict:
+        return {
+            'events': self.events,
+            'dispatches': self.dispatches,
+            'queued': self._commands.qsize(),
+            'acksSent': self.acks_sent,
+            'interactionToFrameMs': round(self.interaction_to_frame_ms, 1)
+        }
+
+    async def _run(self):
+        while True:
+            command, reply, received_at = await self._commands.get()
+            seq = command.get('seq')
+            ticket = _Ticket(reply, seq, received_at) if isinstance(seq, int) else None
+            if ticket:
+                ticket.started_at = time.perf_counter()
+            try:
+                await self.submit(command, ticket)
+            except Exception as e:
+                logger.error(f"Error applying queued interaction: {e}")
+                self._applied_now(ticket)
+
+    def _coalesce(self, action: str, command: dict, ticket: Optional[_Ticket], received_at: float):
+        last = self._pending[-1] if self._pending else None
+        if action == 'scroll':
+            delta = [float(command.get('deltaX') or 0), float(command.get('deltaY') or 0)]
+            if last and last[0] == 'scroll':
+                last[1][0] += delta[0]
+                last[1][1] += delta[1]
+            else:
+                last = ['scroll', delta, [], received_at]
+                self._pending.append(last)
+        elif action == 'move':
+            # Only the latest pointer position matters
+            if last and last[0] == 'move':
+                last[1] = (command['x'], command['y'])
+            else:
+                last = ['move', (command['x'], command['y']), [], received_at]
+                self._pending.append(last)
+        else:
+            if last and last[0] == 'type':
+                last[1] += command['text']
+            else:
+                last = ['type', command['text'], [], received_at]
+                self._pending.append(last)
+        if ticket:
+            last[2].append(ticket)
+
+    def _observe(self, received_at: float):
+        if self.metrics:
+            self.metrics.interaction_seconds.observe(time.perf_counter() - received_at)
+
+    def _applied_now(self, ticket: Optional[_Ticket]):
+        if ticket is None:
+            return
+        ticket.applied_at = time.perf_counter()
+        self._applied.setdefault(ticket.reply, []).append(ticket)
+        if self._ack_timer is None:
+            self._ack_timer = asyncio.get_running_loop().call_later(
+                self.ACK_INTERVAL, lambda: asyncio.create_task(self._send_acks())
+            )
+
+    async def _send_acks(self):
+        self._ack_timer = None
+        applied, self._applied = self._applied, {}
+        for reply, tickets in applied.items():
+            last = max(tickets, key=lambda ticket: ticket.seq)
+            try:
+                await reply({
+                    'type': 'ack',
+                    'seq': last.seq,
+                    'count': len(tickets),
+                    'queuedMs': round((last.started_at - last.received_at) * 1000, 1),
+                    'appliedMs': round((last.applied_at - last.received_at) * 1000, 1)
+                })
+                self.acks_sent += 1
+            except Exception as e:
+                logger.error(f"Error sending input ack: {e}")
+
+    async def _dispatch_pending(self):
+        if self._flush_timer:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        pending, self._pending = self._pending, []
+        for action, value, tickets, received_at in pending:
+            try:
+                if action == 'scroll':
+                    await self.page.mouse.wheel(value[0], value[1])
+                elif action == 'move':
+                    await self.page.mouse.move(value[0], value[1])
+                else:
+                    await self.cdp.send('Input.insertText', {'text': value})
+                self.dispatches += 1
+            except Exception as e:
+                logger.error(f"Interaction error ({action}): {e}")
+            self._observe(received_at)
+            for ticket in tickets:
+                self._applied_now(ticket)
+
+    async def _dispatch(self, action: str, command: dict):
+        page = self.page
+        try:
+            if action == 'click':
+                await page.mouse.click(command['x'], command['y'])
+                logger.info(f"Click at ({command['x']}, {command['y']})")
+
+            elif action == 'press':
+                await page.keyboard.press(command.get('key') or command.get('text'))
+
+            elif action == 'navigate':
+                url = command.get('url') or command.get('navigate')
+                await page.goto(url)
+                logger.info(f"Navigated to: {url}")
+
+            self.dispatches += 1
+        except Exception as e:
+            logger.error(f"Interaction error: {e}")
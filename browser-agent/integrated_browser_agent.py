@@ -7,6 +7,8 @@ from typing import Optional, Dict, Any
 import aiohttp
 from datetime import datetime
 
+from json_codec import send_json
+from research_events import close_on_disconnect, research_events, resume_offset
 from streaming_browser_agent import StreamingBrowserAgent
 
 logger = logging.getLogger(__name__)
@@ -33,7 +35,19 @@ class IntegratedBrowserAgent:
         llm=None,
         progress_callback=None
     ) -> Dict[str, Any]:
-        """Start a research session with integrated streaming and AI control"""
+        """Start a research session with integrated streaming and AI control
+
+        Actions and progress are published to the session's research_events
+        channel as they happen; the caller that owns the session closes it.
+        """
+        channel = research_events.channel(session_id)
+        published_actions = 0
+        
+        def publish_actions(agent):
+            nonlocal published_actions
+            for action in agent.action_history[published_actions:]:
+                channel.publish({"type": "action", "data": action})
+            published_actions = len(agent.action_history)
         
         try:
             # 1. Create browser session if not exists
@@ -66,6 +80,10 @@ class IntegratedBrowserAgent:
                 progress['sessionId'] = session_id
                 progress['streamUrl'] = f"ws://localhost:8002/ws/stream/{session_id}"
                 
+                # Actions recorded since the last progress report go out first
+                publish_actions(agent)
+                channel.publish({"type": "progress", "data": progress})
+                
                 if progress_callback:
                     await progress_callback(progress)
                     
@@ -73,10 +91,13 @@ class IntegratedBrowserAgent:
                 logger.info(f"Progress: {progress}")
             
             # Run the research
-            result = await agent.run(
-                task=f"Research the following topic: {query}",
-                progress_callback=enhanced_progress_callback
-            )
+            try:
+                result = await agent.run(
+                    task=f"Research the following topic: {query}",
+                    progress_callback=enhanced_progress_callback
+                )
+            finally:
+                publish_actions(agent)
             
             return {
                 "sessionId": session_id,
@@ -99,6 +120,7 @@ class IntegratedBrowserAgent:
         # Remove agent
         if session_id in self.active_agents:
             del self.active_agents[session_id]
+        research_events.discard(session_id)
             
         # Stop browser session
         browser_service = self._get_browser_service()
@@ -132,27 +154,29 @@ async def research_progress_websocket(websocket: WebSocket, session_id: str):
     """WebSocket for real-time research progress"""
     await websocket.accept()
     
+    channel = research_events.get(session_id)
+    if not channel:
+        await send_json(websocket, {
+            "type": "error",
+            "message": "No active research session"
+        })
+        await websocket.close()
+        return
+        
+    subscription = channel.subscribe(resume_offset(websocket.query_params.get("after")))
+    watcher = asyncio.create_task(close_on_disconnect(websocket, subscription))
     try:
-        agent = integrated_agent_service.get_agent(session_id)
-        if not agent:
-            await websocket.send_json({
-                "type": "error",
-                "message": "No active research session"
-            })
-            return
-            
-        # Send action history
-        for action in agent.action_history:
-            await websocket.send_json({
-                "type": "action",
-                "data": action
-            })
-            
-        # Keep connection alive for future updates
-        while True:
-            await asyncio.sleep(1)
+        # Send action history, then events as they are published
+        async for offset, event in subscription:
+            if event["type"] == "action":
+                await send_json(websocket, {**event, "offset": offset})
             
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
     finally:
-        await websocket.close()
+        subscription.close()
+        watcher.cancel()
+        try:
+            await websocket.close()
+        except Exception:
+            pass  # Already closed by the client
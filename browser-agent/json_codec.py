@@ -0,0 +1,92 @@
+"""
+JSON Codec - Fast JSON for the services' WebSocket and HTTP payloads
+
+Uses orjson when it is installed, then msgspec, then the stdlib ``json``
+module. Every backend writes compact UTF-8 JSON and handles the same extra
+types (datetimes, pydantic models, non-string dict keys), so what a client
+receives does not depend on which one is installed.
+
+    app = FastAPI(default_response_class=JSONCodecResponse)
+    await send_json(websocket, {'type': 'ack', 'seq': 3})
+    message = await receive_json(websocket)
+"""
+import json
+import logging
+from datetime import date, datetime, time
+from typing import Any, Callable, Union
+
+from fastapi import WebSocket
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+def _default(obj: Any) -> Any:
+    """Types the stdlib encoder does not know, encoded like orjson does"""
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if hasattr(obj, 'model_dump'):
+        return obj.model_dump(mode='json')
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _load_backend():
+    try:
+        import orjson
+        options = orjson.OPT_NON_STR_KEYS
+
+        def dumps(obj: Any) -> bytes:
+            return orjson.dumps(obj, default=_default, option=options)
+
+        return 'orjson', dumps, orjson.loads
+    except ImportError:
+        pass
+    try:
+        import msgspec
+        encoder = msgspec.json.Encoder(enc_hook=_default)
+        decoder = msgspec.json.Decoder()
+        return 'msgspec', encoder.encode, decoder.decode
+    except ImportError:
+        pass
+    encoder = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False, default=_default)
+
+    def dumps(obj: Any) -> bytes:
+        return encoder.encode(obj).encode('utf-8')
+
+    return 'json', dumps, json.loads
+
+
+BACKEND: str
+dumps: Callable[[Any], bytes]
+loads: Callable[[Union[str, bytes]], Any]
+BACKEND, dumps, loads = _load_backend()
+logger.info(f"Using {BACKEND} for JSON")
+
+
+def dumps_text(obj: Any) -> str:
+    """JSON as a str, for WebSocket text messages and SSE lines"""
+    return dumps(obj).decode('utf-8')
+
+
+async def send_json(websocket: WebSocket, message: Any):
+    """``websocket.send_json`` through the fast encoder; still a text message"""
+    await websocket.send_text(dumps_text(message))
+
+
+async def receive_json(websocket: WebSocket) -> Any:
+    """``websocket.receive_json`` through the fast decoder"""
+    return loads(await websocket.receive_text())
+
+
+class JSONCodecResponse(JSONResponse):
+    """JSONResponse rendered by the fast encoder
+
+    FastAPI still runs jsonable_encoder over plain return values; endpoints
+    with large payloads can return ``JSONCodecResponse(content)`` directly
+    to skip that pass.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
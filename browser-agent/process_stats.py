@@ -0,0 +1,123 @@
+"""
+Process Stats - Resident memory and CPU time of this service and its Chromium children
+"""
+import os
+from typing import Dict, List, Tuple
+
+try:
+    import psutil
+except ImportError:  # Linux /proc fallback below
+    psutil = None
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def _proc_rss(pid: int) -> int:
+    with open(f'/proc/{pid}/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def _proc_cpu(pid: int) -> float:
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    # utime and stime, fields 14 and 15 of stat(5)
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def _proc_descendants(pid: int) -> List[int]:
+    tree = _proc_children()
+    descendants = []
+    pending = list(tree.get(pid, []))
+    while pending:
+        child = pending.pop()
+        descendants.append(child)
+        pending.extend(tree.get(child, []))
+    return descendants
+
+
+def _proc_children() -> Dict[int, list]:
+    children: Dict[int, list] = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                # The command name may contain spaces; ppid follows the ')'
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    return children
+
+
+def process_tree_rss(pid: int = None) -> Tuple[int, int]:
+    """RSS in bytes of a process and of all its descendants (e.g. Chromium)
+
+    Returns ``(0, 0)`` where neither psutil nor /proc is available.
+    """
+    pid = pid or os.getpid()
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            own = process.memory_info().rss
+            children = 0
+            for child in process.children(recursive=True):
+                try:
+                    children += child.memory_info().rss
+                except psutil.Error:
+                    pass
+            return own, children
+        except psutil.Error:
+            return 0, 0
+
+    if not os.path.isdir('/proc'):
+        return 0, 0
+    try:
+        own = _proc_rss(pid)
+    except OSError:
+        return 0, 0
+    children = 0
+    for child in _proc_descendants(pid):
+        try:
+            children += _proc_rss(child)
+        except OSError:
+            continue
+    return own, children
+
+
+def process_tree_cpu(pid: int = None) -> Tuple[float, float]:
+    """User plus system CPU seconds of a process and of all its descendants
+
+    Only descendants still running are counted. Returns ``(0.0, 0.0)``
+    where neither psutil nor /proc is available.
+    """
+    pid = pid or os.getpid()
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            times = process.cpu_times()
+            children = 0.0
+            for child in process.children(recursive=True):
+                try:
+                    child_times = child.cpu_times()
+                    children += child_times.user + child_times.system
+                except psutil.Error:
+                    pass
+            return times.user + times.system, children
+        except psutil.Error:
+            return 0.0, 0.0
+
+    if not os.path.isdir('/proc'):
+        return 0.0, 0.0
+    try:
+        own = _proc_cpu(pid)
+    except OSError:
+        return 0.0, 0.0
+    children = 0.0
+    for child in _proc_descendants(pid):
+        try:
+            children += _proc_cpu(child)
+        except OSError:
+            continue
+    return own, children
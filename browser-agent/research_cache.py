@@ -0,0 +1,106 @@
+"""
+Research Cache - Reuses research results for repeated queries
+
+Results are keyed on the normalized query, the LLM and the start URL, kept
+for ``ttl`` seconds and evicted least recently used beyond
+``max_entries``. Identical requests that arrive while a run is in flight
+await that run instead of starting their own browser and LLM work.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# (normalized query, llm, start URL)
+CacheKey = Tuple[str, Optional[str], Optional[str]]
+
+
+def normalize_query(query: str) -> str:
+    """Case and whitespace do not change what is researched"""
+    return ' '.join(query.casefold().split())
+
+
+class ResearchCache:
+    """Finished research results with single-flight deduplication
+
+    A run happens in its own task, so a requester that goes away does not
+    cancel it for the others awaiting it. Failed runs are not cached; every
+    requester awaiting one gets its exception. ``ttl`` 0 only coalesces
+    concurrent requests.
+    """
+
+    def __init__(self, max_entries: int = 256, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]]' = OrderedDict()
+        self._inflight: Dict[CacheKey, asyncio.Task] = {}
+
+    def key(self, query: str, llm: Optional[str], start_url: Optional[str]) -> CacheKey:
+        return normalize_query(query), llm, start_url
+
+    def serves(self, key: CacheKey) -> bool:
+        """Whether a request for ``key`` would now be served from the cache or an in-flight run"""
+        entry = self._entries.get(key)
+        return key in self._inflight or (entry is not None and entry[0] > time.monotonic())
+
+    def start(self, key: CacheKey, run: Callable[[], Awaitable[Dict[str, Any]]],
+              refresh: bool = False) -> Tuple['asyncio.Future[Dict[str, Any]]', bool]:
+        """Serve a request for ``key`` without waiting: the result's future and whether it is shared
+
+        Whether the result comes from the cache or another request's run is
+        settled here, so a caller can act on it before the result is in.
+        ``refresh`` skips the lookup and replaces the cached result.
+        """
+        if not refresh:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    result = asyncio.get_running_loop().create_future()
+                    result.set_result(entry[1])
+                    return result, True
+                del self._entries[key]
+            task = self._inflight.get(key)
+            if task is not None:
+                self.coalesced += 1
+                return asyncio.shield(task), True
+        self.misses += 1
+        task = asyncio.create_task(run())
+        self._inflight[key] = task
+        task.add_done_callback(partial(self._done, key))
+        return asyncio.shield(task), False
+
+    async def get_or_run(self, key: CacheKey, run: Callable[[], Awaitable[Dict[str, Any]]],
+                         refresh: bool = False) -> Tuple[Dict[str, Any], bool]:
+        """The result for ``key`` and whether it came from the cache or another request's run"""
+        result, shared = self.start(key, run, refresh)
+        return await result, shared
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._entries),
+            'inflight': len(self._inflight),
+            'maxEntries': self.max_entries,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'coalesced': self.coalesced,
+            'misses': self.misses
+        }
+
+    def _done(self, key: CacheKey, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled() or task.exception() is not None or not self.ttl or not self.max_entries:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, task.result())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
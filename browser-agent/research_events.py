@@ -0,0 +1,285 @@
+"""
+Research Events - Per-session publish/subscribe channels for research progress
+
+The agent side publishes actions, progress and status changes as they
+happen; every progress endpoint subscribes and awaits the next event, so an
+idle socket is a task parked on an empty queue rather than a polling loop.
+Every event is appended to the session's EventLog and carries its offset,
+so a subscriber that reconnects resumes after the last offset it saw
+instead of replaying the whole history, even after the session ended.
+"""
+import asyncio
+import logging
+import os
+import time
+import weakref
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Set
+
+from research_log import EventLog, LoggedEvent, prune
+from session_ids import SESSION_ID_PATTERN
+
+logger = logging.getLogger(__name__)
+
+HISTORY_LIMIT = 1000  # Events kept in memory per session
+SUBSCRIBER_QUEUE = 1000  # Undelivered events before a subscriber is dropped
+CLOSED_CHANNELS = 256  # Finished sessions kept in memory for late subscribers
+
+
+class Subscription:
+    """One subscriber's view of a channel: the events after an offset, then live ones
+
+    Iterating yields ``(offset, event)``. Events with an offset below
+    ``start`` were published before the subscription and are replayed, from
+    the log's tail or its segments on disk. Registration happens in the
+    constructor, so no event published after that point can be missed.
+    """
+
+    def __init__(self, channel: 'EventChannel', after: Optional[int] = -1):
+        self.channel = channel
+        self.start = channel.log.next_offset
+        self.overflowed = False  # Dropped for falling SUBSCRIBER_QUEUE events behind
+        self._disk, tail = channel.log.since(after) if after is not None else (None, [])
+        self._replay: Deque[LoggedEvent] = deque(tail)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._ended = False  # No more live events
+        self._stopped = False  # Closed by the subscriber
+        if channel.closed:
+            self._ended = True
+            self._queue.put_nowait(None)
+        else:
+            channel._subscribers.add(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> LoggedEvent:
+        if self._disk is not None:
+            first, end = self._disk
+            self._disk = None
+            replayed = await asyncio.to_thread(self.channel.log.read, first, end)
+            self._replay.extendleft(reversed(replayed))
+        if self._stopped:
+            raise StopAsyncIteration
+        if self._replay:
+            return self._replay.popleft()
+        event = await self._queue.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+    def close(self):
+        """Stop the subscription; a pending ``async for`` ends without draining"""
+        self.channel._subscribers.discard(self)
+        self._stopped = True
+        self._replay.clear()
+        if not self._ended:
+            self._ended = True
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait(None)
+
+    def _deliver(self, event: Optional[LoggedEvent]):
+        if self._ended:
+            return
+        if event is not None and self._queue.qsize() >= SUBSCRIBER_QUEUE:
+            # The subscriber reconnects to resume from its last offset
+            logger.warning(f"Dropping research event subscriber of session {self.channel.session_id}")
+            self.overflowed = True
+            self.channel._subscribers.discard(self)
+            event = None
+        if event is None:
+            self._ended = True
+        self._queue.put_nowait(event)
+
+
+class EventChannel:
+    """Logs a session's events and fans them out to its subscribers"""
+
+    def __init__(self, session_id: str, log: EventLog, closed: bool = False):
+        self.session_id = session_id
+        self.log = log
+        self.closed = closed
+        self._subscribers: Set[Subscription] = set()
+
+    def publish(self, event: dict) -> Optional[int]:
+        """Log an event and deliver it to every subscriber without waiting on any of them"""
+        if self.closed:
+            return None
+        offset = self.log.append(event)
+        for subscription in list(self._subscribers):
+            subscription._deliver((offset, event))
+        return offset
+
+    def subscribe(self, after: Optional[int] = -1) -> Subscription:
+        """Events after offset ``after`` (all of them by default, none for None), then live ones"""
+        return Subscription(self, after)
+
+    def close(self):
+        """End every subscription; the log stays readable"""
+        if self.closed:
+            return
+        self.closed = True
+        self.log.close()
+        for subscription in list(self._subscribers):
+            subscription._deliver(None)
+        self._subscribers.clear()
+
+    def stats(self) -> dict:
+        return {
+            'published': self.log.next_offset,
+            'subscribers': len(self._subscribers),
+            'closed': self.closed,
+            'log': self.log.stats()
+        }
+
+
+class EventBus:
+    """The channels of all research sessions in the process
+
+    With a ``root`` directory every session's events are also written to
+    an EventLog under it, so they can be replayed after the channel has
+    left memory or the service has restarted. Logs not written for
+    ``max_age`` seconds are deleted; 0 keeps them.
+    """
+
+    def __init__(self, root: Optional[str] = None, closed_limit: int = CLOSED_CHANNELS,
+                 segment_bytes: int = 1024 * 1024, max_age: float = 0, prune_interval: float = 3600):
+        self.root = root
+        self.closed_limit = closed_limit
+        self.segment_bytes = segment_bytes
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self.channels: Dict[str, EventChannel] = {}
+        self._closed: 'OrderedDict[str, EventChannel]' = OrderedDict()
+        # Logs still referenced, e.g. by a writer flushing after the channel left memory
+        self._logs: 'weakref.WeakValueDictionary[str, EventLog]' = weakref.WeakValueDictionary()
+        self._pruned_at = 0.0
+
+    def path(self, session_id: str) -> Optional[str]:
+        """Where a session's log lives; None keeps it in memory only"""
+        if not self.root:
+            return None
+        if not SESSION_ID_PATTERN.match(session_id):
+            logger.warning(f"Not logging research events of session {session_id!r} to disk")
+            return None
+        return os.path.join(self.root, session_id)
+
+    def channel(self, session_id: str) -> EventChannel:
+        """The session's open channel, created on first use
+
+        A new channel for a session that already has a log continues its
+        offsets.
+        """
+        channel = self.channels.get(session_id)
+        if channel is None or channel.closed:
+            channel = EventChannel(session_id, self._log(session_id, reopen=True))
+            self.channels[session_id] = channel
+            self._closed.pop(session_id, None)
+            self._maybe_prune()
+        return channel
+
+    def get(self, session_id: str) -> Optional[EventChannel]:
+        """The session's channel, reloaded as a closed one from its log if needed"""
+        channel = self.channels.get(session_id)
+        if channel is None:
+            directory = self.path(session_id)
+            if directory and os.path.isdir(directory):
+                channel = EventChannel(session_id, self._log(session_id), closed=True)
+                self.channels[session_id] = channel
+                self._remember_closed(session_id, channel)
+        return channel
+
+    def publish(self, session_id: str, event: dict) -> Optional[int]:
+        """Publish to a session's channel; a no-op if it has none or it is closed"""
+        channel = self.channels.get(session_id)
+        if channel is not None:
+            return channel.publish(event)
+        return None
+
+    def close(self, session_id: str):
+        """Finish a session's channel, keeping it for late subscribers"""
+        channel = self.channels.get(session_id)
+        if channel is None or channel.closed:
+            return
+        channel.close()
+        self._remember_closed(session_id, channel)
+
+    def discard(self, session_id: str):
+        """Close a session's channel and drop it from memory; its log stays on disk"""
+        self.close(session_id)
+        self._closed.pop(session_id, None)
+        self.channels.pop(session_id, None)
+
+    def prune(self) -> int:
+        """Delete logs older than ``max_age``; returns how many; blocking"""
+        open_sessions = {session_id for session_id, channel in self.channels.items() if not channel.closed}
+        return prune(self.root, self.max_age, open_sessions)
+
+    def stats(self) -> dict:
+        return {
+            'channels': len(self.channels) - len(self._closed),
+            'closed': len(self._closed),
+            'subscribers': sum(len(channel._subscribers) for channel in self.channels.values()),
+            'root': self.root
+        }
+
+    def _log(self, session_id: str, reopen: bool = False) -> EventLog:
+        """The session's log; one that is still live is reused so two never write the same files"""
+        log = self._logs.get(session_id)
+        if log is None:
+            log = EventLog(self.path(session_id), tail_events=HISTORY_LIMIT, segment_bytes=self.segment_bytes)
+            self._logs[session_id] = log
+        elif reopen:
+            log.reopen()
+        return log
+
+    def _remember_closed(self, session_id: str, channel: EventChannel):
+        self._closed[session_id] = channel
+        while len(self._closed) > self.closed_limit:
+            old_id, _ = self._closed.popitem(last=False)
+            del self.channels[old_id]
+
+    def _maybe_prune(self):
+        if not (self.root and self.max_age) or time.monotonic() - self._pruned_at < self.prune_interval:
+            return
+        self._pruned_at = time.monotonic()
+        asyncio.get_running_loop().create_task(self._prune())
+
+    async def _prune(self):
+        try:
+            removed = await asyncio.to_thread(self.prune)
+            if removed:
+                logger.info(f"Pruned {removed} research event log(s)")
+        except Exception as e:
+            logger.error(f"Error pruning research event logs: {e}")
+
+
+def resume_offset(value: Optional[str]) -> int:
+    """Offset to resume after from a client's ``after`` or ``Last-Event-ID``; -1 replays everything"""
+    try:
+        return max(int(value), -1)
+    except (TypeError, ValueError):
+        return -1
+
+
+async def close_on_disconnect(websocket, subscription: Subscription):
+    """Run beside a push-only WebSocket handler: ends ``subscription`` once the client leaves
+
+    Without it a socket closed while its session is idle would only be
+    noticed at the next send.
+    """
+    try:
+        while (await websocket.receive())['type'] != 'websocket.disconnect':
+            pass
+    except Exception:
+        pass
+    subscription.close()
+
+
+# TTL in seconds, 0 keeps logs forever; an empty directory keeps events in memory only
+research_events = EventBus(
+    os.getenv('RESEARCH_EVENT_LOG_DIR', 'research-events'),
+    segment_bytes=int(os.getenv('RESEARCH_EVENT_LOG_SEGMENT_KB', '1024')) * 1024,
+    max_age=float(os.getenv('RESEARCH_EVENT_LOG_TTL', '0'))
+)
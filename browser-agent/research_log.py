@@ -0,0 +1,261 @@
+"""
+Research Log - Append-only, offset-addressed event log of a research session
+
+Every event gets the next offset, counting from 0. Recent events stay in
+memory as the tail; a background task writes them to size-capped segment
+files, so a reconnecting client can resume after the last offset it saw,
+even once the session has ended or the service has restarted.
+"""
+import asyncio
+import logging
+import os
+import shutil
+import struct
+import time
+from bisect import bisect_right
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from json_codec import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# A log is a directory of segments named after the offset of their first
+# event: NNNNNNNNNNNN.log holds the events back to back, each one its JSON
+# prefixed with its length.
+LENGTH = struct.Struct('!I')
+
+# (offset, event)
+LoggedEvent = Tuple[int, dict]
+
+
+def _segments(directory: str) -> List[int]:
+    """First offsets of a log's segments in ascending order"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-4]) for name in names if name.endswith('.log') and name[:-4].isdigit())
+
+
+def _segment_path(directory: str, first_offset: int) -> str:
+    return os.path.join(directory, f"{first_offset:012d}.log")
+
+
+def _records(data: bytes) -> Tuple[List[Tuple[int, int]], int]:
+    """(start, end) of each complete record in a segment, and where they end"""
+    records = []
+    position = 0
+    while position + LENGTH.size <= len(data):
+        length, = LENGTH.unpack_from(data, position)
+        end = position + LENGTH.size + length
+        if end > len(data):
+            break  # Cut short by a crash mid-write
+        records.append((position + LENGTH.size, end))
+        position = end
+    return records, position
+
+
+class EventLog:
+    """The events of one session: an in-memory tail over on-disk segments
+
+    ``append`` only buffers the event; a background task hands the buffer
+    to a worker thread every ``flush_interval`` seconds. The tail keeps at
+    least ``tail_events`` events and never drops one before it is on disk,
+    so every offset is readable from one or the other. Without a directory
+    the log is memory-only and keeps just the tail. If writing fails the
+    log carries on in memory: the tail is bounded again, and a replay
+    reports the offsets trimmed since as a ``gap`` event.
+    """
+
+    def __init__(self, directory: Optional[str], tail_events: int = 1000,
+                 segment_bytes: int = 1024 * 1024, flush_interval: float = 0.2):
+        self.directory = directory
+        self.tail_events = tail_events
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.tail: Deque[LoggedEvent] = deque()
+        self.next_offset = 0
+        self.durable_offset = 0  # Every offset below it is on disk
+        self.bytes_written = 0
+        self.write_failed = False
+        self._pending: List[Tuple[int, bytes]] = []
+        self._wanted = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._closed = False
+        self._file = None
+        self._segment_size = 0
+        if directory:
+            self.next_offset = self.durable_offset = self._recover()
+
+    @property
+    def first_offset(self) -> int:
+        """Oldest offset still readable"""
+        if self.directory:
+            segments = _segments(self.directory)
+            if segments:
+                return segments[0]
+        return self.tail[0][0] if self.tail else self.next_offset
+
+    def append(self, event: dict) -> int:
+        """Add an event; returns its offset"""
+        offset = self.next_offset
+        self.next_offset += 1
+        self.tail.append((offset, event))
+        if self.write_failed:
+            pass  # Memory-only from here on; durable_offset stays where the disk ends
+        elif self.directory and not self._closed:
+            self._pending.append((offset, dumps(event)))
+            if self._writer is None:
+                self._writer = asyncio.create_task(self._run())
+        else:
+            self.durable_offset = self.next_offset
+        self._trim()
+        return offset
+
+    def since(self, after: int) -> Tuple[Optional[Tuple[int, int]], List[LoggedEvent]]:
+        """Events after ``after``: the offset range to read from disk, if any, and the tail part
+
+        Both are consistent with the log at the moment of the call; the disk
+        range is immutable, so it can be read later with ``read``. Offsets
+        lost after a write failure come first in the tail part, as one
+        ``{'type': 'gap', 'first': ..., 'end': ...}`` event at the offset
+        before the tail.
+        """
+        first = after + 1
+        tail_start = self.tail[0][0] if self.tail else self.next_offset
+        disk_end = min(tail_start, self.durable_offset) if self.directory else first
+        disk = (first, disk_end) if first < disk_end else None
+        events = [entry for entry in self.tail if entry[0] >= first]
+        if self.directory and max(first, disk_end) < tail_start:
+            events.insert(0, (tail_start - 1, {'type': 'gap', 'first': max(first, disk_end), 'end': tail_start}))
+        return disk, events
+
+    def read(self, first: int, end: int) -> List[LoggedEvent]:
+        """Events with ``first <= offset < end`` from disk; blocking"""
+        segments = _segments(self.directory)
+        events = []
+        for number in segments[max(bisect_right(segments, first) - 1, 0):]:
+            if number >= end:
+                break
+            try:
+                with open(_segment_path(self.directory, number), 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue  # Removed by retention
+            records, _ = _records(data)
+            for offset, (start, stop) in enumerate(records, number):
+                if first <= offset < end:
+                    events.append((offset, loads(data[start:stop])))
+        return events
+
+    def close(self):
+        """Stop taking events; the writer finishes what is buffered and closes the segment"""
+        self._closed = True
+        self._wanted.set()
+
+    def reopen(self):
+        """Take events again after ``close``, continuing the offsets and the last segment"""
+        self._closed = False
+
+    def stats(self) -> dict:
+        return {
+            'nextOffset': self.next_offset,
+            'durableOffset': self.durable_offset,
+            'tail': len(self.tail),
+            'bytesWritten': self.bytes_written,
+            'writeFailed': self.write_failed
+        }
+
+    def _trim(self):
+        while len(self.tail) > self.tail_events and (self.tail[0][0] < self.durable_offset or self.write_failed):
+            self.tail.popleft()
+
+    def _recover(self) -> int:
+        """Offset after the last complete event on disk, dropping a torn last record"""
+        segments = _segments(self.directory)
+        if not segments:
+            return 0
+        path = _segment_path(self.directory, segments[-1])
+        with open(path, 'rb') as f:
+            data = f.read()
+        records, end = _records(data)
+        if end < len(data):
+            with open(path, 'r+b') as f:
+                f.truncate(end)
+        return segments[-1] + len(records)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wanted.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wanted.clear()
+            batch, self._pending = self._pending, []
+            if batch and not self.write_failed:
+                try:
+                    await asyncio.to_thread(self._write, batch)
+                    self.durable_offset = batch[-1][0] + 1
+                except Exception as e:
+                    # Keep serving from memory rather than stalling the session
+                    logger.error(f"Error writing research log {self.directory}: {e}")
+                    self.write_failed = True
+                self._trim()
+            if self._closed and not self._pending:
+                await asyncio.to_thread(self._close_file)
+                if not self._pending:
+                    # Otherwise reopened and appended to while the file was closing
+                    self._writer = None
+                    return
+
+    def _write(self, batch: List[Tuple[int, bytes]]):
+        for offset, data in batch:
+            record = LENGTH.pack(len(data)) + data
+            if self._file is None:
+                self._open_segment(offset)
+            elif self._segment_size + len(record) > self.segment_bytes:
+                self._close_file()
+                self._open_segment(offset, new=True)
+            self._file.write(record)
+            self._segment_size += len(record)
+            self.bytes_written += len(record)
+        self._file.flush()
+
+    def _open_segment(self, offset: int, new: bool = False):
+        """Continue the last segment while it has room, else start one at ``offset``"""
+        os.makedirs(self.directory, exist_ok=True)
+        segments = _segments(self.directory)
+        path = _segment_path(self.directory, offset)
+        self._segment_size = 0
+        if segments and not new:
+            size = os.path.getsize(_segment_path(self.directory, segments[-1]))
+            if size < self.segment_bytes:
+                path = _segment_path(self.directory, segments[-1])
+                self._segment_size = size
+        self._file = open(path, 'ab')
+
+    def _close_file(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._segment_size = 0
+
+
+def prune(root: str, max_age: float, keep: set) -> int:
+    """Delete the logs under ``root`` not written for ``max_age`` seconds; returns how many"""
+    removed = 0
+    cutoff = time.time() - max_age
+    for name in os.listdir(root) if os.path.isdir(root) else []:
+        if name in keep:
+            continue
+        directory = os.path.join(root, name)
+        segments = _segments(directory)
+        try:
+            if segments and os.path.getmtime(_segment_path(directory, segments[-1])) >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        shutil.rmtree(directory, ignore_errors=True)
+        removed += 1
+    return removed
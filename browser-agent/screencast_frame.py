@@ -0,0 +1,159 @@
+"""
+Screencast Frame - Captured frames and the binary stream wire format
+"""
+import base64
+import struct
+import time
+from datetime import datetime
+from typing import Optional, Tuple
+
+from json_codec import dumps_text
+
+# Binary frame transport. Clients opt in with ``?format=binary`` or the
+# ``screencast.binary`` subprotocol and receive raw image bytes behind a fixed
+# big-endian header: version, kind, frame number, timestamp (epoch seconds),
+# width, height.
+BINARY_SUBPROTOCOL = 'screencast.binary'
+FRAME_HEADER = struct.Struct('!BBIdHH')
+FRAME_HEADER_VERSION = 1
+FRAME_KIND_JPEG = 0
+FRAME_KIND_DELTA = 1  # Changed tiles only, see frame_delta.py
+FRAME_KIND_WEBP = 2  # Transcoded, see frame_transcoder.py
+
+JPEG_SIZE = struct.Struct('!HH')  # height, width in a start-of-frame segment
+MARKER_LENGTH = struct.Struct('!H')
+
+
+def jpeg_size(jpeg: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from a JPEG's start-of-frame segment, None if it has none"""
+    if jpeg[:2] != b'\xff\xd8':
+        return None
+    position = 2
+    while position + 9 <= len(jpeg):
+        if jpeg[position] != 0xFF:
+            return None
+        marker = jpeg[position + 1]
+        if marker == 0xFF:  # Fill byte
+            position += 1
+        elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = JPEG_SIZE.unpack_from(jpeg, position + 5)
+            return width, height
+        else:
+            position += 2 + MARKER_LENGTH.unpack_from(jpeg, position + 2)[0]
+    return None
+
+
+class ScreencastFrame:
+    """A captured screencast frame, encoded at most once per transport"""
+
+    __slots__ = ('session_id', 'frame_number', 'timestamp', 'kind', 'received_at',
+                 '_width', '_height', '_sized', '_data', '_jpeg', '_json', '_binary')
+
+    def __init__(self, session_id: str, frame_number: int, params: dict):
+        metadata = params.get('metadata', {})
+        self.session_id = session_id
+        self.frame_number = frame_number
+        self.timestamp = metadata.get('timestamp') or time.time()
+        # The page size; the image is smaller when capped by maxWidth/maxHeight
+        self._width = int(metadata.get('deviceWidth', 0))
+        self._height = int(metadata.get('deviceHeight', 0))
+        self._sized = False
+        self.kind = FRAME_KIND_JPEG
+        self._data: Optional[str] = params['data']  # Base64 encoded JPEG as delivered by CDP
+        self.received_at = time.perf_counter()
+        self._jpeg: Optional[bytes] = None
+        self._json: Optional[str] = None
+        self._binary: Optional[bytes] = None
+
+    @classmethod
+    def from_binary(cls, session_id: str, message: bytes) -> 'ScreencastFrame':
+        """Rebuild a frame from its binary message, e.g. one read from a frame ring"""
+        _, kind, frame_number, timestamp, width, height = FRAME_HEADER.unpack_from(message)
+        frame = cls.__new__(cls)
+        frame.session_id = session_id
+        frame.frame_number = frame_number
+        frame.timestamp = timestamp
+        frame._width = width
+        frame._height = height
+        frame._sized = True
+        frame.kind = kind
+        frame.received_at = time.perf_counter()
+        frame._data = None
+        frame._jpeg = message[FRAME_HEADER.size:]
+        frame._json = None
+        frame._binary = message
+        return frame
+
+    @property
+    def width(self) -> int:
+        """Width of the encoded image"""
+        self._fit()
+        return self._width
+
+    @property
+    def height(self) -> int:
+        """Height of the encoded image"""
+        self._fit()
+        return self._height
+
+    @property
+    def data(self) -> str:
+        """Base64 encoded JPEG"""
+        if self._data is None:
+            self._data = base64.b64encode(self._jpeg).decode('ascii')
+        return self._data
+
+    @property
+    def jpeg(self) -> bytes:
+        """Raw image bytes, a JPEG unless ``kind`` says otherwise"""
+        if self._jpeg is None:
+            self._jpeg = base64.b64decode(self._data)
+        return self._jpeg
+
+    @property
+    def size(self) -> int:
+        """Image size in bytes, estimated from the base64 length if not yet decoded"""
+        if self._jpeg is not None:
+            return len(self._jpeg)
+        return len(self._data) * 3 // 4
+
+    def _fit(self):
+        if not self._sized:
+            self._sized = True
+            size = jpeg_size(self.jpeg)
+            if size:
+                self._width, self._height = size
+
+    def as_json(self) -> str:
+        """Legacy JSON message with the JPEG as a base64 string"""
+        if self._json is None:
+            message = {
+                'type': 'frame',
+                'data': self.data,
+                'timestamp': datetime.fromtimestamp(self.timestamp).isoformat(),
+                'sessionId': self.session_id,  # Use our session ID, not CDP's
+                'frameNumber': self.frame_number
+            }
+            if self.kind == FRAME_KIND_WEBP:
+                message['format'] = 'webp'
+            self._json = dumps_text(message)
+        return self._json
+
+    def as_binary(self) -> bytes:
+        """Fixed header followed by the raw image bytes"""
+        if self._binary is None:
+            self._binary = pack_frame(
+                self.kind, self.frame_number, self.timestamp,
+                self.width, self.height, self.jpeg
+            )
+        return self._binary
+
+
+def pack_frame(kind: int, frame_number: int, timestamp: float,
+               width: int, height: int, payload: bytes) -> bytes:
+    """Prefix a payload with the binary frame header"""
+    header = FRAME_HEADER.pack(
+        FRAME_HEADER_VERSION, kind, frame_number & 0xFFFFFFFF, timestamp,
+        min(width, 0xFFFF), min(height, 0xFFFF)
+    )
+    return header + payload
@@ -0,0 +1,7 @@
+"""
+Session IDs - What a session id must look like to name files and directories
+"""
+import re
+
+# Safe as a single path component: no separators, no leading dot
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9_.-]*$')
@@ -0,0 +1,425 @@
+"""
+Session Recorder - Segmented on-disk screencast recordings and their replay
+"""
+import asyncio
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from screencast_frame import ScreencastFrame
+from session_ids import SESSION_ID_PATTERN
+
+logger = logging.getLogger(__name__)
+
+# A recording is a directory of segments: NNNNNN.seg holds JPEGs back to back
+# and NNNNNN.idx one record per frame with its timestamp (epoch seconds),
+# offset and length in the segment, width and height.
+INDEX_RECORD = struct.Struct('!dQIHH')
+
+# (timestamp, width, height, jpeg)
+RecordedFrame = Tuple[float, int, int, bytes]
+
+
+def _segments(directory: str) -> List[int]:
+    """Segment numbers of a recording in ascending order"""
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    return sorted(int(name[:-4]) for name in names if name.endswith('.idx') and name[:-4].isdigit())
+
+
+def _segment_path(directory: str, number: int, extension: str) -> str:
+    return os.path.join(directory, f"{number:06d}.{extension}")
+
+
+class SessionRecorder:
+    """Appends the frames of one session to size-capped segment files
+
+    ``append`` only buffers the frame, still base64 encoded if that is how
+    CDP delivered it; a background task hands the buffer to a worker
+    thread, which decodes and writes it, once it reaches ``flush_bytes``
+    or every ``flush_interval`` seconds. Frame data is flushed before the index
+    entries pointing at it, so readers never see an entry without its data.
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024,
+                 flush_bytes: int = 1024 * 1024, flush_interval: float = 1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.frames = 0
+        self.bytes_written = 0
+        self._buffer: List[ScreencastFrame] = []
+        self._buffered = 0
+        self._wanted = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._closed = False
+        self._segment: Optional[int] = None
+        self._segment_size = 0
+        self._data_file = None
+        self._index_file = None
+
+    @property
+    def active_segment(self) -> Optional[int]:
+        """Segment currently being written, which retention must not delete"""
+        return self._segment
+
+    def start(self):
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._run())
+
+    def append(self, frame: ScreencastFrame):
+        """Buffer a frame for writing"""
+        self._buffer.append(frame)
+        self._buffered += frame.size
+        if self._buffered >= self.flush_bytes:
+            self._wanted.set()
+
+    async def close(self):
+        """Write out whatever is buffered and close the segment files"""
+        # Let a write in progress finish rather than racing it
+        self._closed = True
+        self._wanted.set()
+        if self._writer:
+            await self._writer
+            self._writer = None
+        try:
+            await self._flush()
+        finally:
+            await asyncio.to_thread(self._close_files)
+
+    def stats(self) -> dict:
+        return {
+            'frames': self.frames,
+            'bytesWritten': self.bytes_written,
+            'segment': self._segment,
+            'buffered': len(self._buffer)
+        }
+
+    async def _run(self):
+        while not self._closed:
+            try:
+                await asyncio.wait_for(self._wanted.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wanted.clear()
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.error(f"Error writing recording {self.directory}: {e}")
+
+    async def _flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer, self._buffered = self._buffer, [], 0
+        await asyncio.to_thread(self._write, batch)
+
+    def _write(self, batch: List[ScreencastFrame]):
+        if self._data_file is None:
+            os.makedirs(self.directory, exist_ok=True)
+            existing = _segments(self.directory)
+            self._open_segment(existing[-1] + 1 if existing else 0)
+
+        entries = []
+        for frame in batch:
+            jpeg = frame.jpeg
+            if self._segment_size and self._segment_size + len(jpeg) > self.segment_bytes:
+                self._commit(entries)
+                entries = []
+                self._close_files()
+                self._open_segment(self._segment + 1)
+            self._data_file.write(jpeg)
+            entries.append(INDEX_RECORD.pack(frame.timestamp, self._segment_size, len(jpeg),
+                                             frame.width, frame.height))
+            self._segment_size += len(jpeg)
+            self.bytes_written += len(jpeg)
+        self._commit(entries)
+        self.frames += len(batch)
+
+    def _commit(self, entries: List[bytes]):
+        self._data_file.flush()
+        self._index_file.write(b''.join(entries))
+        self._index_file.flush()
+
+    def _open_segment(self, number: int):
+        self._segment = number
+        self._segment_size = 0
+        self._data_file = open(_segment_path(self.directory, number, 'seg'), 'ab')
+        self._index_file = open(_segment_path(self.directory, number, 'idx'), 'ab')
+
+    def _close_files(self):
+        for f in (self._data_file, self._index_file):
+            if f:
+                f.close()
+        self._data_file = self._index_file = None
+
+
+class RecordingReader:
+    """Random access to a recording through memory-mapped segments
+
+    Only the indexes are read into memory, as one array of timestamps per
+    segment; frame data is sliced straight out of the mapped segment files.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._numbers: List[int] = []
+        self._starts: List[float] = []  # First timestamp of each segment
+        self._timestamps: List[array] = []
+        self._indexes: List[bytes] = []
+        self._maps: Dict[int, mmap.mmap] = {}
+        self.refresh()
+
+    def __len__(self) -> int:
+        return sum(len(timestamps) for timestamps in self._timestamps)
+
+    @property
+    def start(self) -> Optional[float]:
+        return self._starts[0] if self._starts else None
+
+    @property
+    def end(self) -> Optional[float]:
+        return self._timestamps[-1][-1] if self._timestamps else None
+
+    def refresh(self):
+        """Pick up frames appended since the recording was opened"""
+        numbers = _segments(self.directory)
+        if self._numbers and (not numbers or numbers[0] != self._numbers[0]):
+            # Retention removed segments; positions are no longer valid
+            self.close()
+            self._numbers, self._starts, self._timestamps, self._indexes = [], [], [], []
+        # Everything before the last known segment is immutable
+        keep = max(len(self._numbers) - 1, 0)
+        del self._numbers[keep:], self._starts[keep:], self._timestamps[keep:], self._indexes[keep:]
+        for number in numbers:
+            if self._numbers and number <= self._numbers[-1]:
+                continue
+            with open(_segment_path(self.directory, number, 'idx'), 'rb') as f:
+                index = f.read()
+            index = index[:len(index) - len(index) % INDEX_RECORD.size]
+            if not index:
+                continue
+            timestamps = array('d', (record[0] for record in INDEX_RECORD.iter_unpack(index)))
+            self._numbers.append(number)
+            self._starts.append(timestamps[0])
+            self._timestamps.append(timestamps)
+            self._indexes.append(index)
+
+    def seek(self, timestamp: float) -> Tuple[int, int]:
+        """Position of the frame on screen at ``timestamp``"""
+        if not self._numbers:
+            raise KeyError("Recording is empty")
+        segment = max(bisect_right(self._starts, timestamp) - 1, 0)
+        frame = max(bisect_right(self._timestamps[segment], timestamp) - 1, 0)
+        return segment, frame
+
+    def frame(self, position: Tuple[int, int]) -> RecordedFrame:
+        """Frame at a position returned by ``seek``"""
+        segment, frame = position
+        timestamp, offset, length, width, height = INDEX_RECORD.unpack_from(
+            self._indexes[segment], frame * INDEX_RECORD.size
+        )
+        data = self._map(segment, offset + length)
+        return timestamp, width, height, data[offset:offset + length]
+
+    def next_position(self, position: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+        segment, frame = position
+        if frame + 1 < len(self._timestamps[segment]):
+            return segment, frame + 1
+        if segment + 1 < len(self._numbers):
+            return segment + 1, 0
+        return None
+
+    def frames(self, timestamp: float) -> Iterator[RecordedFrame]:
+        """Frames from the one on screen at ``timestamp`` to the end"""
+        position = self.seek(timestamp)
+        while position is not None:
+            yield self.frame(position)
+            position = self.next_position(position)
+
+    def close(self):
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps.clear()
+
+    def _map(self, segment: int, needed: int) -> mmap.mmap:
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < needed:
+            # Segments still being written are remapped as they grow
+            if mapped is not None:
+                mapped.close()
+            with open(_segment_path(self.directory, self._numbers[segment], 'seg'), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+
+class RecordingStore:
+    """Recordings under one root directory, with size and age retention
+
+    Retention deletes whole segments, oldest first, once they are older than
+    ``max_age`` seconds or the store exceeds ``max_bytes``; 0 disables a
+    limit. Segments still being written are never deleted.
+    """
+
+    def __init__(self, root: str, segment_bytes: int = 64 * 1024 * 1024,
+                 max_bytes: int = 0, max_age: float = 0, prune_interval: float = 60):
+        self.root = root
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self.pruned = 0
+        self.recorders: Dict[str, SessionRecorder] = {}
+        self._pruner: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start applying the retention policy in the background"""
+        if self._pruner is None and (self.max_bytes or self.max_age):
+            self._pruner = asyncio.create_task(self._prune_periodically())
+
+    async def close(self):
+        if self._pruner:
+            self._pruner.cancel()
+            self._pruner = None
+
+    def path(self, session_id: str) -> str:
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError(f"Invalid recording name: {session_id}")
+        return os.path.join(self.root, session_id)
+
+    def recorder(self, session_id: str) -> SessionRecorder:
+        """Start recording a session"""
+        recorder = SessionRecorder(self.path(session_id), segment_bytes=self.segment_bytes)
+        recorder.start()
+        self.recorders[session_id] = recorder
+        return recorder
+
+    async def stop(self, session_id: str, recorder: SessionRecorder):
+        """Finish a session's recording"""
+        if self.recorders.get(session_id) is recorder:
+            del self.recorders[session_id]
+        await recorder.close()
+
+    def open(self, session_id: str) -> RecordingReader:
+        """A new reader for a recording; KeyError if there is none"""
+        directory = self.path(session_id)
+        if not _segments(directory):
+            raise KeyError(f"No recording for {session_id}")
+        return RecordingReader(directory)
+
+    def frame_at(self, session_id: str, timestamp: Optional[float] = None) -> RecordedFrame:
+        """The frame on screen at ``timestamp`` (default: the latest); blocking
+
+        Opens a reader of its own, so concurrent lookups never share mmaps
+        or segment lists. KeyError if there is no recording or it is empty.
+        """
+        reader = self.open(session_id)
+        try:
+            return reader.frame(reader.seek(reader.end if timestamp is None else timestamp))
+        finally:
+            reader.close()
+
+    def list(self) -> List[dict]:
+        """Summary of every recording on disk"""
+        recordings = []
+        try:
+            names = sorted(os.listdir(self.root))
+        except FileNotFoundError:
+            return recordings
+        for name in names:
+            directory = os.path.join(self.root, name)
+            numbers = _segments(directory)
+            if not numbers:
+                continue
+            size = 0
+            frames = 0
+            for number in numbers:
+                size += os.path.getsize(_segment_path(directory, number, 'seg'))
+                frames += os.path.getsize(_segment_path(directory, number, 'idx')) // INDEX_RECORD.size
+            recordings.append({
+                'sessionId': name,
+                'recording': name in self.recorders,
+                'segments': len(numbers),
+                'frames': frames,
+                'bytes': size
+            })
+        return recordings
+
+    def active_segments(self) -> Dict[str, int]:
+        """Directory of each recording in progress and the segment it is writing
+
+        Read on the event loop, where ``recorders`` changes, and handed to
+        ``prune`` in its worker thread.
+        """
+        return {
+            recorder.directory: recorder.active_segment
+            for recorder in self.recorders.values() if recorder.active_segment is not None
+        }
+
+    def prune(self, active: Dict[str, int]) -> int:
+        """Apply the retention policy; returns the number of segments deleted; blocking
+
+        ``active`` comes from ``active_segments``. Segments from the active
+        one on are kept, including any a rollover started since.
+        """
+        segments = []
+        total = 0
+        for name in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            directory = os.path.join(self.root, name)
+            for number in _segments(directory):
+                base = os.path.join(directory, f"{number:06d}")
+                try:
+                    stat = os.stat(base + '.seg')
+                except FileNotFoundError:
+                    continue
+                total += stat.st_size
+                if number < active.get(directory, number + 1):
+                    segments.append((stat.st_mtime, stat.st_size, base))
+        segments.sort()
+
+        removed = 0
+        cutoff = time.time() - self.max_age if self.max_age else None
+        for mtime, size, base in segments:
+            too_old = cutoff is not None and mtime < cutoff
+            too_big = self.max_bytes and total > self.max_bytes
+            if not (too_old or too_big):
+                break
+            for extension in ('.idx', '.seg'):
+                try:
+                    os.remove(base + extension)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+            directory = os.path.dirname(base)
+            if not os.listdir(directory):
+                os.rmdir(directory)
+        self.pruned += removed
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            'root': self.root,
+            'maxBytes': self.max_bytes,
+            'maxAge': self.max_age,
+            'active': {session_id: recorder.stats() for session_id, recorder in self.recorders.items()},
+            'segmentsPruned': self.pruned
+        }
+
+    async def _prune_periodically(self):
+        while True:
+            await asyncio.sleep(self.prune_interval)
+            try:
+                removed = await asyncio.to_thread(self.prune, self.active_segments())
+                if removed:
+                    logger.info(f"Pruned {removed} recording segment(s)")
+            except Exception as e:
+                logger.error(f"Error pruning recordings: {e}")
@@ -0,0 +1,277 @@
+"""
+Session Registry - Bounded store of research sessions with paginated listing
+
+Finished sessions are evicted ``ttl`` seconds after they finish, or oldest
+first once there are more than ``max_sessions``; running sessions are never
+evicted. Results larger than ``spill_bytes`` are moved to files once the
+session finishes, so only small records stay in memory. Sessions are
+indexed by status and start time, so a page of the listing costs the same
+however many sessions there are.
+
+With a SessionStore every session is also persisted, results are spilled
+to it instead of to files, and sessions that are not in memory, e.g. after
+a restart, are loaded back from it on demand.
+"""
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+
+from session_ids import SESSION_ID_PATTERN
+from session_store import Row, SessionStore
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATUSES = ("completed", "error")
+
+# (startedAt timestamp, sessionId); sorts sessions by start time
+IndexKey = Tuple[float, str]
+LAST_ID = '\U0010ffff'  # Sorts after every session id with the same start time
+
+
+def encode_cursor(key: IndexKey) -> str:
+    return f"{key[0]!r}:{key[1]}"
+
+
+def decode_cursor(cursor: str) -> IndexKey:
+    """ValueError for a malformed cursor"""
+    timestamp, session_id = cursor.split(':', 1)
+    return float(timestamp), session_id
+
+
+class SessionRegistry:
+    """Research sessions by id, with secondary indexes by status and start time
+
+    Holds any objects with ``sessionId``, ``status``, ``startedAt`` and
+    ``result`` attributes; with a ``store``, instances of the pydantic
+    ``model``. Status changes must go through ``update`` to keep the
+    indexes right; results must be read with ``result``, as the attribute
+    is None once spilled.
+    """
+
+    def __init__(self, result_dir: Optional[str] = None, max_sessions: int = 10000,
+                 ttl: float = 3600, spill_bytes: int = 4096,
+                 store: Optional[SessionStore] = None, model=None):
+        self.store = store
+        self.model = model
+        self.result_dir = None if store else result_dir
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.spill_bytes = spill_bytes
+        self.evicted = 0
+        self.spilled = 0
+        self.sessions: Dict[str, object] = {}
+        self._index: Dict[Optional[str], List[IndexKey]] = {None: []}  # None indexes every status
+        self._finished: 'OrderedDict[str, float]' = OrderedDict()  # In finishing order
+        self._spilled: Set[str] = set()
+        if self.result_dir:
+            self._remove_orphans()
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def get(self, session_id: str):
+        return self.sessions.get(session_id)
+
+    async def load(self, session_id: str):
+        """A session from memory, or from the store if it has one"""
+        session = self.sessions.get(session_id)
+        if session is None and self.store:
+            row = await self.store.get(session_id)
+            session = self.sessions.get(session_id)
+            if row and session is None:
+                session = self._restore(row)
+        return session
+
+    async def warm(self):
+        """Load the sessions updated within the TTL from the store, in the background"""
+        try:
+            rows = await self.store.recent(time.time() - self.ttl if self.ttl else 0, self.max_sessions)
+        except Exception as e:
+            logger.error(f"Error loading research sessions: {e}")
+            return
+        for row in reversed(rows):
+            if row[0] not in self.sessions:
+                self._restore(row)
+        logger.info(f"Loaded {len(rows)} research session(s) from {self.store.path}")
+
+    def add(self, session, persist: bool = True):
+        """Register a new session, evicting expired ones"""
+        previous = self.sessions.get(session.sessionId)
+        if previous is not None and self._forget(previous) and not self.store:
+            asyncio.get_running_loop().create_task(self._remove_results([session.sessionId]))
+        self.sessions[session.sessionId] = session
+        key = self._key(session)
+        insort(self._index[None], key)
+        insort(self._index.setdefault(session.status, []), key)
+        if persist:
+            self._persist(session)
+        if session.status in FINAL_STATUSES:
+            self._finish(session)
+        self.evict()
+
+    def update(self, session, status: str, result: Optional[str] = None):
+        """Change a session's status, and its result if given"""
+        if result is not None:
+            session.result = result
+        if status != session.status:
+            key = self._key(session)
+            self._remove_key(session.status, key)
+            session.status = status
+            insort(self._index.setdefault(status, []), key)
+        self._persist(session)
+        if status in FINAL_STATUSES and session.sessionId not in self._finished:
+            self._finish(session)
+
+    async def result(self, session) -> Optional[str]:
+        """A session's result, read back from disk if it was spilled"""
+        if session.sessionId not in self._spilled:
+            return session.result
+        if self.store:
+            return await self.store.result(session.sessionId)
+        try:
+            return await asyncio.to_thread(self._read_result, session.sessionId)
+        except FileNotFoundError:
+            return None
+
+    def list(self, status: Optional[str] = None, limit: int = 100, cursor: Optional[str] = None,
+             since: Optional[datetime] = None, until: Optional[datetime] = None) -> Tuple[List, Optional[str]]:
+        """A page of sessions, newest first, and the cursor of the next page if there is one
+
+        ValueError for a malformed cursor.
+        """
+        self.evict()
+        index = self._index.get(status, [])
+        low = bisect_left(index, (since.timestamp(), '')) if since else 0
+        high = bisect_right(index, (until.timestamp(), LAST_ID)) if until else len(index)
+        if cursor:
+            high = min(high, bisect_left(index, decode_cursor(cursor)))
+        start = max(low, high - limit)
+        keys = index[start:high][::-1]
+        next_cursor = encode_cursor(keys[-1]) if keys and start > low else None
+        return [self.sessions[session_id] for _, session_id in keys], next_cursor
+
+    def evict(self) -> int:
+        """Drop finished sessions past their TTL or over the size bound; returns how many"""
+        removed = 0
+        spilled = []
+        now = time.monotonic()
+        while self._finished:
+            session_id, finished_at = next(iter(self._finished.items()))
+            expired = self.ttl and now - finished_at > self.ttl
+            if not (expired or len(self.sessions) > self.max_sessions):
+                break
+            if self._forget(self.sessions[session_id]):
+                spilled.append(session_id)
+            removed += 1
+        self.evicted += removed
+        if spilled and not self.store:
+            asyncio.get_running_loop().create_task(self._remove_results(spilled))
+        return removed
+
+    def stats(self) -> dict:
+        return {
+            'sessions': len(self.sessions),
+            'byStatus': {status: len(keys) for status, keys in self._index.items() if status and keys},
+            'maxSessions': self.max_sessions,
+            'ttl': self.ttl,
+            'evicted': self.evicted,
+            'resultsSpilled': self.spilled,
+            'resultsOnDisk': len(self._spilled),
+            'store': self.store.stats() if self.store else None
+        }
+
+    def _key(self, session) -> IndexKey:
+        return session.startedAt.timestamp(), session.sessionId
+
+    def _remove_key(self, status: Optional[str], key: IndexKey):
+        keys = self._index.get(status, [])
+        position = bisect_left(keys, key)
+        if position < len(keys) and keys[position] == key:
+            del keys[position]
+
+    def _forget(self, session) -> bool:
+        """Drop a session from memory; True if its result is on disk"""
+        key = self._key(session)
+        self._remove_key(None, key)
+        self._remove_key(session.status, key)
+        self._finished.pop(session.sessionId, None)
+        del self.sessions[session.sessionId]
+        if session.sessionId in self._spilled:
+            self._spilled.discard(session.sessionId)
+            return True
+        return False
+
+    def _persist(self, session):
+        if self.store:
+            final = session.status in FINAL_STATUSES
+            self.store.save(session.sessionId, session.status, session.startedAt.timestamp(),
+                            session.model_dump_json(exclude={'result'}), session.result if final else None)
+
+    def _restore(self, row: Row):
+        """Put a stored session back in memory; its result stays in the store"""
+        session_id, status, _, _, record, _ = row
+        session = self.model.model_validate_json(record)
+        session.status = status  # The store marks interrupted sessions without rewriting the record
+        session.result = None
+        self.add(session, persist=False)
+        self._spilled.add(session_id)
+        return session
+
+    def _finish(self, session):
+        self._finished[session.sessionId] = time.monotonic()
+        result = session.result
+        if not result or len(result) < self.spill_bytes:
+            return
+        if self.store or (self.result_dir and SESSION_ID_PATTERN.match(session.sessionId)):
+            asyncio.get_running_loop().create_task(self._spill(session, result))
+
+    async def _spill(self, session, result: str):
+        try:
+            if self.store:
+                await self.store.flush()
+            else:
+                await asyncio.to_thread(self._write_result, session.sessionId, result)
+        except Exception as e:
+            logger.error(f"Error spilling result of session {session.sessionId}: {e}")
+            return
+        if self.sessions.get(session.sessionId) is session and session.result is result:
+            session.result = None
+            self._spilled.add(session.sessionId)
+            self.spilled += 1
+        elif not self.store:
+            # Evicted or replaced while it was being written
+            await self._remove_results([session.sessionId])
+
+    def _path(self, session_id: str) -> str:
+        return os.path.join(self.result_dir, f"{session_id}.result")
+
+    def _write_result(self, session_id: str, result: str):
+        os.makedirs(self.result_dir, exist_ok=True)
+        path = self._path(session_id)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(result)
+        os.replace(path + '.tmp', path)
+
+    def _read_result(self, session_id: str) -> str:
+        with open(self._path(session_id), encoding='utf-8') as f:
+            return f.read()
+
+    async def _remove_results(self, session_ids: List[str]):
+        def remove():
+            for session_id in session_ids:
+                try:
+                    os.remove(self._path(session_id))
+                except FileNotFoundError:
+                    pass
+        await asyncio.to_thread(remove)
+
+    def _remove_orphans(self):
+        """Results spilled by an earlier run; their sessions are gone"""
+        for name in os.listdir(self.result_dir) if os.path.isdir(self.result_dir) else []:
+            if name.endswith(('.result', '.result.tmp')):
+                os.remove(os.path.join(self.result_dir, name))
@@ -0,0 +1,202 @@
+"""
+Session Store - Optional SQLite persistence for research sessions
+
+Keeps every session's record and result in a local SQLite database in WAL
+mode, so a restarted service still answers for sessions it did not start.
+``save`` only buffers the row; a background task writes the buffer in one
+transaction every ``flush_interval`` seconds, coalescing transitions of the
+same session, so persisting adds nothing to the request path. All database
+work runs on one dedicated thread with one connection.
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    record TEXT NOT NULL,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_status ON sessions (status, started_at);
+CREATE INDEX IF NOT EXISTS sessions_started ON sessions (started_at);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at);
+"""
+
+UPSERT = """
+INSERT INTO sessions (session_id, status, started_at, updated_at, record, result)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (session_id) DO UPDATE SET
+    status = excluded.status,
+    updated_at = excluded.updated_at,
+    record = excluded.record,
+    result = COALESCE(excluded.result, sessions.result)
+"""
+
+# (session_id, status, started_at, updated_at, record JSON, result)
+Row = Tuple[str, str, float, float, str, Optional[str]]
+
+INTERRUPTED = "Interrupted by a service restart"
+
+
+class SessionStore:
+    """Research sessions in SQLite, written in batches off the event loop
+
+    ``max_age`` deletes sessions not updated for that many seconds; 0
+    keeps them. Sessions still running when the service stopped are marked
+    as errors when the store is opened, as nothing will finish them.
+    """
+
+    def __init__(self, path: str, final_statuses: Tuple[str, ...], flush_interval: float = 0.05,
+                 max_age: float = 0, prune_interval: float = 3600):
+        self.path = path
+        self.final_statuses = final_statuses
+        self.flush_interval = flush_interval
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self.written = 0
+        self.batches = 0
+        self.pruned = 0
+        self._pending: Dict[str, Row] = {}
+        self._wanted = asyncio.Event()
+        self._flushed = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self._writing = False
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='session-store')
+        self._connection: Optional[sqlite3.Connection] = None
+        self._pruned_at = 0.0
+
+    def save(self, session_id: str, status: str, started_at: float, record: str,
+             result: Optional[str] = None):
+        """Buffer a session's current state for the next batch"""
+        self._pending[session_id] = (session_id, status, started_at, time.time(), record, result)
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._run())
+
+    async def flush(self):
+        """Wait until everything saved so far has been written, or failed to be"""
+        # A batch already being written may not hold the latest saves
+        for _ in range(2 if self._writing else 1):
+            if not self._pending or self._writer is None or self._writer.done():
+                return
+            self._flushed.clear()
+            self._wanted.set()
+            await self._flushed.wait()
+
+    async def get(self, session_id: str) -> Optional[Row]:
+        """A session's row, result left out"""
+        pending = self._pending.get(session_id)
+        if pending is not None:
+            return pending[:5] + (None,)
+        rows = await self._call(self._select, "WHERE session_id = ?", (session_id,), 1)
+        return rows[0] if rows else None
+
+    async def recent(self, since: float, limit: int) -> List[Row]:
+        """Sessions updated since ``since``, most recent first, results left out"""
+        await self.flush()
+        return await self._call(self._select, "WHERE updated_at >= ? ORDER BY updated_at DESC",
+                                (since,), limit)
+
+    async def result(self, session_id: str) -> Optional[str]:
+        await self.flush()
+        rows = await self._call(self._execute, "SELECT result FROM sessions WHERE session_id = ?",
+                                (session_id,))
+        return rows[0][0] if rows else None
+
+    async def close(self):
+        if self._writer is not None:
+            await self.flush()
+            self._writer.cancel()
+            self._writer = None
+        await self._call(self._close)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        return {
+            'path': self.path,
+            'pending': len(self._pending),
+            'written': self.written,
+            'batches': self.batches,
+            'pruned': self.pruned
+        }
+
+    async def _call(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wanted.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wanted.clear()
+            batch = list(self._pending.values())
+            try:
+                if batch:
+                    self._writing = True
+                    await self._call(self._write, batch)
+                    # Later saves of the same sessions stay pending
+                    for row in batch:
+                        if self._pending.get(row[0]) is row:
+                            del self._pending[row[0]]
+                    self.written += len(batch)
+                    self.batches += 1
+                if self.max_age and time.monotonic() - self._pruned_at > self.prune_interval:
+                    self._pruned_at = time.monotonic()
+                    self.pruned += await self._call(self._prune)
+            except Exception as e:
+                logger.error(f"Error writing session store {self.path}: {e}")
+            self._writing = False
+            self._flushed.set()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Durable at checkpoints; a power cut may lose the last batches, never corrupt
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            placeholders = ', '.join('?' * len(self.final_statuses))
+            with connection:
+                interrupted = connection.execute(
+                    f"UPDATE sessions SET status = 'error', result = COALESCE(result, ?), updated_at = ? "
+                    f"WHERE status NOT IN ({placeholders})",
+                    (INTERRUPTED, time.time(), *self.final_statuses)
+                ).rowcount
+            if interrupted:
+                logger.info(f"Marked {interrupted} interrupted research session(s) as failed")
+            self._connection = connection
+        return self._connection
+
+    def _write(self, batch: List[Row]):
+        connection = self._connect()
+        with connection:
+            connection.executemany(UPSERT, batch)
+
+    def _select(self, where: str, parameters: tuple, limit: int) -> List[Row]:
+        return self._execute(
+            f"SELECT session_id, status, started_at, updated_at, record, NULL FROM sessions {where} LIMIT ?",
+            (*parameters, limit)
+        )
+
+    def _execute(self, query: str, parameters: tuple) -> list:
+        return self._connect().execute(query, parameters).fetchall()
+
+    def _prune(self) -> int:
+        connection = self._connect()
+        with connection:
+            return connection.execute("DELETE FROM sessions WHERE updated_at < ?",
+                                      (time.time() - self.max_age,)).rowcount
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,120 @@
+"""
+Simulcast - Lower resolution layers of the screencast for small or slow viewers
+
+Viewers pick a layer with ``?layer=`` when they connect and can switch with
+``{"type": "layer", "layer": "thumb"}``. ``full`` is the captured frame as
+is; the other layers are derived from it, and only while some viewer is
+subscribed to them. ``?codec=webp`` (or ``"codec"`` in the same message)
+asks for WebP instead of JPEG in any layer, full included.
+"""
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple
+
+from frame_transcoder import CODECS, TranscodePool
+from screencast_frame import ScreencastFrame
+
+logger = logging.getLogger(__name__)
+
+FULL = 'full'
+JPEG = 'jpeg'
+
+# name -> (maximum width, maximum height, quality); quality for full only
+# applies when it is transcoded to another codec
+LAYERS: Dict[str, Tuple[int, int, int]] = {
+    FULL: (1920, 1080, 80),
+    'half': (960, 540, 60),
+    'thumb': (320, 180, 50),
+}
+
+
+def screencast_cap(layers: Iterable[str]) -> Optional[Tuple[int, int]]:
+    """Largest frame size any of the given layers needs, None for full size"""
+    layers = set(layers)
+    if not layers or FULL in layers:
+        return None
+    sizes = [LAYERS[layer][:2] for layer in layers]
+    # Capture at twice the layer size so downscaling keeps text legible
+    return max(width for width, _ in sizes) * 2, max(height for _, height in sizes) * 2
+
+
+def validate(layer: str, codec: str):
+    if layer not in LAYERS:
+        raise ValueError(f"Unknown layer: {layer}")
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec: {codec}")
+
+
+class SimulcastEncoder:
+    """Derives the subscribed variants (layer and codec) of a session's frames
+
+    Each captured frame is offered to full-layer JPEG viewers straight away.
+    The other variants are transcoded together on the shared TranscodePool;
+    a frame that arrives while the previous one is still being transcoded,
+    or while the pool is saturated, is skipped for those variants, the same
+    latest-frame-wins policy as the viewer queues.
+    """
+
+    def __init__(self, viewers: Callable[[], Iterable], pool: TranscodePool):
+        self.viewers = viewers
+        self.pool = pool
+        self.encoded: Dict[str, int] = {}
+        self.skipped = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def layers(self) -> Set[str]:
+        """Layers with at least one viewer"""
+        return {viewer.layer for viewer in self.viewers()}
+
+    def distribute(self, frame: ScreencastFrame):
+        """Offer a captured frame to every viewer in its variant"""
+        wanted = set()
+        for viewer in list(self.viewers()):
+            if viewer.layer == FULL and viewer.codec == JPEG:
+                viewer.offer(frame)
+            else:
+                wanted.add((viewer.layer, viewer.codec))
+        if not wanted:
+            return
+        if self._task and not self._task.done():
+            self.skipped += 1
+            return
+        self._task = asyncio.create_task(self._encode(frame, wanted))
+
+    async def offer_latest(self, viewer, frame: ScreencastFrame):
+        """Give a new or switching viewer the given frame in its variant"""
+        if viewer.layer == FULL and viewer.codec == JPEG:
+            viewer.offer(frame)
+            return
+        # Not skippable: on a static page this may be the only frame it gets
+        encoded = await self._transcode(frame, viewer.layer, viewer.codec, skippable=False)
+        if encoded is not None:
+            viewer.offer(encoded)
+
+    def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        return {'encoded': self.encoded, 'skipped': self.skipped}
+
+    async def _transcode(self, frame: ScreencastFrame, layer: str, codec: str,
+                         skippable: bool = True) -> Optional[ScreencastFrame]:
+        max_width, max_height, quality = LAYERS[layer]
+        encoded = await self.pool.transcode(frame, max_width, max_height, quality, codec, skippable)
+        if encoded is not None:
+            key = layer if codec == JPEG else f"{layer}.{codec}"
+            self.encoded[key] = self.encoded.get(key, 0) + 1
+        return encoded
+
+    async def _encode(self, frame: ScreencastFrame, wanted: Set[Tuple[str, str]]):
+        variants = list(wanted)
+        results = await asyncio.gather(*(self._transcode(frame, *variant) for variant in variants))
+        encoded = dict(zip(variants, results))
+        if None in results:
+            self.skipped += 1
+        for viewer in list(self.viewers()):
+            variant_frame = encoded.get((viewer.layer, viewer.codec))
+            if variant_frame is not None:
+                viewer.offer(variant_frame)
@@ -0,0 +1,355 @@
+"""
+Stream Fan-out Worker - Serves stream viewers from shared-memory frame rings
+
+browser_stream_service.py keeps owning Chromium and writes each session's
+frames once into a shared-memory ring (frame_ring.py). Any number of worker
+processes serve /ws/stream/{session_id} viewers from those rings, so frame
+encoding and socket writes spread over all cores:
+
+    uvicorn browser_stream_service:app --host 127.0.0.1 --port 8002
+    uvicorn stream_fanout_worker:app --port 8003 --workers 4
+
+STREAM_CAPTURE_URL points the workers at the capture service (default
+http://127.0.0.1:8002), which must run on the same host. When the capture
+service is reachable other than over loopback, e.g. behind a proxy, set the
+same STREAM_INTERNAL_TOKEN on both so only workers can link to its rings. Viewers speak the
+same protocol as on the capture service's own /ws/stream endpoint.
+"""
+import asyncio
+import logging
+import os
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+import websockets
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi.middleware.cors import CORSMiddleware
+import uvicorn
+
+from frame_ring import FrameRing
+from frame_transcoder import TranscodePool
+from json_codec import JSONCodecResponse, dumps_text, loads, receive_json, send_json
+from screencast_frame import BINARY_SUBPROTOCOL, ScreencastFrame
+from simulcast import FULL, JPEG, SimulcastEncoder, validate
+from stream_viewer import VISIBILITY_STATES, VISIBLE, StreamViewer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CAPTURE_URL = os.getenv('STREAM_CAPTURE_URL', 'http://127.0.0.1:8002')
+INTERNAL_TOKEN = os.getenv('STREAM_INTERNAL_TOKEN', '')
+
+# Simulcast layers and WebP are transcoded in the worker, next to its viewers
+transcoder = TranscodePool(
+    workers=int(os.getenv('STREAM_TRANSCODE_WORKERS', '2')),
+    processes=os.getenv('STREAM_TRANSCODE_PROCESSES', '0') != '0',
+    max_pending=int(os.getenv('STREAM_TRANSCODE_MAX_PENDING', '0'))
+)
+
+
+class RingSession:
+    """One session's frame ring as seen by this worker, shared by its viewers
+
+    A single link to the capture service carries the frame doorbells and
+    this worker's interactions. Interaction sequence numbers are rewritten
+    on the way in so acks can be routed back to the viewer that sent them.
+    The link reports the session hidden while none of the viewers here are
+    visible, so the capture service can pause the screencast.
+    """
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.viewers: Dict[WebSocket, StreamViewer] = {}
+        self.ring: Optional[FrameRing] = None
+        self.link = None  # WebSocket to the capture service
+        self.last_frame: Optional[ScreencastFrame] = None
+        self.simulcast = SimulcastEncoder(self.visible_viewers, transcoder)
+        self._link_visibility = VISIBLE
+        self._last_sequence = 0
+        self._reader: Optional[asyncio.Task] = None
+        self._inputs: Deque[Tuple[int, WebSocket, int]] = deque()  # (link seq, viewer, viewer seq)
+        self._next_seq = 0
+        self._link_lost = False
+        self._closed = False
+
+    @property
+    def closing(self) -> bool:
+        """Ended or ending; new viewers need a fresh RingSession"""
+        return self._closed or self._link_lost
+
+    async def open(self):
+        """Link up with the capture service and attach to the session's ring"""
+        url = f"{CAPTURE_URL.replace('http', 'ws', 1)}/internal/ring/{self.session_id}"
+        headers = {'X-Stream-Internal-Token': INTERNAL_TOKEN} if INTERNAL_TOKEN else None
+        self.link = await websockets.connect(url, max_size=None, additional_headers=headers)
+        hello = loads(await self.link.recv())
+        if hello.get('type') != 'ring':
+            await self.link.close()
+            raise RuntimeError(hello.get('message', 'Capture service did not provide a frame ring'))
+        self.ring = FrameRing.attach(hello['name'])
+        self._reader = asyncio.create_task(self._run())
+
+    async def subscribe(self, websocket: WebSocket, binary: bool = False, delta: bool = False,
+                        layer: str = FULL, codec: str = JPEG) -> StreamViewer:
+        viewer = StreamViewer(websocket, binary, delta, layer=layer, codec=codec)
+        self.viewers[websocket] = viewer
+        viewer.start(self.unsubscribe)
+        if self.last_frame is not None:
+            await self.simulcast.offer_latest(viewer, self.last_frame)
+        else:
+            self._publish()
+        await self._update_link_visibility()
+        return viewer
+
+    async def set_layer(self, websocket: WebSocket, layer: Optional[str], codec: Optional[str] = None):
+        viewer = self.viewers.get(websocket)
+        if viewer is None:
+            return
+        layer = layer or viewer.layer
+        codec = codec or viewer.codec
+        validate(layer, codec)
+        if viewer.encoder and codec != JPEG:
+            raise ValueError("Delta streams are JPEG only")
+        if (viewer.layer, viewer.codec) == (layer, codec):
+            return
+        viewer.layer = layer
+        viewer.codec = codec
+        if viewer.encoder:
+            viewer.encoder.force_keyframe()
+        if self.last_frame is not None:
+            await self.simulcast.offer_latest(viewer, self.last_frame)
+
+    async def set_visibility(self, websocket: WebSocket, visibility: str):
+        if visibility not in VISIBILITY_STATES:
+            raise ValueError(f"Unknown visibility: {visibility}")
+        viewer = self.viewers.get(websocket)
+        if viewer is None or viewer.visibility == visibility:
+            return
+        was_visible = viewer.visible
+        viewer.visibility = visibility
+        if viewer.visible and not was_visible and self.last_frame is not None:
+            await self.simulcast.offer_latest(viewer, self.last_frame)
+        await self._update_link_visibility()
+
+    def visible_viewers(self):
+        return [viewer for viewer in self.viewers.values() if viewer.visible]
+
+    async def unsubscribe(self, websocket: WebSocket):
+        viewer = self.viewers.pop(websocket, None)
+        if viewer is None:
+            return
+        await viewer.stop()
+        if not self.viewers:
+            await self.close()
+        else:
+            await self._update_link_visibility()
+
+    async def forward(self, websocket: WebSocket, command: dict):
+        """Relay a viewer's interaction to the capture service"""
+        if isinstance(command.get('seq'), int):
+            self._next_seq += 1
+            self._inputs.append((self._next_seq, websocket, command['seq']))
+            command = dict(command, seq=self._next_seq)
+        await self.link.send(dumps_text(command))
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if sessions.get(self.session_id) is self:
+            del sessions[self.session_id]
+        if self._reader:
+            self._reader.cancel()
+        self.simulcast.close()
+        if self.link:
+            await self.link.close()
+        if self.ring:
+            self.ring.close()
+        for websocket in list(self.viewers):
+            try:
+                await websocket.close(code=1001, reason='Session ended')
+            except Exception:
+                pass
+
+    def stats(self) -> dict:
+        return {
+            'sessionId': self.session_id,
+            'ring': self.ring.name if self.ring else None,
+            'sequence': self._last_sequence,
+            'simulcast': self.simulcast.stats(),
+            'viewers': [viewer.stats() for viewer in self.viewers.values()]
+        }
+
+    async def _run(self):
+        try:
+            async for raw in self.link:
+                message = loads(raw)
+                if message.get('type') == 'frame':
+                    self._publish()
+                elif message.get('type') == 'ack':
+                    await self._route_ack(message)
+                elif message.get('type') == 'error':
+                    await self._route_error(message)
+        except websockets.ConnectionClosed:
+            pass
+        except Exception as e:
+            logger.error(f"Error reading ring link for session {self.session_id}: {e}")
+        # The capture service ended the session or went away
+        self._link_lost = True
+        asyncio.create_task(self.close())
+
+    async def _update_link_visibility(self):
+        visibility = VISIBLE if self.visible_viewers() else 'hidden'
+        if visibility == self._link_visibility:
+            return
+        self._link_visibility = visibility
+        try:
+            await self.link.send(dumps_text({'type': 'visibility', 'state': visibility}))
+        except Exception as e:
+            logger.error(f"Error reporting visibility for session {self.session_id}: {e}")
+
+    def _publish(self):
+        """Hand the newest frame in the ring to every viewer"""
+        result = self.ring.read_latest()
+        if result is None or result[0] == self._last_sequence:
+            return
+        self._last_sequence, message = result
+        # One copy out of shared memory per frame, shared by all viewers
+        self.last_frame = ScreencastFrame.from_binary(self.session_id, message)
+        self.simulcast.distribute(self.last_frame)
+
+    async def _route_ack(self, message: dict):
+        acked: Dict[WebSocket, list] = {}
+        while self._inputs and self._inputs[0][0] <= message['seq']:
+            _, websocket, viewer_seq = self._inputs.popleft()
+            acked.setdefault(websocket, []).append(viewer_seq)
+        for websocket, viewer_seqs in acked.items():
+            if websocket not in self.viewers:
+                continue
+            try:
+                await send_json(websocket, dict(message, seq=max(viewer_seqs), count=len(viewer_seqs)))
+            except Exception as e:
+                logger.error(f"Error relaying input ack: {e}")
+
+    async def _route_error(self, message: dict):
+        for entry in self._inputs:
+            if entry[0] == message.get('seq'):
+                self._inputs.remove(entry)
+                websocket, viewer_seq = entry[1], entry[2]
+                break
+        else:
+            logger.error(f"Capture service error for session {self.session_id}: {message.get('message')}")
+            return
+        try:
+            await send_json(websocket, dict(message, seq=viewer_seq))
+        except Exception as e:
+            logger.error(f"Error relaying input error: {e}")
+
+
+sessions: Dict[str, RingSession] = {}
+_sessions_lock = asyncio.Lock()
+
+
+async def join(session_id: str) -> RingSession:
+    """The worker's RingSession for a session, linking up on first use"""
+    async with _sessions_lock:
+        session = sessions.get(session_id)
+        if session is None or session.closing:
+            session = RingSession(session_id)
+            await session.open()
+            sessions[session_id] = session
+        return session
+
+
+app = FastAPI(title="Browser Stream Fan-out Worker", default_response_class=JSONCodecResponse)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+@app.on_event("shutdown")
+async def shutdown():
+    for session in list(sessions.values()):
+        await session.close()
+    transcoder.close()
+
+@app.websocket("/ws/stream/{session_id}")
+async def websocket_stream(websocket: WebSocket, session_id: str):
+    """Viewer endpoint, protocol-compatible with browser_stream_service.py"""
+    subprotocol = BINARY_SUBPROTOCOL if BINARY_SUBPROTOCOL in websocket.scope.get('subprotocols', []) else None
+    delta = websocket.query_params.get('encoding') == 'delta'
+    binary = delta or subprotocol is not None or websocket.query_params.get('format') == 'binary'
+    layer = websocket.query_params.get('layer', FULL)
+    codec = websocket.query_params.get('codec', JPEG)
+    await websocket.accept(subprotocol=subprotocol)
+
+    try:
+        validate(layer, codec)
+        if delta and codec != JPEG:
+            raise ValueError("Delta streams are JPEG only")
+    except ValueError as e:
+        await send_json(websocket, {'type': 'error', 'message': str(e)})
+        await websocket.close()
+        return
+
+    try:
+        session = await join(session_id)
+    except Exception as e:
+        logger.error(f"Error linking to session {session_id}: {e}")
+        await send_json(websocket, {'type': 'error', 'message': str(e)})
+        await websocket.close()
+        return
+
+    viewer = await session.subscribe(websocket, binary=binary, delta=delta, layer=layer, codec=codec)
+    await send_json(websocket, {
+        'type': 'status',
+        'message': 'Streaming started',
+        'sessionId': session_id
+    })
+
+    try:
+        while True:
+            try:
+                data = await receive_json(websocket)
+
+                if data.get('type') == 'interaction':
+                    await session.forward(websocket, data)
+                elif data.get('type') == 'ping':
+                    if isinstance(data.get('rtt'), (int, float)):
+                        viewer.record_rtt(data['rtt'])
+                    await send_json(websocket, {'type': 'pong', 'timestamp': data.get('timestamp')})
+                elif data.get('type') == 'keyframe':
+                    if viewer.encoder:
+                        viewer.encoder.force_keyframe()
+                elif data.get('type') == 'layer':
+                    await session.set_layer(websocket, data.get('layer'), data.get('codec'))
+                elif data.get('type') == 'visibility':
+                    await session.set_visibility(websocket, data.get('state'))
+
+            except WebSocketDisconnect:
+                break
+            except Exception as e:
+                logger.error(f"WebSocket error: {e}")
+                await send_json(websocket, {
+                    'type': 'error',
+                    'message': str(e)
+                })
+    finally:
+        await session.unsubscribe(websocket)
+
+@app.get("/api/worker/sessions")
+async def list_sessions():
+    """Sessions this worker process is serving"""
+    return {
+        "pid": os.getpid(),
+        "transcoder": transcoder.stats(),
+        "sessions": [session.stats() for session in sessions.values()]
+    }
+
+if __name__ == "__main__":
+    uvicorn.run("stream_fanout_worker:app", host="0.0.0.0", port=8003,
+                workers=int(os.getenv('STREAM_FANOUT_WORKERS', str(os.cpu_count() or 1))))
@@ -0,0 +1,184 @@
+"""
+Stream Metrics - Hot-path counters and histograms in the Prometheus text format
+"""
+from bisect import bisect_left
+from typing import Dict, List, Tuple
+
+# Seconds, from sub-millisecond encodes to multi-second navigations
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Per-session counters: attribute -> (metric name, help)
+SESSION_COUNTERS = {
+    'frames': ('stream_frames_captured_total', 'Screencast frames received from Chromium'),
+    'frames_suppressed': ('stream_frames_suppressed_total', 'Unchanged frames acked but not broadcast'),
+    'frames_sent': ('stream_frames_sent_total', 'Frames written to viewer sockets'),
+    'frames_dropped': ('stream_frames_dropped_total', 'Frames dropped from full viewer queues'),
+    'bytes_sent': ('stream_bytes_sent_total', 'Frame payload bytes written to viewer sockets'),
+    'interactions': ('stream_interactions_total', 'Interaction messages received from viewers'),
+}
+
+
+# Per-session gauges sampled at scrape time: metric name -> help
+SESSION_GAUGES = {
+    'stream_session_viewers': 'Viewers connected to the session',
+    'stream_session_visible_viewers': 'Connected viewers not hidden or paused',
+    'stream_session_viewer_queue_depth': 'Frames waiting in the viewer send queues',
+    'stream_session_input_queue_depth': 'Interactions waiting to be applied',
+    'stream_session_interaction_to_frame_seconds': 'Smoothed time from input to the next frame',
+}
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+
+class Histogram:
+    """Fixed-bucket latency histogram
+
+    Observing is a bisect and three additions; like everything in this
+    module it is only touched from the event loop, so it needs no locking.
+    """
+
+    __slots__ = ('name', 'help', 'buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, lines: List[str]):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+
+
+class SessionMetrics:
+    """Counters for one stream session, plus the shared latency histograms"""
+
+    __slots__ = ('frames', 'frames_suppressed', 'frames_sent', 'frames_dropped', 'bytes_sent',
+                 'interactions', 'encode_seconds', 'send_seconds', 'ack_seconds',
+                 'interaction_seconds', '_second', '_frames_this_second', '_frames_last_second')
+
+    def __init__(self, registry: 'StreamMetrics'):
+        for attribute in SESSION_COUNTERS:
+            setattr(self, attribute, 0)
+        self.encode_seconds = registry.encode_seconds
+        self.send_seconds = registry.send_seconds
+        self.ack_seconds = registry.ack_seconds
+        self.interaction_seconds = registry.interaction_seconds
+        self._second = 0
+        self._frames_this_second = 0
+        self._frames_last_second = 0
+
+    def frame_captured(self, now: float):
+        """Count a captured frame; ``now`` is a monotonic time in seconds"""
+        self.frames += 1
+        second = int(now)
+        if second != self._second:
+            self._frames_last_second = self._frames_this_second if second == self._second + 1 else 0
+            self._second = second
+            self._frames_this_second = 0
+        self._frames_this_second += 1
+
+    def fps(self, now: float) -> int:
+        """Frames captured during the last complete second"""
+        second = int(now)
+        if second == self._second:
+            return self._frames_last_second
+        if second == self._second + 1:
+            return self._frames_this_second
+        return 0
+
+
+class StreamMetrics:
+    """Registry of session metrics rendered for a ``/metrics`` scrape
+
+    Aggregate counters include sessions that have since closed, so they
+    only ever go up as Prometheus expects.
+    """
+
+    def __init__(self):
+        self.encode_seconds = Histogram(
+            'stream_frame_encode_seconds', 'Time to encode a frame for a viewer transport')
+        self.send_seconds = Histogram(
+            'stream_frame_send_seconds', 'Time to write an encoded frame to a viewer socket')
+        self.ack_seconds = Histogram(
+            'stream_cdp_ack_seconds', 'Round trip of Page.screencastFrameAck to Chromium')
+        self.interaction_seconds = Histogram(
+            'stream_interaction_seconds', 'Time from receiving an interaction to applying it')
+        self.sessions: Dict[str, SessionMetrics] = {}
+        self._retired = dict.fromkeys(SESSION_COUNTERS, 0)
+
+    def session(self, session_id: str) -> SessionMetrics:
+        metrics = SessionMetrics(self)
+        self.sessions[session_id] = metrics
+        return metrics
+
+    def retire(self, session_id: str, metrics: SessionMetrics):
+        """Fold a closed session's counters into the aggregate totals"""
+        if self.sessions.get(session_id) is metrics:
+            del self.sessions[session_id]
+        for attribute in SESSION_COUNTERS:
+            self._retired[attribute] += getattr(metrics, attribute)
+
+    def render(self, now: float, session_gauges: Dict[str, Dict[str, float]],
+               gauges: Dict[str, Tuple[str, float]]) -> str:
+        """Prometheus text exposition
+
+        ``session_gauges`` maps session ids to values for SESSION_GAUGES and
+        ``gauges`` maps process-wide metric names to ``(help, value)``.
+        """
+        lines: List[str] = []
+        for attribute, (name, help) in SESSION_COUNTERS.items():
+            total = self._retired[attribute] + sum(
+                getattr(metrics, attribute) for metrics in self.sessions.values()
+            )
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name} {total}")
+            session_name = name.replace('stream_', 'stream_session_', 1)
+            lines.append(f"# HELP {session_name} {help}, per session")
+            lines.append(f"# TYPE {session_name} counter")
+            for session_id, metrics in self.sessions.items():
+                lines.append(f"{session_name}{_labels({'session': session_id})} {getattr(metrics, attribute)}")
+
+        fps = {session_id: metrics.fps(now) for session_id, metrics in self.sessions.items()}
+        lines.append("# HELP stream_fps Frames captured over the last second, all sessions")
+        lines.append("# TYPE stream_fps gauge")
+        lines.append(f"stream_fps {sum(fps.values())}")
+        lines.append("# HELP stream_session_fps Frames captured over the last second")
+        lines.append("# TYPE stream_session_fps gauge")
+        for session_id, value in fps.items():
+            lines.append(f"stream_session_fps{_labels({'session': session_id})} {value}")
+
+        for name, help in SESSION_GAUGES.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for session_id, values in session_gauges.items():
+                if name in values:
+                    lines.append(f"{name}{_labels({'session': session_id})} {values[name]}")
+
+        for name, (help, value) in gauges.items():
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+
+        for histogram in (self.encode_seconds, self.send_seconds, self.ack_seconds, self.interaction_seconds):
+            histogram.render(lines)
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,152 @@
+"""
+Stream Viewer - A WebSocket subscribed to a session's frames
+"""
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Optional
+
+from fastapi import WebSocket
+
+from screencast_frame import ScreencastFrame
+from simulcast import FULL, JPEG
+from stream_metrics import SessionMetrics
+
+logger = logging.getLogger(__name__)
+
+# Declared by clients; hidden (tab in the background, canvas scrolled away)
+# and paused (stopped by the user) viewers are both skipped by broadcasts
+VISIBLE = 'visible'
+VISIBILITY_STATES = (VISIBLE, 'hidden', 'paused')
+
+
+class StreamViewer:
+    """A WebSocket subscribed to a session's screencast
+
+    Frames are handed over through a small bounded queue drained by the
+    viewer's own sender task. When the viewer falls behind, the oldest queued
+    frame is dropped so that a slow link never holds up other viewers.
+    """
+
+    QUEUE_SIZE = 2
+
+    def __init__(self, websocket: WebSocket, binary: bool = False, delta: bool = False,
+                 metrics: Optional[SessionMetrics] = None, layer: str = FULL, codec: str = JPEG):
+        self.websocket = websocket
+        self.metrics = metrics
+        self.layer = layer  # Simulcast layer and codec, see simulcast.py
+        self.codec = codec
+        self.visibility = VISIBLE
+        self.binary = binary or delta
+        self.encoder = None
+        if delta:
+            # Optional dependency on NumPy/Pillow, only loaded for delta viewers
+            from frame_delta import TileDeltaEncoder
+            self.encoder = TileDeltaEncoder()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.bytes_sent = 0
+        # Smoothed delivery measurements used by AdaptiveQualityController
+        self.latency_ms = 0.0  # Frame received from CDP -> written to socket
+        self.throughput_bps = 0.0
+        self.rtt_ms = 0.0  # Reported by the client on its pings
+        self._sender: Optional[asyncio.Task] = None
+
+    def start(self, on_disconnect: Callable[[WebSocket], Awaitable[None]]):
+        """Start the sender task; on_disconnect is scheduled if a send fails"""
+        self._sender = asyncio.create_task(self._run(on_disconnect))
+
+    async def stop(self):
+        """Cancel the sender task"""
+        if self._sender and not self._sender.done():
+            self._sender.cancel()
+            try:
+                await self._sender
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def visible(self) -> bool:
+        return self.visibility == VISIBLE
+
+    def offer(self, frame: ScreencastFrame):
+        """Queue a frame without blocking, dropping the stalest one if full"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.frames_dropped += 1
+            if self.metrics:
+                self.metrics.frames_dropped += 1
+        self.queue.put_nowait(frame)
+
+    async def send(self, frame: ScreencastFrame) -> int:
+        """Send a frame in the transport this viewer negotiated, returning its size"""
+        started = time.perf_counter()
+        if self.encoder is not None:
+            try:
+                payload = await asyncio.to_thread(self.encoder.encode, frame)
+            except Exception as e:
+                # A bad frame should not cost the viewer its connection
+                logger.error(f"Error delta-encoding frame {frame.frame_number}: {e}")
+                self.encoder.force_keyframe()
+                return 0
+        elif self.binary:
+            payload = frame.as_binary()
+        else:
+            payload = frame.as_json()
+        encoded = time.perf_counter()
+        if isinstance(payload, str):
+            await self.websocket.send_text(payload)
+        else:
+            await self.websocket.send_bytes(payload)
+        if self.metrics:
+            self.metrics.encode_seconds.observe(encoded - started)
+            self.metrics.send_seconds.observe(time.perf_counter() - encoded)
+        return len(payload)
+
+    def record_rtt(self, rtt_ms: float):
+        """Fold a client-measured round trip time into the estimate"""
+        self.rtt_ms = _ewma(self.rtt_ms, float(rtt_ms))
+
+    def estimated_latency_ms(self) -> float:
+        """Capture-to-display latency estimate for this viewer"""
+        return self.latency_ms + self.rtt_ms / 2
+
+    async def _run(self, on_disconnect):
+        while True:
+            frame = await self.queue.get()
+            started = time.perf_counter()
+            try:
+                size = await self.send(frame)
+            except Exception:
+                asyncio.create_task(on_disconnect(self.websocket))
+                return
+            finished = time.perf_counter()
+            self.frames_sent += 1
+            self.bytes_sent += size
+            if self.metrics:
+                self.metrics.frames_sent += 1
+                self.metrics.bytes_sent += size
+            self.latency_ms = _ewma(self.latency_ms, (finished - frame.received_at) * 1000)
+            self.throughput_bps = _ewma(self.throughput_bps, size / max(finished - started, 1e-6))
+
+    def stats(self) -> dict:
+        """Per-viewer counters for the sessions listing"""
+        return {
+            'transport': 'delta' if self.encoder else 'binary' if self.binary else 'json',
+            'layer': self.layer,
+            'codec': self.codec,
+            'visibility': self.visibility,
+            'framesSent': self.frames_sent,
+            'framesDropped': self.frames_dropped,
+            'queueDepth': self.queue.qsize(),
+            'bytesSent': self.bytes_sent,
+            'latencyMs': round(self.latency_ms, 1),
+            'rttMs': round(self.rtt_ms, 1),
+            'throughputKbps': round(self.throughput_bps * 8 / 1000, 1)
+        }
+
+
+def _ewma(previous: float, value: float, alpha: float = 0.2) -> float:
+    """Exponentially weighted moving average seeded by the first sample"""
+    return value if previous == 0 else previous + alpha * (value - previous)
@@ -0,0 +1,122 @@
+"""
+Tests for tile-based delta encoding: a viewer applying the messages sees the frames
+"""
+import base64
+import io
+
+import numpy as np
+from PIL import Image
+
+from frame_delta import TILE_COUNT, TILE_HEADER, TileDeltaEncoder
+from screencast_frame import FRAME_HEADER, FRAME_KIND_DELTA, FRAME_KIND_JPEG, ScreencastFrame
+
+WIDTH, HEIGHT = 320, 192
+
+
+def make_frame(pixels: np.ndarray, number: int) -> ScreencastFrame:
+    buffer = io.BytesIO()
+    Image.fromarray(pixels).save(buffer, format='JPEG', quality=95)
+    return ScreencastFrame('test', number, {
+        'data': base64.b64encode(buffer.getvalue()).decode('ascii'),
+        'metadata': {'timestamp': 1.0, 'deviceWidth': WIDTH, 'deviceHeight': HEIGHT}
+    })
+
+
+def decode_jpeg(data: bytes) -> np.ndarray:
+    with Image.open(io.BytesIO(data)) as image:
+        return np.asarray(image.convert('RGB'))
+
+
+def apply_message(canvas, message: bytes):
+    """What a viewer does with a message: returns the canvas it now shows and the message kind"""
+    _, kind, _, _, width, height = FRAME_HEADER.unpack_from(message)
+    payload = message[FRAME_HEADER.size:]
+    if kind == FRAME_KIND_JPEG:
+        canvas = decode_jpeg(payload).copy()
+        assert canvas.shape == (height, width, 3)
+        return canvas, kind
+    assert kind == FRAME_KIND_DELTA
+    count, = TILE_COUNT.unpack_from(payload)
+    position = TILE_COUNT.size
+    for _ in range(count):
+        x, y, w, h, length = TILE_HEADER.unpack_from(payload, position)
+        position += TILE_HEADER.size
+        canvas[y:y + h, x:x + w] = decode_jpeg(payload[position:position + length])
+        position += length
+    assert position == len(payload)
+    return canvas, kind
+
+
+def page() -> np.ndarray:
+    pixels = np.full((HEIGHT, WIDTH, 3), 240, dtype=np.uint8)
+    pixels[20:40, 20:200] = 30
+    return pixels
+
+
+def assert_close(shown: np.ndarray, expected: np.ndarray):
+    # JPEG is lossy; a tile left unsent would be off by far more
+    assert np.abs(shown.astype(int) - expected.astype(int)).mean() < 3
+
+
+def test_first_frame_is_a_keyframe_with_the_image_size():
+    encoder = TileDeltaEncoder(tile_size=32)
+    message = encoder.encode(make_frame(page(), 0))
+    _, kind, number, _, width, height = FRAME_HEADER.unpack_from(message)
+    assert (kind, number, width, height) == (FRAME_KIND_JPEG, 0, WIDTH, HEIGHT)
+    assert encoder.keyframes == 1
+
+
+def test_deltas_round_trip_to_the_current_frame():
+    encoder = TileDeltaEncoder(tile_size=32)
+    pixels = page()
+    canvas, _ = apply_message(None, encoder.encode(make_frame(pixels, 0)))
+    for number in range(1, 6):
+        pixels = pixels.copy()
+        pixels[100:120, 30 * number:30 * number + 40] = 0  # A small moving block
+        message = encoder.encode(make_frame(pixels, number))
+        canvas, kind = apply_message(canvas, message)
+        assert kind == FRAME_KIND_DELTA
+        assert_close(canvas, pixels)
+    assert encoder.deltas == 5
+
+
+def test_delta_only_carries_changed_tiles():
+    encoder = TileDeltaEncoder(tile_size=32)
+    pixels = page()
+    keyframe = encoder.encode(make_frame(pixels, 0))
+    changed = pixels.copy()
+    changed[70:80, 70:80] = 0  # Inside one tile
+    delta = encoder.encode(make_frame(changed, 1))
+    payload = delta[FRAME_HEADER.size:]
+    assert TILE_COUNT.unpack_from(payload) == (1,)
+    assert TILE_HEADER.unpack_from(payload, TILE_COUNT.size)[:4] == (64, 64, 32, 32)
+    assert len(delta) < len(keyframe)
+
+
+def test_unchanged_frame_sends_no_tiles():
+    encoder = TileDeltaEncoder(tile_size=32)
+    encoder.encode(make_frame(page(), 0))
+    delta = encoder.encode(make_frame(page(), 1))
+    assert TILE_COUNT.unpack_from(delta, FRAME_HEADER.size) == (0,)
+
+
+def test_keyframe_when_most_tiles_change_or_on_request():
+    encoder = TileDeltaEncoder(tile_size=32)
+    pixels = page()
+    encoder.encode(make_frame(pixels, 0))
+    inverted = 255 - pixels
+    assert FRAME_HEADER.unpack_from(encoder.encode(make_frame(inverted, 1)))[1] == FRAME_KIND_JPEG
+    encoder.force_keyframe()
+    assert FRAME_HEADER.unpack_from(encoder.encode(make_frame(inverted, 2)))[1] == FRAME_KIND_JPEG
+    assert FRAME_HEADER.unpack_from(encoder.encode(make_frame(inverted, 3)))[1] == FRAME_KIND_DELTA
+    assert encoder.keyframes == 3
+
+
+def test_keyframe_when_the_frame_size_changes():
+    encoder = TileDeltaEncoder(tile_size=32)
+    encoder.encode(make_frame(page(), 0))
+    smaller = page()[:96, :160]
+    message = encoder.encode(make_frame(smaller, 1))
+    canvas, kind = apply_message(None, message)
+    assert kind == FRAME_KIND_JPEG
+    assert canvas.shape == smaller.shape
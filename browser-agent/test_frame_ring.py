@@ -0,0 +1,94 @@
+"""
+Tests for the shared-memory frame ring and its seqlock
+"""
+import os
+import uuid
+
+import pytest
+
+from frame_ring import RING_HEADER, SEQUENCE, SLOT_HEADER, FrameRing
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRing.create(f"test-ring-{os.getpid()}-{uuid.uuid4().hex[:8]}", slots=4, slot_size=64)
+    yield ring
+    ring.close()
+
+
+def slot_offset(ring: FrameRing, sequence: int) -> int:
+    return RING_HEADER.size + (sequence - 1) % ring.slots * ring.stride
+
+
+def test_empty_ring_has_no_frame(ring):
+    assert ring.sequence == 0
+    assert ring.read() is None
+    assert ring.read_latest() is None
+
+
+def test_reader_in_another_attachment_sees_written_frames(ring):
+    reader = FrameRing.attach(ring.name)
+    try:
+        assert ring.write(b'first') == 1
+        assert ring.write(b'second') == 2
+        assert reader.sequence == 2
+        assert reader.read_latest() == (2, b'second')
+        assert reader.read(1) == (1, b'first')
+    finally:
+        reader.close()
+
+
+def test_overwritten_frame_is_not_returned(ring):
+    for n in range(1, 6):
+        ring.write(f'frame {n}'.encode())
+    # Frame 1 lived in the slot frame 5 now occupies
+    assert ring.read(1) is None
+    assert ring.read(5) == (5, b'frame 5')
+    assert ring.read(2) == (2, b'frame 2')
+
+
+def test_frame_being_rewritten_is_not_returned(ring):
+    ring.write(b'stable')
+    # What the writer does first: zero the slot's sequence before copying
+    SEQUENCE.pack_into(ring.memory.buf, slot_offset(ring, 1), 0)
+    assert ring.read(1) is None
+
+
+def test_frame_overwritten_during_the_copy_is_not_returned(ring, monkeypatch):
+    ring.write(b'old')
+    offset = slot_offset(ring, 1)
+    real_unpack = SEQUENCE.unpack_from
+    calls = []
+
+    class Racing:
+        """The writer laps the reader between its header read and its recheck"""
+        size = SEQUENCE.size
+
+        @staticmethod
+        def unpack_from(buf, position=0):
+            if position == offset:
+                calls.append(position)
+                SLOT_HEADER.pack_into(ring.memory.buf, offset, 1 + ring.slots, 3)
+            return real_unpack(buf, position)
+
+    monkeypatch.setattr('frame_ring.SEQUENCE', Racing)
+    assert ring.read(1) is None
+    assert calls
+
+
+def test_oversized_frame_is_skipped(ring):
+    ring.write(b'fits')
+    assert ring.write(b'x' * 65) == 0
+    assert ring.skipped == 1
+    assert ring.read_latest() == (1, b'fits')
+
+
+def test_attach_rejects_memory_that_is_not_a_ring():
+    from multiprocessing import shared_memory
+    memory = shared_memory.SharedMemory(name=f"test-not-ring-{uuid.uuid4().hex[:8]}", create=True, size=64)
+    try:
+        with pytest.raises(ValueError):
+            FrameRing.attach(memory.name)
+    finally:
+        memory.close()
+        memory.unlink()
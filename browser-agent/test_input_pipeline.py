@@ -0,0 +1,229 @@
+"""
+Tests for the input pipeline: coalescing, ordering, malformed events and acks
+"""
+import asyncio
+
+from input_pipeline import InputPipeline, interaction_action, is_named_key
+
+
+class FakeMouse:
+    def __init__(self, calls: list):
+        self.calls = calls
+
+    async def wheel(self, delta_x, delta_y):
+        self.calls.append(('wheel', delta_x, delta_y))
+
+    async def move(self, x, y):
+        self.calls.append(('move', x, y))
+
+    async def click(self, x, y):
+        self.calls.append(('click', x, y))
+
+
+class FakeKeyboard:
+    def __init__(self, calls: list):
+        self.calls = calls
+
+    async def press(self, key):
+        self.calls.append(('press', key))
+
+
+class FakePage:
+    def __init__(self):
+        self.calls = []
+        self.mouse = FakeMouse(self.calls)
+        self.keyboard = FakeKeyboard(self.calls)
+
+    async def goto(self, url):
+        self.calls.append(('goto', url))
+
+
+class FakeCDP:
+    def __init__(self, calls: list):
+        self.calls = calls
+
+    async def send(self, method, params=None):
+        self.calls.append((method, params))
+
+
+def make_pipeline() -> InputPipeline:
+    page = FakePage()
+    return InputPipeline(page, FakeCDP(page.calls))
+
+
+def run(pipeline: InputPipeline, commands: list) -> list:
+    async def submit_all():
+        for command in commands:
+            await pipeline.submit(command)
+        await pipeline.flush()
+        pipeline.close()
+    asyncio.run(submit_all())
+    return pipeline.page.calls
+
+
+def test_interaction_action_from_fields():
+    assert interaction_action({'type': 'interaction', 'url': 'https://example.com'}) == 'navigate'
+    assert interaction_action({'type': 'interaction', 'deltaY': 10}) == 'scroll'
+    assert interaction_action({'type': 'interaction', 'x': 1, 'y': 2}) == 'click'
+    assert interaction_action({'type': 'interaction', 'text': 'a'}) == 'type'
+    assert interaction_action({'type': 'interaction'}) is None
+
+
+def test_scroll_burst_becomes_one_wheel():
+    calls = run(make_pipeline(), [{'type': 'scroll', 'deltaY': 10, 'deltaX': 1}] * 12)
+    assert calls == [('wheel', 12.0, 120.0)]
+
+
+def test_moves_keep_only_the_latest_position():
+    calls = run(make_pipeline(), [{'type': 'move', 'x': n, 'y': n} for n in range(5)])
+    assert calls == [('move', 4, 4)]
+
+
+def test_typed_text_is_inserted_in_bulk():
+    pipeline = make_pipeline()
+    calls = run(pipeline, [{'type': 'interaction', 'text': c} for c in 'hello'])
+    assert calls == [('Input.insertText', {'text': 'hello'})]
+    assert (pipeline.events, pipeline.dispatches) == (5, 1)
+
+
+def test_named_keys_are_pressed_and_other_text_inserted():
+    calls = run(make_pipeline(), [
+        {'type': 'interaction', 'text': 'pasted text'},
+        {'type': 'interaction', 'text': 'Enter'},
+        {'type': 'interaction', 'text': 'Control+a'},
+    ])
+    assert calls == [('Input.insertText', {'text': 'pasted text'}), ('press', 'Enter'), ('press', 'Control+a')]
+    assert is_named_key('ArrowUp') and is_named_key('F5') and is_named_key('Shift+Tab')
+    assert not is_named_key('a') and not is_named_key('Enterprise') and not is_named_key('a+b')
+
+
+def test_discrete_actions_flush_pending_input_in_order():
+    calls = run(make_pipeline(), [
+        {'type': 'scroll', 'deltaY': 100},
+        {'type': 'scroll', 'deltaY': 200},
+        {'type': 'click', 'x': 5, 'y': 6},
+        {'type': 'move', 'x': 1, 'y': 1},
+        {'type': 'type', 'text': 'ab'},
+        {'type': 'navigate', 'url': 'https://example.com'},
+    ])
+    assert calls == [
+        ('wheel', 0.0, 300.0),
+        ('click', 5, 6),
+        ('move', 1, 1),
+        ('Input.insertText', {'text': 'ab'}),
+        ('goto', 'https://example.com'),
+    ]
+
+
+def test_malformed_events_are_dropped():
+    pipeline = make_pipeline()
+    calls = run(pipeline, [
+        {'type': 'click', 'x': 1},
+        {'type': 'move'},
+        {'type': 'type', 'text': 5},
+        {'type': 'scroll', 'deltaY': 'far'},
+        {'type': 'click', 'x': 1, 'y': 2},
+    ])
+    assert calls == [('click', 1, 2)]
+    assert pipeline.events == 1
+
+
+def test_coalesced_input_is_flushed_after_a_frame():
+    pipeline = make_pipeline()
+
+    async def scenario():
+        await pipeline.submit({'type': 'scroll', 'deltaY': 50})
+        assert pipeline.page.calls == []
+        await asyncio.sleep(pipeline.FRAME_INTERVAL * 3)
+        pipeline.close()
+    asyncio.run(scenario())
+    assert pipeline.page.calls == [('wheel', 0.0, 50.0)]
+
+
+def run_queued(pipeline: InputPipeline, batches: list, wait: float = 0.1) -> dict:
+    """Enqueue commands per viewer and collect the acks each viewer gets"""
+    replies = {}
+
+    async def scenario():
+        for viewer, commands in batches:
+            async def reply(message, viewer=viewer):
+                replies.setdefault(viewer, []).append(message)
+            for command in commands:
+                assert pipeline.enqueue(command, reply)
+        await asyncio.sleep(wait)
+        pipeline.close()
+    asyncio.run(scenario())
+    return replies
+
+
+def test_queued_commands_are_acked_in_one_batch():
+    pipeline = make_pipeline()
+    replies = run_queued(pipeline, [('a', [
+        {'type': 'scroll', 'deltaY': 10, 'seq': 1},
+        {'type': 'scroll', 'deltaY': 10, 'seq': 2},
+        {'type': 'click', 'x': 1, 'y': 1, 'seq': 3},
+    ])])
+    assert pipeline.page.calls == [('wheel', 0.0, 20.0), ('click', 1, 1)]
+    [ack] = replies['a']
+    assert (ack['type'], ack['seq'], ack['count']) == ('ack', 3, 3)
+    assert ack['appliedMs'] >= ack['queuedMs'] >= 0
+    assert pipeline.acks_sent == 1
+
+
+def test_acks_go_to_the_viewer_that_sent_the_command():
+    replies = run_queued(make_pipeline(), [
+        ('a', [{'type': 'click', 'x': 1, 'y': 1, 'seq': 7}]),
+        ('b', [{'type': 'click', 'x': 2, 'y': 2, 'seq': 1}, {'type': 'click', 'x': 3, 'y': 3, 'seq': 2}]),
+    ])
+    assert [(ack['seq'], ack['count']) for ack in replies['a']] == [(7, 1)]
+    assert [(ack['seq'], ack['count']) for ack in replies['b']] == [(2, 2)]
+
+
+def test_unsequenced_commands_are_not_acked():
+    pipeline = make_pipeline()
+    replies = run_queued(pipeline, [('a', [{'type': 'click', 'x': 1, 'y': 1}])])
+    assert pipeline.page.calls == [('click', 1, 1)]
+    assert replies == {}
+
+
+def test_dropped_and_unknown_commands_are_still_acked():
+    replies = run_queued(make_pipeline(), [('a', [
+        {'type': 'click', 'x': 1, 'seq': 1},
+        {'type': 'interaction', 'seq': 2},
+    ])])
+    assert [(ack['seq'], ack['count']) for ack in replies['a']] == [(2, 2)]
+
+
+def test_forgotten_viewer_gets_no_acks():
+    pipeline = make_pipeline()
+    replies = []
+
+    async def reply(message):
+        replies.append(message)
+
+    async def scenario():
+        pipeline.enqueue({'type': 'click', 'x': 1, 'y': 1, 'seq': 1}, reply)
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        pipeline.forget(reply)
+        await asyncio.sleep(pipeline.ACK_INTERVAL * 3)
+        pipeline.close()
+    asyncio.run(scenario())
+    assert pipeline.page.calls == [('click', 1, 1)]
+    assert replies == []
+
+
+def test_full_queue_rejects_commands():
+    pipeline = make_pipeline()
+
+    async def reply(message):
+        pass
+
+    async def scenario():
+        accepted = [pipeline.enqueue({'type': 'click', 'x': 1, 'y': 1}, reply)
+                    for _ in range(pipeline.QUEUE_LIMIT + 1)]
+        pipeline.close()
+        return accepted
+    accepted = asyncio.run(scenario())
+    assert accepted.count(True) == pipeline.QUEUE_LIMIT
+    assert accepted[-1] is False
@@ -0,0 +1,147 @@
+"""
+Tests for the research cache: single-flight runs, TTL, LRU bound and failures
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import research_cache
+from research_cache import ResearchCache, normalize_query
+
+
+class Runner:
+    """A research run that counts its calls and waits until released"""
+
+    def __init__(self, result=None, error: Exception = None):
+        self.calls = 0
+        self.result = result or {'answer': 42}
+        self.error = error
+        self.release = asyncio.Event()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.release.wait()
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def test_key_ignores_case_and_whitespace():
+    cache = ResearchCache()
+    assert normalize_query('  What IS\tthe  weather ') == 'what is the weather'
+    assert cache.key('Weather  today', 'claude', None) == cache.key('weather today', 'claude', None)
+    assert cache.key('weather', 'claude', None) != cache.key('weather', 'gpt', None)
+
+
+def test_concurrent_identical_requests_share_one_run():
+    async def scenario():
+        cache = ResearchCache()
+        run = Runner()
+        key = cache.key('query', None, None)
+        requests = [asyncio.create_task(cache.get_or_run(key, run)) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert cache.serves(key)
+        run.release.set()
+        results = await asyncio.gather(*requests)
+        assert run.calls == 1
+        assert [shared for _, shared in results] == [False, True, True, True, True]
+        assert all(result is run.result for result, _ in results)
+        assert (cache.misses, cache.coalesced) == (1, 4)
+    asyncio.run(scenario())
+
+
+def test_finished_results_are_served_until_the_ttl(monkeypatch):
+    async def scenario():
+        clock = [100.0]
+        monkeypatch.setattr(research_cache, 'time', SimpleNamespace(monotonic=lambda: clock[0]))
+        cache = ResearchCache(ttl=60)
+        run = Runner()
+        run.release.set()
+        key = cache.key('query', None, None)
+        assert await cache.get_or_run(key, run) == (run.result, False)
+        assert await cache.get_or_run(key, run) == (run.result, True)
+        clock[0] += 61
+        assert not cache.serves(key)
+        assert await cache.get_or_run(key, run) == (run.result, False)
+        assert (run.calls, cache.hits) == (2, 1)
+    asyncio.run(scenario())
+
+
+def test_refresh_runs_again_and_replaces_the_result():
+    async def scenario():
+        cache = ResearchCache()
+        key = cache.key('query', None, None)
+        first, second = Runner({'answer': 1}), Runner({'answer': 2})
+        first.release.set()
+        second.release.set()
+        await cache.get_or_run(key, first)
+        assert await cache.get_or_run(key, second, refresh=True) == ({'answer': 2}, False)
+        assert await cache.get_or_run(key, first) == ({'answer': 2}, True)
+    asyncio.run(scenario())
+
+
+def test_failed_runs_reach_every_waiter_and_are_not_cached():
+    async def scenario():
+        cache = ResearchCache()
+        key = cache.key('query', None, None)
+        failing = Runner(error=RuntimeError('browser crashed'))
+        requests = [asyncio.create_task(cache.get_or_run(key, failing)) for _ in range(3)]
+        await asyncio.sleep(0)
+        failing.release.set()
+        results = await asyncio.gather(*requests, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert not cache.serves(key)
+        retry = Runner()
+        retry.release.set()
+        assert await cache.get_or_run(key, retry) == (retry.result, False)
+    asyncio.run(scenario())
+
+
+def test_a_cancelled_requester_does_not_cancel_the_run():
+    async def scenario():
+        cache = ResearchCache()
+        key = cache.key('query', None, None)
+        run = Runner()
+        leaving = asyncio.create_task(cache.get_or_run(key, run))
+        staying = asyncio.create_task(cache.get_or_run(key, run))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leaving
+        run.release.set()
+        assert await staying == (run.result, True)
+        assert run.calls == 1
+    asyncio.run(scenario())
+
+
+def test_least_recently_used_entries_are_evicted():
+    async def scenario():
+        cache = ResearchCache(max_entries=2)
+        keys = [cache.key(f'query {n}', None, None) for n in range(3)]
+        for key in keys[:2]:
+            run = Runner()
+            run.release.set()
+            await cache.get_or_run(key, run)
+        await cache.get_or_run(keys[0], Runner())  # A hit; makes query 1 the oldest
+        run = Runner()
+        run.release.set()
+        await cache.get_or_run(keys[2], run)
+        assert [cache.serves(key) for key in keys] == [True, False, True]
+    asyncio.run(scenario())
+
+
+def test_start_settles_sharing_before_the_run_finishes():
+    async def scenario():
+        cache = ResearchCache()
+        key = cache.key('query', None, None)
+        run = Runner()
+        first, first_shared = cache.start(key, run)
+        second, second_shared = cache.start(key, run)
+        assert (first_shared, second_shared) == (False, True)
+        run.release.set()
+        assert await first is await second is run.result
+        third, third_shared = cache.start(key, run)
+        assert third_shared and third.done()
+        assert run.calls == 1
+    asyncio.run(scenario())
@@ -0,0 +1,154 @@
+"""
+Tests for research event logs: offsets, resuming after an offset, recovery and restarts
+"""
+import asyncio
+import os
+
+from research_events import EventBus, resume_offset
+from research_log import EventLog, _segment_path, _segments
+
+
+async def drain(subscription) -> list:
+    return [(offset, event['n']) async for offset, event in subscription]
+
+
+async def wait_durable(log: EventLog):
+    while log.durable_offset < log.next_offset:
+        await asyncio.sleep(0.01)
+
+
+def test_offsets_count_from_zero_and_since_returns_the_rest():
+    async def scenario():
+        log = EventLog(None, tail_events=100)
+        assert [log.append({'n': n}) for n in range(5)] == [0, 1, 2, 3, 4]
+        disk, tail = log.since(2)
+        assert disk is None
+        assert [offset for offset, _ in tail] == [3, 4]
+        assert log.since(4) == (None, [])
+    asyncio.run(scenario())
+
+
+def test_old_offsets_are_read_back_from_disk(tmp_path):
+    async def scenario():
+        log = EventLog(str(tmp_path), tail_events=3, segment_bytes=64, flush_interval=0.01)
+        for n in range(20):
+            log.append({'n': n})
+        await wait_durable(log)
+        log.append({'n': 20})  # Trims the tail now that everything before it is on disk
+        disk, tail = log.since(4)
+        assert disk == (5, tail[0][0])
+        events = log.read(*disk) + tail
+        assert [offset for offset, _ in events] == list(range(5, 21))
+        assert [event['n'] for _, event in events] == list(range(5, 21))
+        assert len(_segments(str(tmp_path))) > 1
+        log.close()
+        await wait_durable(log)
+    asyncio.run(scenario())
+
+
+def test_restarted_log_continues_offsets_and_drops_a_torn_record(tmp_path):
+    async def scenario():
+        log = EventLog(str(tmp_path), flush_interval=0.01)
+        for n in range(3):
+            log.append({'n': n})
+        log.close()
+        await wait_durable(log)
+        while log._writer is not None:
+            await asyncio.sleep(0.01)
+    asyncio.run(scenario())
+
+    last = _segment_path(str(tmp_path), _segments(str(tmp_path))[-1])
+    size = os.path.getsize(last)
+    with open(last, 'ab') as f:
+        f.write(b'\x00\x00\x00\x40{"n": ')  # A crash in the middle of a write
+    restarted = EventLog(str(tmp_path))
+    assert restarted.next_offset == 3
+    assert os.path.getsize(last) == size
+    assert [event['n'] for _, event in restarted.read(0, 3)] == [0, 1, 2]
+
+
+def test_subscriber_resumes_after_its_last_offset():
+    async def scenario():
+        bus = EventBus()
+        channel = bus.channel('session-1')
+        for n in range(5):
+            channel.publish({'n': n})
+        resumed = channel.subscribe(2)
+        live = channel.subscribe(None)
+        channel.publish({'n': 5})
+        bus.close('session-1')
+        assert await drain(resumed) == [(3, 3), (4, 4), (5, 5)]
+        assert await drain(live) == [(5, 5)]
+    asyncio.run(scenario())
+
+
+def test_closed_session_replays_from_disk_after_a_restart(tmp_path):
+    async def publish():
+        bus = EventBus(str(tmp_path))
+        channel = bus.channel('session-1')
+        for n in range(10):
+            channel.publish({'n': n})
+        bus.close('session-1')
+        await wait_durable(channel.log)
+        while channel.log._writer is not None:
+            await asyncio.sleep(0.01)
+    asyncio.run(publish())
+
+    async def resume():
+        bus = EventBus(str(tmp_path))
+        channel = bus.get('session-1')
+        assert channel.closed
+        assert await drain(channel.subscribe(6)) == [(7, 7), (8, 8), (9, 9)]
+        # A session run again under the same id continues its offsets
+        assert bus.channel('session-1').publish({'n': 10}) == 10
+    asyncio.run(resume())
+
+
+def test_reopened_session_keeps_offsets_in_order(tmp_path):
+    async def scenario():
+        bus = EventBus(str(tmp_path), closed_limit=0)
+        for run in range(3):
+            channel = bus.channel('session-1')
+            for n in range(5):
+                channel.publish({'n': run * 5 + n})
+            bus.close('session-1')
+        log = bus._log('session-1')
+        await wait_durable(log)
+        assert [(offset, event['n']) for offset, event in log.read(0, 15)] == [(n, n) for n in range(15)]
+    asyncio.run(scenario())
+
+
+def test_resume_offset_parsing():
+    assert resume_offset('41') == 41
+    assert resume_offset(None) == -1
+    assert resume_offset('abc') == -1
+    assert resume_offset('-7') == -1
+
+
+def test_failed_write_keeps_durable_offset_and_reports_trimmed_events_as_a_gap(tmp_path):
+    async def scenario():
+        log = EventLog(str(tmp_path), tail_events=3, flush_interval=0.01)
+        for n in range(2):
+            log.append({'n': n})
+        await wait_durable(log)
+
+        def fail(batch):
+            raise OSError('disk full')
+        log._write = fail
+        for n in range(2, 4):
+            log.append({'n': n})
+        while not log.write_failed:
+            await asyncio.sleep(0.01)
+        assert log.durable_offset == 2
+        for n in range(4, 10):
+            log.append({'n': n})
+        assert [offset for offset, _ in log.tail] == [7, 8, 9]  # Still bounded
+
+        disk, tail = log.since(-1)
+        assert disk == (0, 2)
+        assert tail[0] == (6, {'type': 'gap', 'first': 2, 'end': 7})
+        events = log.read(*disk) + tail[1:]
+        assert [event['n'] for _, event in events] == [0, 1, 7, 8, 9]
+        assert log.since(7) == (None, [(8, {'n': 8}), (9, {'n': 9})])
+        log.close()
+    asyncio.run(scenario())
@@ -0,0 +1,102 @@
+"""
+Tests for session recordings: record and replay, segment rollover and retention
+"""
+import asyncio
+import base64
+import io
+import os
+
+from PIL import Image
+
+from screencast_frame import ScreencastFrame
+from session_recorder import RecordingStore, SessionRecorder, _segments
+
+
+def make_frame(number: int, timestamp: float, width: int = 64) -> ScreencastFrame:
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, 32), (number * 40 % 256, 0, 0)).save(buffer, format='JPEG')
+    return ScreencastFrame('test', number, {
+        'data': base64.b64encode(buffer.getvalue()).decode('ascii'),
+        'metadata': {'timestamp': timestamp}
+    })
+
+
+async def record(recorder: SessionRecorder, frames: list):
+    """Append frames and wait until they are on disk"""
+    written = recorder.frames + len(frames)
+    for frame in frames:
+        recorder.append(frame)
+    while recorder.frames < written:
+        await asyncio.sleep(0.01)
+
+
+def test_recorded_frames_replay_from_any_timestamp(tmp_path):
+    frames = [make_frame(n, 100.0 + n, width=64 + n) for n in range(5)]
+
+    async def scenario():
+        recorder = SessionRecorder(str(tmp_path / 'session-1'), flush_bytes=0, flush_interval=0.01)
+        recorder.start()
+        await record(recorder, frames)
+        await recorder.close()
+    asyncio.run(scenario())
+
+    store = RecordingStore(str(tmp_path))
+    reader = store.open('session-1')
+    try:
+        assert (len(reader), reader.start, reader.end) == (5, 100.0, 104.0)
+        replayed = list(reader.frames(102.5))
+        assert [(timestamp, width, height) for timestamp, width, height, _ in replayed] == [
+            (102.0, 66, 32), (103.0, 67, 32), (104.0, 68, 32)]
+        assert [bytes(jpeg) for *_, jpeg in replayed] == [frame.jpeg for frame in frames[2:]]
+        assert reader.frame(reader.seek(50.0))[0] == 100.0  # Before the start: the first frame
+    finally:
+        reader.close()
+    assert store.frame_at('session-1')[0] == 104.0
+
+
+def test_full_segments_roll_over_and_replay_in_order(tmp_path):
+    frames = [make_frame(n, 1.0 + n) for n in range(12)]
+    segment_bytes = len(frames[0].jpeg) * 3
+
+    async def scenario():
+        recorder = SessionRecorder(str(tmp_path / 'session-1'), segment_bytes=segment_bytes,
+                                   flush_bytes=0, flush_interval=0.01)
+        recorder.start()
+        await record(recorder, frames[:5])
+        reader = RecordingStore(str(tmp_path)).open('session-1')
+        await record(recorder, frames[5:])
+        reader.refresh()  # Picks up frames appended since it was opened
+        assert len(reader) == 12
+        assert [timestamp for timestamp, *_ in reader.frames(0.0)] == [1.0 + n for n in range(12)]
+        reader.close()
+        await recorder.close()
+    asyncio.run(scenario())
+    assert len(_segments(str(tmp_path / 'session-1'))) >= 4
+
+
+def test_prune_never_deletes_the_segment_being_written(tmp_path):
+    async def scenario():
+        store = RecordingStore(str(tmp_path), segment_bytes=1, max_bytes=1)
+        finished = store.recorder('finished')
+        finished.flush_bytes = 0
+        await record(finished, [make_frame(n, 1.0 + n) for n in range(2)])
+        await store.stop('finished', finished)
+
+        live = store.recorder('live')
+        live.flush_bytes = 0
+        await record(live, [make_frame(n, 10.0 + n) for n in range(3)])
+        active = store.active_segments()
+        assert active == {live.directory: live.active_segment}
+
+        # A rollover after the active segments were read is kept as well
+        await record(live, [make_frame(3, 13.0)])
+        assert live.active_segment > active[live.directory]
+        removed = await asyncio.to_thread(store.prune, active)
+        assert removed == 4
+        assert not os.path.exists(tmp_path / 'finished')
+        assert _segments(live.directory) == [active[live.directory], live.active_segment]
+        reader = store.open('live')
+        assert [timestamp for timestamp, *_ in reader.frames(0.0)] == [12.0, 13.0]
+        reader.close()
+        await store.stop('live', live)
+    asyncio.run(scenario())
@@ -0,0 +1,138 @@
+"""
+Tests for the research session registry: cursor pagination, TTL and size bounds, spilled results
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+import session_registry
+from session_registry import SessionRegistry
+
+START = datetime(2026, 1, 1, 12, 0, 0)
+
+
+class Session:
+    def __init__(self, session_id: str, minute: int, status: str = 'running', result=None):
+        self.sessionId = session_id
+        self.startedAt = START + timedelta(minutes=minute)
+        self.status = status
+        self.result = result
+
+
+def make_registry(count: int, **options) -> SessionRegistry:
+    registry = SessionRegistry(ttl=0, **options)
+    for n in range(count):
+        registry.add(Session(f'session-{n:02d}', n, 'completed' if n % 2 else 'running'))
+    return registry
+
+
+def pages(registry: SessionRegistry, **filters) -> list:
+    """Every page of a listing, following the cursors"""
+    result = []
+    cursor = None
+    while True:
+        sessions, cursor = registry.list(cursor=cursor, **filters)
+        result.append([session.sessionId for session in sessions])
+        if cursor is None:
+            return result
+
+
+def test_pages_are_newest_first_and_cover_every_session_once():
+    registry = make_registry(10)
+    listed = pages(registry, limit=4)
+    assert [len(page) for page in listed] == [4, 4, 2]
+    ids = [session_id for page in listed for session_id in page]
+    assert ids == [f'session-{n:02d}' for n in range(9, -1, -1)]
+
+
+def test_pagination_is_stable_while_sessions_are_added():
+    registry = make_registry(6)
+    first, cursor = registry.list(limit=3)
+    registry.add(Session('session-new', 100))
+    second, cursor = registry.list(limit=3, cursor=cursor)
+    assert [session.sessionId for session in first + second] == [f'session-{n:02d}' for n in range(5, -1, -1)]
+    assert cursor is None
+
+
+def test_sessions_with_the_same_start_time_are_not_skipped():
+    registry = SessionRegistry(ttl=0)
+    for n in range(5):
+        registry.add(Session(f'session-{n}', 0))
+    assert sorted(session_id for page in pages(registry, limit=2) for session_id in page) == [
+        f'session-{n}' for n in range(5)]
+
+
+def test_filter_by_status_and_time_range():
+    registry = make_registry(10)
+    completed = [session_id for page in pages(registry, status='completed', limit=2) for session_id in page]
+    assert completed == ['session-09', 'session-07', 'session-05', 'session-03', 'session-01']
+    window, _ = registry.list(since=START + timedelta(minutes=3), until=START + timedelta(minutes=5))
+    assert [session.sessionId for session in window] == ['session-05', 'session-04', 'session-03']
+    assert registry.list(status='error') == ([], None)
+
+
+def test_status_updates_move_sessions_between_indexes():
+    registry = make_registry(2)
+    session = registry.get('session-00')
+    registry.update(session, 'error', 'boom')
+    assert [s.sessionId for s in registry.list(status='error')[0]] == ['session-00']
+    assert registry.list(status='running')[0] == []
+    assert session.result == 'boom'
+
+
+def test_malformed_cursor_is_a_value_error():
+    with pytest.raises(ValueError):
+        make_registry(2).list(cursor='not-a-cursor')
+
+
+def test_finished_sessions_expire_after_the_ttl(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(session_registry.time, 'monotonic', lambda: clock[0])
+    registry = SessionRegistry(ttl=60)
+    registry.add(Session('running', 0))
+    done = Session('done', 1)
+    registry.add(done)
+    registry.update(done, 'completed', 'ok')
+    clock[0] += 30
+    assert registry.evict() == 0
+    clock[0] += 31
+    assert registry.evict() == 1
+    assert registry.get('done') is None
+    assert registry.get('running') is not None  # Running sessions never expire
+    assert registry.stats()['evicted'] == 1
+
+
+def test_oldest_finished_sessions_go_first_over_the_size_bound():
+    registry = SessionRegistry(ttl=0, max_sessions=3)
+    for n in range(3):
+        registry.add(Session(f'finished-{n}', n, 'completed'))
+    for n in range(3):
+        registry.add(Session(f'running-{n}', 10 + n))
+    assert sorted(registry.sessions) == ['running-0', 'running-1', 'running-2']
+
+
+def test_large_results_are_spilled_and_read_back(tmp_path):
+    async def scenario():
+        registry = SessionRegistry(result_dir=str(tmp_path), ttl=0, spill_bytes=16)
+        small = Session('small', 0)
+        large = Session('large', 1)
+        registry.add(small)
+        registry.add(large)
+        registry.update(small, 'completed', 'short')
+        registry.update(large, 'completed', 'x' * 100)
+        for _ in range(100):
+            if large.result is None:
+                break
+            await asyncio.sleep(0.01)
+        assert large.result is None
+        assert small.result == 'short'
+        assert await registry.result(large) == 'x' * 100
+        assert os.listdir(tmp_path) == ['large.result']
+        registry.ttl = 0.01
+        await asyncio.sleep(0.02)
+        assert registry.evict() == 2
+        await asyncio.sleep(0.1)  # Evicted results are removed in the background
+        assert os.listdir(tmp_path) == []
+    asyncio.run(scenario())
@@ -0,0 +1,88 @@
+"""
+Tests for SQLite session persistence: batched writes and recovery after a restart
+"""
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+from pydantic import BaseModel
+
+from session_registry import FINAL_STATUSES, SessionRegistry
+from session_store import INTERRUPTED, SessionStore
+
+
+class Record(BaseModel):
+    sessionId: str
+    status: str
+    startedAt: datetime
+    query: str = ''
+    result: Optional[str] = None
+
+
+def open_registry(path: str) -> SessionRegistry:
+    store = SessionStore(path, FINAL_STATUSES, flush_interval=0.01)
+    return SessionRegistry(ttl=3600, store=store, model=Record)
+
+
+def test_saves_are_batched_and_coalesced(tmp_path):
+    async def scenario():
+        store = SessionStore(str(tmp_path / 'sessions.db'), FINAL_STATUSES, flush_interval=0.05)
+        for status in ('pending', 'running', 'completed'):
+            store.save('session-1', status, 1.0, '{}', 'done' if status == 'completed' else None)
+        store.save('session-2', 'running', 2.0, '{}')
+        assert (await store.get('session-1'))[1] == 'completed'  # Served from the buffer
+        await store.flush()
+        assert (store.written, store.batches) == (2, 1)
+        assert await store.result('session-1') == 'done'
+        await store.close()
+    asyncio.run(scenario())
+
+
+def test_restart_restores_sessions_and_fails_interrupted_ones(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+
+    async def first_run():
+        registry = open_registry(path)
+        done = Record(sessionId='done', status='running', startedAt=datetime(2026, 1, 1), query='a')
+        running = Record(sessionId='running', status='running', startedAt=datetime(2026, 1, 2), query='b')
+        registry.add(done)
+        registry.add(running)
+        registry.update(done, 'completed', 'the answer')
+        await registry.store.close()  # The service stops with "running" unfinished
+    asyncio.run(first_run())
+
+    async def second_run():
+        registry = open_registry(path)
+        await registry.warm()
+        sessions, _ = registry.list()
+        assert [(s.sessionId, s.status, s.query) for s in sessions] == [
+            ('running', 'error', 'b'), ('done', 'completed', 'a')]
+        done = registry.get('done')
+        assert done.result is None  # Left in the store until asked for
+        assert await registry.result(done) == 'the answer'
+        assert await registry.result(registry.get('running')) == INTERRUPTED
+        await registry.store.close()
+    asyncio.run(second_run())
+
+
+def test_sessions_not_in_memory_are_loaded_on_demand(tmp_path):
+    path = str(tmp_path / 'sessions.db')
+
+    async def first_run():
+        registry = open_registry(path)
+        session = Record(sessionId='old', status='running', startedAt=datetime(2026, 1, 1))
+        registry.add(session)
+        registry.update(session, 'completed', 'kept')
+        await registry.store.close()
+    asyncio.run(first_run())
+
+    async def second_run():
+        registry = open_registry(path)  # Not warmed
+        assert registry.get('old') is None
+        session = await registry.load('old')
+        assert (session.sessionId, session.status) == ('old', 'completed')
+        assert await registry.result(session) == 'kept'
+        assert await registry.load('missing') is None
+        await registry.store.close()
+    asyncio.run(second_run())
+
@@ -28,6 +28,8 @@ import numpy as np
 from PIL import Image
 import io
 
+from json_codec import JSONCodecResponse, receive_json, send_json
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -315,7 +317,7 @@ async def lifespan(app: FastAPI):
     # Shutdown
     await vnc_service.cleanup()
 
-app = FastAPI(title="VNC Browser Service", lifespan=lifespan)
+app = FastAPI(title="VNC Browser Service", lifespan=lifespan, default_response_class=JSONCodecResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -361,7 +363,8 @@ async def get_browser_content(session_id: str):
     """Get current page content and interactive elements"""
     try:
         content = await vnc_service.get_page_content(session_id)
-        return content
+        # Returned as a response to skip jsonable_encoder on large pages
+        return JSONCodecResponse(content)
     except Exception as e:
         logger.error(f"Error getting content: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -385,13 +388,13 @@ async def vnc_websocket(websocket: WebSocket, session_id: str):
     
     session = vnc_service.sessions.get(session_id)
     if not session:
-        await websocket.send_json({"type": "error", "message": "Session not found"})
+        await send_json(websocket, {"type": "error", "message": "Session not found"})
         await websocket.close()
         return
         
     try:
         # Send initial connection info
-        await websocket.send_json({
+        await send_json(websocket, {
             "type": "connected",
             "session_id": session_id,
             "vnc_port": session.vnc_port,
@@ -400,18 +403,18 @@ async def vnc_websocket(websocket: WebSocket, session_id: str):
         
         # Handle incoming messages
         while True:
-            data = await websocket.receive_json()
+            data = await receive_json(websocket)
             
             if data.get("type") == "action":
                 action = BrowserAction(**data.get("action", {}))
                 result = await vnc_service.execute_action(session_id, action)
-                await websocket.send_json({
+                await send_json(websocket, {
                     "type": "action_result",
                     "result": result
                 })
             elif data.get("type") == "get_content":
                 content = await vnc_service.get_page_content(session_id)
-                await websocket.send_json({
+                await send_json(websocket, {
                     "type": "content",
                     "content": content
                 })
@@ -420,7 +423,7 @@ async def vnc_websocket(websocket: WebSocket, session_id: str):
         logger.info(f"WebSocket disconnected for session {session_id}")
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
-        await websocket.send_json({"type": "error", "message": str(e)})
+        await send_json(websocket, {"type": "error", "message": str(e)})
 
 @app.get("/api/vnc-browser/sessions")
 async def list_sessions():